@@ -0,0 +1,203 @@
+# benchmark_api.py
+"""Tải giả lập cho API headless (src/chat_api.py): requests/s, độ trễ và bộ nhớ mỗi worker theo số worker.
+
+Với mỗi giá trị `--workers`, script khởi động `python -m src.chat_api` (file lịch sử/cache câu trả lời tạm),
+chờ tới khi mọi worker trả lời /healthz, rồi chạy `--clients` tiến trình client với kết nối keep-alive
+trong `--duration` giây. Câu hỏi lấy từ data/benchmark/prompts.json (câu hỏi trực tiếp, tin nhắn cảm xúc
+và lượt chọn mức độ = input rồi answer).
+
+Bộ nhớ đọc từ /proc/<pid>/smaps_rollup: PSS chia đều phần dùng chung (index mmap, thư viện) cho các
+worker, nên tổng PSS tăng chậm hơn nhiều so với N x RSS nếu index thực sự được dùng chung.
+
+Chạy: python benchmark_api.py --workers 1 2 4 --clients 8 --duration 20 --stub-llm --stub-embeddings
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from src.chat_api import process_memory_mb
+from src.global_settings import BENCHMARK_CORPUS_FILE
+
+READY_TIMEOUT = 300
+
+
+def load_workload(prompts_file):
+    with open(prompts_file, "r", encoding="utf-8") as f:
+        prompts = json.load(f)
+    workload = [("input", text) for text in prompts["direct_queries"] + prompts["emotional_messages"]]
+    workload.extend(("answer", click) for click in prompts["answer_clicks"])
+    return workload
+
+
+def client_token(client_id):
+    return f"bench-token-{client_id}"
+
+
+def request(connection, method, path, body=None, token=None):
+    payload = json.dumps(body).encode("utf-8") if body is not None else None
+    headers = {"Content-Type": "application/json"} if payload else {}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    connection.request(method, path, body=payload, headers=headers)
+    response = connection.getresponse()
+    data = response.read()
+    return response.status, json.loads(data) if data else {}
+
+
+def run_client(client_id, port, workload, duration, results):
+    """Một client: gửi tuần tự các lượt trong workload tới khi hết `duration`, ghi (độ trễ, lỗi, số request)"""
+    rng = random.Random(client_id)
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+    token = client_token(client_id)
+    conversation_id = None
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        kind, item = rng.choice(workload)
+        steps = [("/v1/input", {"prompt": item if kind == "input" else item["prompt"]})]
+        if kind == "answer":
+            steps.append(("/v1/answer", {"prompt": item["prompt"], "answer": item["answer"]}))
+        question = emotion = None
+        for path, body in steps:
+            body = {"conversation_id": conversation_id, **body}
+            if path == "/v1/answer":
+                if not question:
+                    break
+                body["question"], body["emotion"] = question, emotion
+            start = time.perf_counter()
+            try:
+                status, data = request(connection, "POST", path, body, token)
+            except (OSError, http.client.HTTPException, ValueError):
+                errors += 1
+                connection.close()
+                connection = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+                break
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors += 1
+                break
+            conversation_id = data["conversation_id"]
+            question, emotion = data.get("question"), data.get("emotion")
+    connection.close()
+    results.put((latencies, errors))
+
+
+def wait_for_workers(port, workers, process):
+    """Chờ tới khi /healthz đã trả lời từ `workers` pid khác nhau; trả về {pid: worker}"""
+    pids = {}
+    deadline = time.time() + READY_TIMEOUT
+    while len(pids) < workers:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server đã dừng với mã {process.returncode}")
+        if time.time() > deadline:
+            raise RuntimeError(f"Chỉ {len(pids)}/{workers} worker sẵn sàng sau {READY_TIMEOUT}s")
+        try:
+            # Kết nối mới mỗi lần để kernel có cơ hội chuyển tới worker khác
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            status, data = request(connection, "GET", "/healthz")
+            connection.close()
+            if status == 200:
+                pids[data["pid"]] = data["worker"]
+                continue
+        except (OSError, http.client.HTTPException, ValueError):
+            pass
+        time.sleep(0.2)
+    return pids
+
+
+def run_setting(workers, clients, duration, port, workload, server_args):
+    # Mỗi client có token riêng gắn với người dùng bench-<i>
+    tokens = ",".join(f"{client_token(i)}=bench-{i}" for i in range(clients))
+    with tempfile.TemporaryDirectory() as work_dir:
+        command = [sys.executable, "-m", "src.chat_api", "--workers", str(workers), "--port", str(port),
+                   "--history-db", os.path.join(work_dir, "history.sqlite"),
+                   "--answer-cache", os.path.join(work_dir, "answer_cache.sqlite"), *server_args]
+        server = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                  env=dict(os.environ, CHAT_API_KEY="", CHAT_API_USER_HEADER="", CHAT_API_TOKENS=tokens))
+        try:
+            pids = wait_for_workers(port, workers, server)
+            idle_memory = {pid: process_memory_mb(pid) for pid in pids}
+            context = multiprocessing.get_context("spawn")
+            results = context.Queue()
+            processes = [context.Process(target=run_client, args=(i, port, workload, duration, results))
+                         for i in range(clients)]
+            start = time.perf_counter()
+            for process in processes:
+                process.start()
+            outcomes = [results.get() for _ in processes]
+            elapsed = time.perf_counter() - start
+            for process in processes:
+                process.join()
+            memory = {pid: process_memory_mb(pid) for pid in pids}
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+    latencies = sorted(latency for latencies, _ in outcomes for latency in latencies)
+    errors = sum(errors for _, errors in outcomes)
+
+    def percentile(p):
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))] * 1000, 1) if latencies else None
+
+    return {
+        "workers": workers,
+        "clients": clients,
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": percentile(50),
+        "p99_ms": percentile(99),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 1) if latencies else None,
+        "idle_pss_mb_total": round(sum(m.get("pss_mb", 0.0) for m in idle_memory.values()), 1),
+        "rss_mb_total": round(sum(m.get("rss_mb", 0.0) for m in memory.values()), 1),
+        "pss_mb_total": round(sum(m.get("pss_mb", 0.0) for m in memory.values()), 1),
+        "per_worker": [{"worker": pids[pid], "pid": pid, **memory[pid]} for pid in sorted(pids, key=pids.get)],
+    }
+
+
+def print_report(rows):
+    print(f"{'workers':>7} {'clients':>7} {'req':>7} {'err':>5} {'rps':>8} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'RSS tổng':>9} {'PSS tổng':>9}")
+    for row in rows:
+        print(f"{row['workers']:>7} {row['clients']:>7} {row['requests']:>7} {row['errors']:>5} {row['rps']:>8.1f} "
+              f"{row['p50_ms'] or 0:>8.1f} {row['p99_ms'] or 0:>8.1f} {row['rss_mb_total']:>9.1f} "
+              f"{row['pss_mb_total']:>9.1f}")
+        for worker in row["per_worker"]:
+            print(f"        worker {worker['worker']} (pid {worker['pid']}): RSS {worker.get('rss_mb', 0):.1f} MB, "
+                  f"PSS {worker.get('pss_mb', 0):.1f} MB, USS {worker.get('uss_mb', 0):.1f} MB, "
+                  f"dùng chung {worker.get('shared_mb', 0):.1f} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark tải cho API chat nhiều worker")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=8, help="số tiến trình client đồng thời")
+    parser.add_argument("--duration", type=float, default=20.0, help="thời gian chạy tải mỗi cấu hình (giây)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--prompts", default=BENCHMARK_CORPUS_FILE)
+    parser.add_argument("--stub-llm", action="store_true", help="dùng StubLLM thay cho Groq")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="độ trễ giả lập của StubLLM (giây)")
+    parser.add_argument("--stub-embeddings", action="store_true", help="dùng embedding giả lập thay cho GPT4All")
+    parser.add_argument("--json", help="ghi kết quả JSON ra file")
+    args = parser.parse_args()
+
+    server_args = []
+    if args.stub_llm:
+        server_args += ["--stub-llm", "--llm-latency", str(args.llm_latency)]
+    if args.stub_embeddings:
+        server_args.append("--stub-embeddings")
+    workload = load_workload(args.prompts)
+    print(f"CPU: {os.cpu_count()}, client: {args.clients}, {args.duration:.0f}s mỗi cấu hình")
+    rows = [run_setting(workers, args.clients, args.duration, args.port, workload, server_args)
+            for workers in args.workers]
+    print_report(rows)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,112 @@
+# benchmark_index.py
+"""So sánh các loại index ANN với baseline flat: recall@k, độ trễ p50/p99 và bộ nhớ.
+
+Chạy: python benchmark_index.py --types flat ivf_flat ivf_pq hnsw --k 3 --scale 20000
+`--scale` sinh thêm vector quanh các vector thật để mô phỏng kho tài liệu lớn hơn.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import faiss
+import numpy as np
+from src.engine_registry import current_rss_mb
+from src.index_factory import INDEX_TYPES, FLAT_INDEX_FILE, make_index_config, train_index, read_index, apply_search_params
+from src.global_settings import VECTOR_DB_PATH
+
+
+def load_base_vectors(index_path, scale, noise, rng):
+    flat = faiss.read_index(os.path.join(index_path, FLAT_INDEX_FILE))
+    vectors = flat.reconstruct_n(0, flat.ntotal)
+    if scale and scale > len(vectors):
+        spread = vectors.std(axis=0, keepdims=True) * noise
+        picks = rng.integers(0, len(vectors), scale - len(vectors))
+        extra = vectors[picks] + rng.standard_normal((len(picks), vectors.shape[1])).astype("float32") * spread
+        vectors = np.vstack([vectors, extra.astype("float32")])
+    return np.ascontiguousarray(vectors, dtype="float32")
+
+
+def make_queries(vectors, count, noise, rng):
+    """Câu truy vấn giả lập: vector thật cộng nhiễu (gần giống một cách diễn đạt khác của cùng nội dung)"""
+    spread = vectors.std(axis=0, keepdims=True) * noise
+    picks = rng.integers(0, len(vectors), count)
+    queries = vectors[picks] + rng.standard_normal((count, vectors.shape[1])).astype("float32") * spread
+    return np.ascontiguousarray(queries, dtype="float32")
+
+
+def benchmark(index_type, vectors, queries, ground_truth, k, params, mmap, work_dir):
+    config = make_index_config(index_type, **params)
+    start = time.perf_counter()
+    index, effective = train_index(config, vectors)
+    build_seconds = time.perf_counter() - start
+    index_file = os.path.join(work_dir, f"{index_type}.faiss")
+    faiss.write_index(index, index_file)
+    del index
+
+    rss_before = current_rss_mb()
+    index = read_index(index_file, index_type, mmap=mmap)
+    # Tham số tìm kiếm không được lưu trong file FAISS, đặt lại sau khi đọc
+    apply_search_params(index, effective)
+    rss_loaded = current_rss_mb()
+
+    latencies = []
+    found = np.empty((len(queries), k), dtype="int64")
+    for row, query in enumerate(queries):
+        start = time.perf_counter()
+        _, ids = index.search(query[None, :], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found[row] = ids[0]
+    recall = np.mean([len(set(a) & set(b)) / k for a, b in zip(found, ground_truth)])
+    return {
+        "type": index_type,
+        "params": effective,
+        f"recall@{k}": round(float(recall), 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 4),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 4),
+        "build_s": round(build_seconds, 3),
+        "file_mb": round(os.path.getsize(index_file) / (1024 * 1024), 2),
+        "rss_load_mb": round(rss_loaded - rss_before, 2),
+        "rss_after_search_mb": round(current_rss_mb() - rss_before, 2),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark recall/độ trễ/bộ nhớ của các loại index ANN")
+    parser.add_argument("--index-path", default=VECTOR_DB_PATH)
+    parser.add_argument("--types", nargs="+", choices=INDEX_TYPES, default=list(INDEX_TYPES))
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--scale", type=int, default=0, help="tổng số vector sau khi sinh thêm (0 = chỉ dùng index thật)")
+    parser.add_argument("--noise", type=float, default=0.3, help="độ nhiễu tương đối khi sinh vector/truy vấn")
+    parser.add_argument("--no-mmap", action="store_true", help="đọc index vào RAM thay vì mmap")
+    parser.add_argument("--nlist", type=int)
+    parser.add_argument("--nprobe", type=int)
+    parser.add_argument("--M", type=int)
+    parser.add_argument("--ef-search", type=int)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="ghi kết quả ra file JSON")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    vectors = load_base_vectors(args.index_path, args.scale, args.noise, rng)
+    queries = make_queries(vectors, args.queries, args.noise, rng)
+    baseline = faiss.IndexFlatL2(vectors.shape[1])
+    baseline.add(vectors)
+    _, ground_truth = baseline.search(queries, args.k)
+    params = {"nlist": args.nlist, "nprobe": args.nprobe, "M": args.M, "efSearch": args.ef_search}
+
+    print(f"{len(vectors)} vector x {vectors.shape[1]} chiều, {len(queries)} truy vấn, k={args.k}, "
+          f"mmap={'tắt' if args.no_mmap else 'bật'}")
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for index_type in args.types:
+            result = benchmark(index_type, vectors, queries, ground_truth, args.k, params, not args.no_mmap, work_dir)
+            results.append(result)
+            print(f"{result['type']:<9} recall@{args.k}={result[f'recall@{args.k}']:.3f}  "
+                  f"p50={result['p50_ms']:.3f}ms  p99={result['p99_ms']:.3f}ms  build={result['build_s']:.2f}s  "
+                  f"file={result['file_mb']:.1f}MB  rss+load={result['rss_load_mb']:.1f}MB  "
+                  f"rss+search={result['rss_after_search_mb']:.1f}MB  {result['params']}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
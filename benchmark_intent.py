@@ -0,0 +1,151 @@
+# benchmark_intent.py
+"""So sánh bộ phân loại ý định (src/intent_classifier.py) với định tuyến bằng từ khóa cũ.
+
+- Thời gian nạp mô hình từ .npz (gồm cả import NumPy) và kích thước file.
+- Thông lượng (tin nhắn/s) theo kích thước lô 1/32/256/1024: bộ phân loại mã hóa + tính điểm cả lô một lần,
+  định tuyến từ khóa duyệt automaton từng câu rồi áp luật direct_query > personal + emotion.
+- Độ chính xác (ý định, cảm xúc) trên data/keywords/labelled_messages.csv. Với --holdout, một phần mẫu
+  gán nhãn được tách ra, mô hình được huấn luyện lại không có chúng và chỉ chấm trên phần tách ra.
+- Mức đồng thuận với luật cũ trên data/benchmark/prompts.json.
+
+Chạy: python benchmark_intent.py [--holdout 0.3] [--json kết_quả.json]
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from src.global_settings import BENCHMARK_CORPUS_FILE, INTENT_LABELLED_FILE, INTENT_MODEL_FILE
+
+BATCH_SIZES = (1, 32, 256, 1024)
+
+
+def keyword_route(matches):
+    """Luật định tuyến trước khi có bộ phân loại (giữ lại làm mốc so sánh)"""
+    if matches.has("direct_query"):
+        return "direct_query"
+    if matches.has("personal") and matches.has("emotion"):
+        return "severity_question"
+    return "unclear"
+
+
+def measure_load(model_file):
+    """Nạp mô hình trong tiến trình con sạch để tính cả thời gian import NumPy"""
+    code = ("import time; start = time.perf_counter(); "
+            "from src.intent_classifier import IntentClassifier; "
+            f"IntentClassifier.load({model_file!r}); print(time.perf_counter() - start)")
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1]) * 1000
+
+
+def throughput(function, messages, batch_size, min_seconds=1.0):
+    """Số tin nhắn/s khi xử lý `messages` theo lô `batch_size`, lặp tới khi đủ `min_seconds`"""
+    batches = [messages[i:i + batch_size] for i in range(0, len(messages), batch_size)]
+    processed, start = 0, time.perf_counter()
+    while True:
+        for batch in batches:
+            function(batch)
+            processed += len(batch)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            return processed / elapsed
+
+
+def score(predict_routes, labelled):
+    """(độ chính xác ý định, độ chính xác cảm xúc) trên danh sách (câu, ý định, cảm xúc)"""
+    if not labelled:
+        return None, None
+    routes = predict_routes([text for text, _, _ in labelled])
+    intent_hits = sum(route == intent for (route, _), (_, intent, _) in zip(routes, labelled))
+    emotion_hits = sum((found or "") == emotion for (_, found), (_, _, emotion) in zip(routes, labelled))
+    return round(intent_hits / len(labelled), 3), round(emotion_hits / len(labelled), 3)
+
+
+def split_labelled(labelled, fraction, seed=0):
+    rows = list(labelled)
+    random.Random(seed).shuffle(rows)
+    cut = int(len(rows) * fraction)
+    return rows[cut:], rows[:cut]
+
+
+def run_benchmark(prompts_file=BENCHMARK_CORPUS_FILE, model_file=INTENT_MODEL_FILE, labelled_file=INTENT_LABELLED_FILE,
+                  holdout=0.0, batch_sizes=BATCH_SIZES):
+    from src.intent_classifier import load_intent_classifier, read_labelled_messages
+    from src.keyword_matcher import load_keyword_matcher
+
+    classifier = load_intent_classifier(model_file, labelled_file=labelled_file)
+    matcher = load_keyword_matcher()
+    labelled = read_labelled_messages(labelled_file)
+    evaluation = labelled
+    if holdout > 0:
+        train_rows, evaluation = split_labelled(labelled, holdout)
+        with tempfile.TemporaryDirectory() as work_dir:
+            train_file = os.path.join(work_dir, "labelled.csv")
+            with open(train_file, "w", encoding="utf-8", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["message", "intent", "emotion"])
+                writer.writerows(train_rows)
+            classifier = load_intent_classifier(os.path.join(work_dir, "model.npz"), labelled_file=train_file)
+
+    def classifier_routes(texts):
+        return [(p.intent, p.emotion) for p in classifier.predict_batch(texts)]
+
+    def keyword_routes(texts):
+        routes = []
+        for text in texts:
+            matches = matcher.match(text)
+            routes.append((keyword_route(matches), matches.first("emotion")))
+        return routes
+
+    with open(prompts_file, "r", encoding="utf-8") as f:
+        prompts = json.load(f)
+    corpus = prompts["direct_queries"] + prompts["emotional_messages"] + [c["prompt"] for c in prompts["answer_clicks"]]
+    # Đủ lớn cho lô lớn nhất: lặp lại corpus + mẫu gán nhãn
+    messages = (corpus + [text for text, _, _ in labelled]) * (max(batch_sizes) // (len(corpus) + len(labelled)) + 1)
+    messages = messages[:max(batch_sizes)]
+
+    agreement = sum(a == b for (a, _), (b, _) in zip(classifier_routes(corpus), keyword_routes(corpus))) / len(corpus)
+    return {
+        "model_file_kb": round(os.path.getsize(model_file) / 1024, 1) if os.path.exists(model_file) else None,
+        "load_ms": round(measure_load(model_file), 1) if os.path.exists(model_file) else None,
+        "throughput": [{
+            "batch_size": size,
+            "classifier_msgs_per_s": round(throughput(classifier.predict_batch, messages, size)),
+            "keyword_msgs_per_s": round(throughput(keyword_routes, messages, size)),
+        } for size in batch_sizes],
+        "evaluation": "holdout" if holdout > 0 else "labelled (tập huấn luyện)",
+        "evaluated_messages": len(evaluation),
+        "classifier_accuracy": score(classifier_routes, evaluation),
+        "keyword_accuracy": score(keyword_routes, evaluation),
+        "route_agreement_on_prompts": round(agreement, 3),
+    }
+
+
+def print_report(report):
+    print(f"Mô hình: {report['model_file_kb']} KB, nạp {report['load_ms']} ms (gồm import NumPy)")
+    print(f"{'lô':>6} {'phân loại msg/s':>16} {'từ khóa msg/s':>14}")
+    for row in report["throughput"]:
+        print(f"{row['batch_size']:>6} {row['classifier_msgs_per_s']:>16} {row['keyword_msgs_per_s']:>14}")
+    print(f"Chấm trên {report['evaluated_messages']} mẫu ({report['evaluation']}): "
+          f"phân loại ý định/cảm xúc {report['classifier_accuracy']}, từ khóa {report['keyword_accuracy']}")
+    print(f"Đồng thuận nhánh với luật từ khóa trên prompts.json: {report['route_agreement_on_prompts']:.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark bộ phân loại ý định so với định tuyến từ khóa")
+    parser.add_argument("--prompts", default=BENCHMARK_CORPUS_FILE)
+    parser.add_argument("--model-file", default=INTENT_MODEL_FILE)
+    parser.add_argument("--holdout", type=float, default=0.0, help="tỷ lệ mẫu gán nhãn tách ra để chấm (huấn luyện lại)")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=list(BATCH_SIZES))
+    parser.add_argument("--json", help="ghi kết quả JSON ra file")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.prompts, args.model_file, holdout=args.holdout, batch_sizes=args.batch_sizes)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,131 @@
+# benchmark_prefetch.py
+"""Đo lợi ích của việc chạy trước câu trả lời mức độ (src/prefetch.py).
+
+Mỗi phiên giả lập: tin nhắn cảm xúc -> câu hỏi mức độ -> người dùng suy nghĩ `--think-time` giây -> chọn đáp án
+(các lượt answer_clicks trong data/benchmark/prompts.json). Đo độ trễ từ lúc chọn đến lúc có câu trả lời khi
+tắt và bật prefetch, cùng tỷ lệ trúng và số lời gọi LLM tăng thêm. Không dùng answer bank (mọi ô đều phải sinh),
+mỗi vòng dùng cache câu trả lời mới trong thư mục tạm để hai chế độ xuất phát như nhau.
+
+Chạy: python benchmark_prefetch.py --llm-latency 1.0 --think-time 2.0 --repeat 2
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+from src.global_settings import BENCHMARK_CORPUS_FILE
+
+
+def prefetch_counters():
+    from src.tracing import METRICS
+    return {(name, labels): value for (name, labels), value in list(METRICS.counters.items())
+            if name.startswith("prefetch_")}
+
+
+def counter_delta(before, after, name, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    return after.get(key, 0) - before.get(key, 0)
+
+
+def wait_for_background_jobs(timeout=120):
+    """Chờ mọi job prefetch đã giao xong (hoàn tất, lỗi hoặc bị hủy) để chế độ sau không bị lẫn"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        counters = prefetch_counters()
+        finished = sum(counters.get(("prefetch_jobs_total", (("outcome", outcome),)), 0)
+                       for outcome in ("completed", "failed", "cancelled"))
+        if finished >= counters.get(("prefetch_jobs_total", (("outcome", "submitted"),)), 0):
+            return
+        time.sleep(0.05)
+
+
+def run_mode(resources, clicks, prefetch, think_time, repeat, work_dir):
+    from src.answer_bank import AnswerBank
+    from src.answer_cache import SemanticAnswerCache
+    from src.conversation_engine import ConversationEngine
+
+    mode = "prefetch" if prefetch else "tắt"
+    before = prefetch_counters()
+    latencies, llm_calls, lock = [], [0], threading.Lock()
+    for round_index in range(repeat):
+        cache = SemanticAnswerCache(resources.embedding_model,
+                                    cache_file=os.path.join(work_dir, f"{int(prefetch)}-{round_index}.sqlite"))
+        session_resources = SimpleNamespace(**{**vars(resources), "answer_cache": cache, "answer_bank": AnswerBank()})
+        for session_index, click in enumerate(clicks):
+            engine = ConversationEngine(f"bench-{session_index}", {}, resources=session_resources, prefetch=prefetch)
+            generate = engine.generate
+
+            def counted_generate(*args, generate=generate, **kwargs):
+                with lock:
+                    llm_calls[0] += 1
+                return generate(*args, **kwargs)
+
+            engine.generate = counted_generate
+            result = engine.generate_question(click["prompt"])
+            if not result["question"]:
+                continue
+            time.sleep(think_time)
+            start = time.perf_counter()
+            engine.process_answer(click["prompt"], result["question"], click["answer"], result["emotion"])
+            latencies.append(time.perf_counter() - start)
+    wait_for_background_jobs()
+    after = prefetch_counters()
+
+    hits = counter_delta(before, after, "prefetch_lookups_total", outcome="hit")
+    waits = counter_delta(before, after, "prefetch_lookups_total", outcome="wait")
+    misses = counter_delta(before, after, "prefetch_lookups_total", outcome="miss")
+    used = counter_delta(before, after, "prefetch_llm_calls_used_total")
+    prefetched = counter_delta(before, after, "prefetch_llm_calls_total")
+    ordered = sorted(latencies)
+    return {
+        "mode": mode,
+        "clicks": len(latencies),
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 1) if ordered else None,
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 1) if ordered else None,
+        "mean_ms": round(statistics.mean(latencies) * 1000, 1) if latencies else None,
+        "llm_calls": llm_calls[0],
+        "hits": hits,
+        "waits": waits,
+        "misses": misses,
+        "hit_ratio": round((hits + waits) / (hits + waits + misses), 3) if hits + waits + misses else None,
+        "prefetch_llm_calls": prefetched,
+        "prefetch_llm_calls_wasted": max(0, prefetched - used),
+    }
+
+
+def print_report(rows):
+    print(f"{'chế độ':>9} {'lượt':>5} {'p50 ms':>8} {'p95 ms':>8} {'LLM':>5} {'trúng':>6} {'chờ':>4} {'trượt':>6} "
+          f"{'tỷ lệ':>6} {'LLM thừa':>9}")
+    for row in rows:
+        print(f"{row['mode']:>9} {row['clicks']:>5} {row['p50_ms'] or 0:>8.1f} {row['p95_ms'] or 0:>8.1f} "
+              f"{row['llm_calls']:>5} {row['hits']:>6} {row['waits']:>4} {row['misses']:>6} "
+              f"{row['hit_ratio'] or 0:>6.2f} {row['prefetch_llm_calls_wasted']:>9}")
+    if len(rows) == 2 and rows[0]["llm_calls"]:
+        extra = rows[1]["llm_calls"] / rows[0]["llm_calls"] - 1
+        print(f"Chi phí LLM tăng thêm khi bật prefetch: {extra:+.0%} lời gọi")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark prefetch câu trả lời mức độ")
+    parser.add_argument("--prompts", default=BENCHMARK_CORPUS_FILE)
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="độ trễ giả lập của StubLLM (giây)")
+    parser.add_argument("--think-time", type=float, default=2.0, help="thời gian người dùng chọn đáp án (giây)")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--json", help="ghi kết quả JSON ra file")
+    args = parser.parse_args()
+
+    from src.chat_api import load_resources
+    with open(args.prompts, "r", encoding="utf-8") as f:
+        clicks = json.load(f)["answer_clicks"]
+    with tempfile.TemporaryDirectory() as work_dir:
+        resources = load_resources(stub_llm=True, llm_latency=args.llm_latency, stub_embeddings=True,
+                                   answer_cache_file=os.path.join(work_dir, "answer_cache.sqlite"))
+        rows = [run_mode(resources, clicks, prefetch, args.think_time, args.repeat, work_dir)
+                for prefetch in (False, True)]
+    print_report(rows)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
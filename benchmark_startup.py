@@ -0,0 +1,142 @@
+# benchmark_startup.py
+"""Đo thời gian khởi động lạnh (import) của các trang Streamlit bằng `python -X importtime`.
+
+Mỗi điểm vào được chạy trong một tiến trình Python mới, lặp `--repeat` lần và lấy trung vị.
+Điểm vào có `ml=False` (trang đăng nhập và các trang khi chưa đăng nhập) không được phép nạp
+thư viện ML; vi phạm hoặc vượt ngân sách trong data/benchmark/startup_budget.json cho exit code 1.
+
+Chạy:          python benchmark_startup.py
+Xem import chậm nhất:  python benchmark_startup.py --top 15
+Cập nhật ngân sách:    python benchmark_startup.py --save-budget
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from src.global_settings import STARTUP_BUDGET_FILE
+
+# Các module chỉ được nạp sau ranh giới engine (engine_registry)
+ML_MODULES = ("faiss", "numpy", "pandas", "langchain", "langchain_core", "langchain_community", "langchain_groq",
+              "groq", "gpt4all", "httpx", "pypdf")
+
+# Chạy trang chưa đăng nhập qua AppTest để đo đúng những gì trang nạp trước khi dừng ở bước kiểm tra đăng nhập
+PAGE_VIEW = """
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file({path!r})
+app.session_state["logged_in"] = False
+app.run()
+"""
+
+ENTRY_POINTS = {
+    "home": {"code": "import streamlit, src.authenticate", "ml": False},
+    "chat_imports": {"code": "import streamlit, src.bot_logic, src.slide_bar, src.conversation_view", "ml": False},
+    "admin_imports": {"code": "import streamlit, src.authenticate, src.tracing", "ml": False},
+    "chat_view_logged_out": {"code": PAGE_VIEW.format(path="pages/chat.py"), "ml": False},
+    "admin_view_logged_out": {"code": PAGE_VIEW.format(path="pages/admin.py"), "ml": False},
+    # Ranh giới engine: nặng theo thiết kế, chỉ theo dõi để phát hiện hồi quy
+    "engine": {"code": "import src.engine_registry", "ml": True},
+}
+
+REPORT_CODE = """
+import sys
+print("LOADED:" + ",".join(name for name in {modules!r} if name in sys.modules))
+"""
+
+
+def parse_importtime(stderr):
+    """Trả về (tổng ms của các import cấp cao nhất, [(ms cộng dồn, module)] cấp cao nhất)"""
+    top_level = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        # Module cấp cao nhất có đúng một khoảng trắng trước tên, module lồng nhau được thụt thêm
+        if name.startswith(" ") and not name.startswith("  "):
+            top_level.append((int(cumulative) / 1000, name.strip()))
+    return sum(ms for ms, _ in top_level), top_level
+
+
+def measure_entry(code, cwd):
+    script = code + REPORT_CODE.format(modules=ML_MODULES)
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", script], cwd=cwd, capture_output=True,
+                            text=True, env=dict(os.environ, TRACING_ENABLED="0"))
+    wall_ms = (time.perf_counter() - start) * 1000
+    if result.returncode != 0:
+        raise RuntimeError(f"Điểm vào lỗi:\n{result.stderr[-2000:]}")
+    import_ms, top_level = parse_importtime(result.stderr)
+    loaded = next((line[len("LOADED:"):] for line in result.stdout.splitlines() if line.startswith("LOADED:")), "")
+    return {"import_ms": import_ms, "wall_ms": wall_ms, "top_level": top_level,
+            "ml_loaded": [name for name in loaded.split(",") if name]}
+
+
+def run_startup_benchmark(repeat=5, cwd=None):
+    cwd = cwd or os.path.dirname(os.path.abspath(__file__))
+    report = {}
+    for name, entry in ENTRY_POINTS.items():
+        runs = [measure_entry(entry["code"], cwd) for _ in range(repeat)]
+        slowest = max(runs, key=lambda run: run["import_ms"])["top_level"]
+        report[name] = {
+            "import_ms": round(statistics.median(run["import_ms"] for run in runs), 1),
+            "wall_ms": round(statistics.median(run["wall_ms"] for run in runs), 1),
+            "ml_allowed": entry["ml"],
+            "ml_loaded": runs[-1]["ml_loaded"],
+            "slowest_imports": [(module, round(ms, 1)) for ms, module in sorted(slowest, reverse=True)[:20]],
+        }
+    return report
+
+
+def check_budget(report, budget, tolerance):
+    """Danh sách vi phạm: nạp thư viện ML khi không được phép, hoặc import chậm hơn ngân sách quá `tolerance`"""
+    problems = []
+    for name, row in report.items():
+        if not row["ml_allowed"] and row["ml_loaded"]:
+            problems.append(f"{name}: nạp thư viện ML trước ranh giới engine: {', '.join(row['ml_loaded'])}")
+        limit = budget.get(name, {}).get("import_ms")
+        if limit and row["import_ms"] > limit * (1 + tolerance):
+            problems.append(f"{name}: import {row['import_ms']} ms > ngân sách {limit} ms (+{tolerance:.0%})")
+    return problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark thời gian khởi động (import) của các trang")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=0, help="in N import cấp cao nhất chậm nhất của mỗi điểm vào")
+    parser.add_argument("--budget", default=STARTUP_BUDGET_FILE)
+    parser.add_argument("--tolerance", type=float, default=0.3, help="tỷ lệ vượt ngân sách cho phép (nhiễu máy)")
+    parser.add_argument("--save-budget", action="store_true", help="ghi kết quả hiện tại làm ngân sách mới")
+    parser.add_argument("--json", help="ghi báo cáo JSON ra file")
+    args = parser.parse_args()
+
+    report = run_startup_benchmark(args.repeat)
+    print(f"{'điểm vào':<24} {'import ms':>10} {'wall ms':>10}  thư viện ML đã nạp")
+    for name, row in report.items():
+        loaded = ", ".join(row["ml_loaded"]) or "-"
+        print(f"{name:<24} {row['import_ms']:>10.1f} {row['wall_ms']:>10.1f}  {loaded}")
+        for module, ms in row["slowest_imports"][:args.top]:
+            print(f"    {module:<40} {ms:>8.1f} ms")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.save_budget:
+        budget = {name: {"import_ms": row["import_ms"]} for name, row in report.items()}
+        os.makedirs(os.path.dirname(args.budget) or ".", exist_ok=True)
+        with open(args.budget, "w", encoding="utf-8") as f:
+            json.dump(budget, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        print(f"Đã lưu ngân sách vào {args.budget}")
+    budget = {}
+    if os.path.exists(args.budget):
+        with open(args.budget, "r", encoding="utf-8") as f:
+            budget = json.load(f)
+    problems = check_budget(report, budget, args.tolerance)
+    if problems:
+        print("Vượt ngân sách khởi động:")
+        for line in problems:
+            print(f"  - {line}")
+        sys.exit(1)
+    print("Trong ngân sách khởi động.")
@@ -1,12 +1,46 @@
 # build_data.py
+import argparse
+import os
 from src.index_builder import build_index
-from src.ingest_pipeline import create_nodes
+from src.ingest_pipeline import StageTimer
+from src.index_factory import INDEX_TYPES, make_index_config
+from src.global_settings import VECTOR_INDEX_TYPE
 
-def build_data():
-    nodes = create_nodes()
-    db = build_index()
-    return nodes, db
+def build_data(index_config=None):
+    # Một lần ingest duy nhất: parse -> split -> embed -> write -> dựng index ANN
+    timer = StageTimer()
+    db = build_index(timer=timer, index_config=index_config)
+    return db, timer.report()
+
+def build_answers(db, use_stub_llm=False, max_workers=4, base_emotions_only=False):
+    """Tính sẵn câu trả lời cho mọi (cảm xúc, mức độ) của luồng câu hỏi trắc nghiệm
+    (với LLM giả lập, answer bank được ghi vào STUB_ANSWER_BANK_FILE)"""
+    from src.answer_bank import build_answer_bank, llm_name
+    from src.engine_registry import create_qa_chain
+    from src.keyword_matcher import DEFAULT_KEYWORDS, load_keyword_matcher
+    from src.models import using_llm_groq, using_llm_stub
+
+    llm = using_llm_stub() if use_stub_llm else using_llm_groq(api_key=os.getenv("GROQ_API_KEY"))
+    emotions = DEFAULT_KEYWORDS["emotion"] if base_emotions_only else load_keyword_matcher().keywords("emotion")
+    return build_answer_bank(create_qa_chain(llm, db), emotions, llm_name(llm), max_workers=max_workers)
 
 if __name__ == "__main__":
-    nodes, db = build_data()
-    print("Đã tạo nodes và index.")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Build index DSM-5 và answer bank")
+    parser.add_argument("--answer-bank", action="store_true", help="tính sẵn câu trả lời cho luồng câu hỏi mức độ")
+    parser.add_argument("--stub-llm", action="store_true", help="dùng LLM giả lập cục bộ thay cho Groq")
+    parser.add_argument("--workers", type=int, default=4, help="số lời gọi LLM đồng thời tối đa")
+    parser.add_argument("--base-emotions", action="store_true", help="chỉ dùng danh sách cảm xúc cơ bản")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default=VECTOR_INDEX_TYPE, help="loại index ANN")
+    parser.add_argument("--nlist", type=int, help="số cụm IVF")
+    parser.add_argument("--nprobe", type=int, help="số cụm IVF được duyệt khi tìm kiếm")
+    parser.add_argument("--M", type=int, help="số cạnh mỗi nút HNSW")
+    parser.add_argument("--ef-search", type=int, help="efSearch của HNSW")
+    args = parser.parse_args()
+
+    index_config = make_index_config(args.index_type, nlist=args.nlist, nprobe=args.nprobe, M=args.M, efSearch=args.ef_search)
+    db, timings = build_data(index_config)
+    print("Đã tạo nodes và index.")
+    print("Thời gian theo giai đoạn (giây):", ", ".join(f"{stage}={seconds}" for stage, seconds in timings.items()))
+    if args.answer_bank:
+        bank = build_answers(db, args.stub_llm, args.workers, args.base_emotions)
+        print(f"Đã tạo answer bank với {len(bank)} câu trả lời.")
@@ -1,6 +1,560 @@
 # evaluate.py
-def evaluate_system():
-    return "Chưa có logic đánh giá."
+"""Benchmark độ trễ từng giai đoạn của pipeline chat trên bộ câu nhập tiếng Việt cố định.
+
+Đo trên đúng đường xử lý của API headless (ChatService -> BotLogic -> ConversationEngine -> PackedRetriever).
+Giai đoạn: routing (bộ phân loại ý định), answer_cache (tra cache câu trả lời), embedding (câu truy vấn),
+search (FAISS), pack (ghép ngữ cảnh), prompt (template), llm (StubLLM tất định), history (ghi lịch sử).
+Lượt chọn đáp án được đo cả khi không có answer bank (answer_clicks) và khi trúng answer bank (answer_clicks_bank).
+Kết quả là JSON với p50/p95/p99 từng giai đoạn và throughput từng bộ câu nhập; có thể so với baseline đã lưu
+để phát hiện hồi quy.
+
+Chạy:   python evaluate.py --output report.json
+Lưu baseline:  python evaluate.py --save-baseline
+So với baseline (exit code 1 nếu hồi quy):  python evaluate.py --compare --threshold 0.25 --stage-threshold llm=0.5
+
+Quét tham số chunk: python evaluate.py --sweep --chunk-sizes 256 512 768 --chunk-overlaps 0 50 --ks 1 3 5
+dựng index tạm cho từng cấu hình cắt chunk, chấm recall@k trên bộ câu hỏi -> trang của DSM-5
+(data/benchmark/golden.json) cùng dung lượng index, thời gian build, độ trễ tìm kiếm, số token ngữ cảnh,
+rồi in bảng có đánh dấu các cấu hình thuộc biên Pareto.
+
+So sánh câu truy vấn truy hồi: python evaluate.py --query-prep --ks 1 3 5
+embed bộ câu hỏi vàng theo cách cũ (system prompt + câu hỏi) và theo query_prep, in recall@k, độ dài câu truy vấn
+và thời gian embed; exit code 1 nếu recall của câu truy vấn đã chuẩn bị thấp hơn.
+"""
+import argparse
+import functools
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+import numpy as np
+from src.global_settings import (
+    VECTOR_DB_PATH, EMBEDDING_MODEL_FILE, BENCHMARK_CORPUS_FILE, BENCHMARK_BASELINE_FILE, BENCHMARK_GOLDEN_FILE,
+)
+
+STAGES = ("routing", "answer_cache", "embedding", "search", "pack", "prompt", "llm", "history")
+BENCHMARK_USER = "benchmark"
+PERCENTILES = (50, 95, 99)
+
+
+class StageRecorder:
+    """Ghi thời gian (ms) của từng lần chạy mỗi giai đoạn"""
+
+    def __init__(self):
+        self.samples = {stage: [] for stage in STAGES}
+
+    @contextmanager
+    def measure(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.samples[stage].append((time.perf_counter() - start) * 1000)
+
+    def summary(self):
+        summary = {}
+        for stage, samples in self.samples.items():
+            if not samples:
+                continue
+            values = np.asarray(samples)
+            summary[stage] = {
+                "count": len(samples),
+                "mean_ms": round(float(values.mean()), 4),
+                **{f"p{p}_ms": round(float(np.percentile(values, p)), 4) for p in PERCENTILES},
+                "ops_per_s": round(1000 / float(values.mean()), 1) if values.mean() > 0 else None,
+            }
+        return summary
+
+
+class Timed:
+    """Proxy của một thành phần thật: các phương thức trong `stages` được đo vào StageRecorder của lượt hiện tại,
+    mọi thuộc tính khác được chuyển thẳng tới thành phần gốc"""
+
+    def __init__(self, bench, target, **stages):
+        self._bench = bench
+        self._target = target
+        self._stages = stages
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        stage = self._stages.get(name)
+        return self._bench.measured(stage, attribute) if stage else attribute
+
+
+class PipelineBenchmark:
+    """Chạy đúng đường xử lý của API headless (ChatService -> BotLogic -> ConversationEngine -> PackedRetriever)
+    với LLM giả lập, kho lịch sử tạm và cache câu trả lời luôn trượt; thời gian từng giai đoạn được đo bằng
+    cách bọc các thành phần thật (bộ phân loại, cache, embedding, FAISS, ContextPacker, prompt, LLM, kho lịch sử).
+
+    Lượt chọn đáp án được đo hai lần: không có answer bank (truy hồi + LLM) và trúng answer bank dựng bằng
+    build_answer_bank trên chính index này. Prefetch bị tắt để chỉ đo phần chạy đồng bộ (xem benchmark_prefetch.py).
+    """
+
+    def __init__(self, index_path, embeddings, llm_latency, work_dir):
+        from src.answer_bank import AnswerBank
+        from src.answer_cache import SemanticAnswerCache
+        from src.engine_registry import create_qa_chain, create_qa_prompt
+        from src.history_store import HistoryStore
+        from src.index_factory import load_vector_store
+        from src.intent_classifier import load_intent_classifier
+        from src.keyword_matcher import load_keyword_matcher
+        from src.models import using_llm_stub
+
+        self.recorder = StageRecorder()
+        self.index_path = index_path
+        self.work_dir = work_dir
+        self.llm = using_llm_stub(latency_seconds=llm_latency)
+        db = load_vector_store(index_path, embeddings)
+        qa_chain = create_qa_chain(self.llm, db)
+        # Bọc sau khi dựng qa_chain: PackedRetriever chỉ gọi embed_query, index.search và packer.pack
+        db.embedding_function = Timed(self, db.embedding_function, embed_query="embedding")
+        db.index = Timed(self, db.index, search="search")
+        qa_chain.retriever.packer = Timed(self, qa_chain.retriever.packer, pack="pack")
+        self.history = HistoryStore(os.path.join(work_dir, "history.sqlite"))
+        # TTL 0: mọi lượt tra cache câu trả lời đều trượt (vẫn chạy mã get/put thật), nên luôn đo truy hồi + LLM
+        answer_cache = SemanticAnswerCache(embeddings, cache_file=os.path.join(work_dir, "answer_cache.sqlite"),
+                                           ttl_seconds=0)
+        self.resources = SimpleNamespace(llm=self.llm, db=db, qa_chain=qa_chain, qa_prompt=create_qa_prompt(),
+                                         answer_cache=answer_cache, keyword_matcher=load_keyword_matcher(),
+                                         intent_classifier=load_intent_classifier(), answer_bank=AnswerBank())
+        self.service = self.make_service(self.resources)
+        self.bank_service = None
+        self.conversation_id = self.history.create_conversation(BENCHMARK_USER, "benchmark")
+        self.questions = {}
+
+    def measured(self, stage, function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with self.recorder.measure(stage):
+                return function(*args, **kwargs)
+        return wrapper
+
+    def make_service(self, resources):
+        """ChatService với kho lịch sử tạm; engine của người dùng benchmark được bọc để đo từng giai đoạn"""
+        from src.chat_api import ChatService
+        service = ChatService(resources, Timed(self, self.history, append_message="history"))
+        engine = service.bot(BENCHMARK_USER, {"name": BENCHMARK_USER}).engine
+        engine.prefetch = None
+        engine.intent_classifier = Timed(self, engine.intent_classifier, predict="routing")
+        engine.answer_cache = Timed(self, engine.answer_cache, get="answer_cache")
+        engine.llm = Timed(self, engine.llm, invoke="llm")
+        engine.build_prompt = self.measured("prompt", engine.build_prompt)
+        return service
+
+    def prepare_clicks(self, clicks):
+        """Câu hỏi mức độ + cảm xúc cho từng lượt chọn (như client gọi /v1/input trước), và answer bank cho các
+        cảm xúc đó; không tính vào số liệu"""
+        from src.answer_bank import build_answer_bank, llm_name
+        self.recorder = StageRecorder()
+        for item in clicks:
+            if item["prompt"] not in self.questions:
+                result = self.service.handle_input(BENCHMARK_USER, self.request(item["prompt"]))
+                self.questions[item["prompt"]] = (result["question"], result.get("emotion"))
+        emotions = sorted({emotion or "buồn" for _, emotion in self.questions.values()})
+        bank = build_answer_bank(self.resources.qa_chain, emotions, llm_name(self.llm),
+                                 bank_file=os.path.join(self.work_dir, "answer_bank.json"), index_path=self.index_path)
+        self.bank_service = self.make_service(SimpleNamespace(**{**vars(self.resources), "answer_bank": bank}))
+
+    def request(self, prompt, **fields):
+        return {"conversation_id": self.conversation_id, "prompt": prompt, **fields}
+
+    def direct_query(self, prompt, recorder):
+        self.recorder = recorder
+        self.service.handle_input(BENCHMARK_USER, self.request(prompt))
+
+    def emotional_message(self, prompt, recorder):
+        self.recorder = recorder
+        self.service.handle_input(BENCHMARK_USER, self.request(prompt))
+
+    def answer_click(self, item, recorder, service=None):
+        """Nhánh không có answer bank: truy hồi + LLM cho câu truy vấn mức độ"""
+        self.recorder = recorder
+        question, emotion = self.questions[item["prompt"]]
+        (service or self.service).handle_answer(
+            BENCHMARK_USER, self.request(item["prompt"], question=question or "", answer=item["answer"], emotion=emotion))
+
+    def answer_click_bank(self, item, recorder):
+        """Nhánh trúng answer bank: tra cứu O(1), không truy hồi, không gọi LLM"""
+        self.answer_click(item, recorder, self.bank_service)
+
+
+def make_embeddings(use_stub):
+    from src.embeddings import CachedEmbeddings, StubEmbeddings
+    if use_stub or not os.path.exists(EMBEDDING_MODEL_FILE):
+        return StubEmbeddings(), "stub"
+    # Không dùng cache đĩa/LRU để mỗi lần đo đều là một lần encode thật
+    return CachedEmbeddings(cache_file=None, query_cache_size=0), os.path.basename(EMBEDDING_MODEL_FILE)
+
+
+def run_benchmark(corpus_file=BENCHMARK_CORPUS_FILE, index_path=VECTOR_DB_PATH, repeat=5, warmup=1,
+                  llm_latency=0.0, stub_embeddings=False):
+    with open(corpus_file, "r", encoding="utf-8") as f:
+        corpora = json.load(f)
+    embeddings, embedding_name = make_embeddings(stub_embeddings)
+    with tempfile.TemporaryDirectory() as work_dir:
+        bench = PipelineBenchmark(index_path, embeddings, llm_latency, work_dir)
+        bench.prepare_clicks(corpora.get("answer_clicks", []))
+        # Tên bộ trong báo cáo -> (bộ câu nhập, hàm chạy); answer_clicks_bank dùng lại các lượt chọn của answer_clicks
+        runners = {"direct_queries": ("direct_queries", bench.direct_query),
+                   "emotional_messages": ("emotional_messages", bench.emotional_message),
+                   "answer_clicks": ("answer_clicks", bench.answer_click),
+                   "answer_clicks_bank": ("answer_clicks", bench.answer_click_bank)}
+        # Vòng khởi động: nạp mmap, JIT của thư viện, cache của SQLite
+        for _ in range(warmup):
+            for corpus, runner in runners.values():
+                for item in corpora.get(corpus, []):
+                    runner(item, StageRecorder())
+
+        recorder = StageRecorder()
+        corpus_report = {}
+        for name, (corpus, runner) in runners.items():
+            items = corpora.get(corpus, [])
+            start = time.perf_counter()
+            for _ in range(repeat):
+                for item in items:
+                    runner(item, recorder)
+            seconds = time.perf_counter() - start
+            count = len(items) * repeat
+            corpus_report[name] = {"count": count, "seconds": round(seconds, 4),
+                                   "throughput_rps": round(count / seconds, 2) if seconds else None}
+    return {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "index_path": index_path,
+            "embeddings": embedding_name,
+            "llm": f"stub(latency={llm_latency}s)",
+            "repeat": repeat,
+        },
+        "stages": recorder.summary(),
+        "corpora": corpus_report,
+    }
+
+
+def compare_reports(report, baseline, threshold=0.25, stage_thresholds=None, min_delta_ms=0.5):
+    """Danh sách hồi quy: percentile chậm hơn baseline quá `threshold` (tỷ lệ) và quá `min_delta_ms`,
+    hoặc throughput giảm quá `threshold` (và thời gian mỗi lượt tăng quá `min_delta_ms`).
+
+    Ngưỡng tuyệt đối tránh báo động giả ở các giai đoạn dưới mili-giây, nơi nhiễu của máy lớn hơn tín hiệu.
+    """
+    stage_thresholds = stage_thresholds or {}
+    regressions = []
+    for stage, current in report["stages"].items():
+        previous = baseline.get("stages", {}).get(stage)
+        if not previous:
+            continue
+        limit = stage_thresholds.get(stage, threshold)
+        for p in PERCENTILES:
+            metric = f"p{p}_ms"
+            if current[metric] > previous[metric] * (1 + limit) and current[metric] - previous[metric] >= min_delta_ms:
+                regressions.append(f"{stage}.{metric}: {previous[metric]} -> {current[metric]} ms (ngưỡng +{limit:.0%})")
+    for name, current in report["corpora"].items():
+        previous = baseline.get("corpora", {}).get(name)
+        if not previous or not previous.get("throughput_rps") or not current["throughput_rps"]:
+            continue
+        added_ms = 1000 / current["throughput_rps"] - 1000 / previous["throughput_rps"]
+        if current["throughput_rps"] < previous["throughput_rps"] * (1 - threshold) and added_ms >= min_delta_ms:
+            regressions.append(f"{name}.throughput_rps: {previous['throughput_rps']} -> {current['throughput_rps']} "
+                               f"(ngưỡng -{threshold:.0%})")
+    return regressions
+
+
+def parse_stage_thresholds(values):
+    thresholds = {}
+    for value in values or []:
+        stage, _, limit = value.partition("=")
+        if stage not in STAGES or not limit:
+            raise argparse.ArgumentTypeError(f"--stage-threshold phải có dạng <giai đoạn>=<tỷ lệ>, giai đoạn thuộc {STAGES}")
+        thresholds[stage] = float(limit)
+    return thresholds
+
+
+def print_report(report):
+    print(f"{'giai đoạn':<12} {'n':>6} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'ops/s':>10}")
+    for stage, row in report["stages"].items():
+        print(f"{stage:<12} {row['count']:>6} {row['p50_ms']:>10.3f} {row['p95_ms']:>10.3f} {row['p99_ms']:>10.3f} "
+              f"{row['ops_per_s'] or 0:>10.1f}")
+    for name, row in report["corpora"].items():
+        print(f"{name}: {row['count']} lượt, {row['throughput_rps']} lượt/giây")
+
+
+# Các chỉ số có thể dùng làm mục tiêu của biên Pareto khi quét tham số chunk: True = càng lớn càng tốt
+SWEEP_METRICS = {"recall": True, "context_tokens": False, "packed_tokens": False, "index_mb": False,
+                 "build_s": False, "search_p50_ms": False}
+# Mặc định chỉ recall và token ngữ cảnh: độ trễ của index flat ở cỡ tài liệu này chênh nhau dưới mức nhiễu
+PARETO_OBJECTIVES = ("recall", "context_tokens")
+
+
+def directory_size_mb(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)) / (1024 * 1024)
+
+
+def build_sweep_index(pages, chunk_size, chunk_overlap, embeddings, index_path):
+    """Cắt + embed + ghi một index flat tạm (cùng định dạng với build_data.py), trả về số chunk và thời gian build"""
+    import faiss
+    from src.docstore import write_docstore
+    from src.ingest_pipeline import make_text_splitter
+    start = time.perf_counter()
+    chunks = make_text_splitter(chunk_size, chunk_overlap).split_documents(pages)
+    vectors = np.asarray(embeddings.embed_documents([chunk.page_content for chunk in chunks]), dtype="float32")
+    index = faiss.IndexFlatL2(vectors.shape[1])
+    index.add(vectors)
+    os.makedirs(index_path, exist_ok=True)
+    faiss.write_index(index, os.path.join(index_path, "index.faiss"))
+    write_docstore(index_path, ((str(row), chunk.page_content, chunk.metadata) for row, chunk in enumerate(chunks)))
+    return len(chunks), time.perf_counter() - start
+
+
+def score_sweep_setting(db, questions, query_vectors, k, packer):
+    """recall@k theo trang đáp án, độ trễ tìm kiếm và số token ngữ cảnh trên bộ câu hỏi vàng"""
+    found, latencies, raw_tokens, packed_tokens = 0, [], [], []
+    for item, vector in zip(questions, query_vectors):
+        start = time.perf_counter()
+        _, rows = db.index.search(vector[None, :], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        documents = [db.docstore.search(db.index_to_docstore_id[int(row)]) for row in rows[0] if row != -1]
+        if any(doc.metadata["page"] in item["pages"] for doc in documents):
+            found += 1
+        _, stats = packer.pack(documents)
+        raw_tokens.append(stats["raw_tokens"])
+        packed_tokens.append(stats["packed_tokens"])
+    return {
+        "recall": round(found / len(questions), 4),
+        "search_p50_ms": round(float(np.percentile(latencies, 50)), 4),
+        "context_tokens": round(float(np.mean(raw_tokens)), 1),
+        "packed_tokens": round(float(np.mean(packed_tokens)), 1),
+    }
+
+
+def pareto_front(rows, objectives=PARETO_OBJECTIVES):
+    """Đánh dấu `pareto=True` cho các cấu hình không bị cấu hình nào khác trội hơn trên mọi mục tiêu"""
+    def at_least_as_good(a, b, metric):
+        return a[metric] >= b[metric] if SWEEP_METRICS[metric] else a[metric] <= b[metric]
+
+    for row in rows:
+        row["pareto"] = not any(
+            all(at_least_as_good(other, row, metric) for metric in objectives)
+            and any(other[metric] != row[metric] for metric in objectives)
+            for other in rows if other is not row)
+    return rows
+
+
+def run_sweep(golden_file=BENCHMARK_GOLDEN_FILE, chunk_sizes=(256, 384, 512, 768, 1024), chunk_overlaps=(0, 50, 100),
+              ks=(1, 2, 3, 5), stub_embeddings=False, objectives=PARETO_OBJECTIVES):
+    """Dựng index tạm cho từng cặp (chunk_size, chunk_overlap) trên các trang đã parse, chấm với từng k"""
+    from src.context_packer import ContextPacker
+    from src.index_factory import load_vector_store
+    from src.ingest_pipeline import list_pdf_files, iter_pages
+    from src.retrieval_cache import normalize_retrieval_query
+    with open(golden_file, "r", encoding="utf-8") as f:
+        questions = json.load(f)["questions"]
+    embeddings, embedding_name = make_embeddings(stub_embeddings)
+    # Trang đã trích được cache theo sha256 nên chỉ lần chạy đầu phải parse PDF
+    pages = list(iter_pages(list_pdf_files()))
+    # Câu hỏi được embed một lần, giống PackedRetriever (chuẩn hóa rồi embed_query)
+    query_vectors = np.asarray([embeddings.embed_query(normalize_retrieval_query(item["question"]))
+                                for item in questions], dtype="float32")
+    packer = ContextPacker()
+
+    rows = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for chunk_size in chunk_sizes:
+            for chunk_overlap in chunk_overlaps:
+                if chunk_overlap >= chunk_size:
+                    continue
+                index_path = os.path.join(work_dir, f"{chunk_size}_{chunk_overlap}")
+                chunk_count, build_seconds = build_sweep_index(pages, chunk_size, chunk_overlap, embeddings, index_path)
+                db = load_vector_store(index_path, embeddings)
+                index_mb = round(directory_size_mb(index_path), 3)
+                for k in ks:
+                    row = {"chunk_size": chunk_size, "chunk_overlap": chunk_overlap, "k": k, "chunks": chunk_count,
+                           "index_mb": index_mb, "build_s": round(build_seconds, 3)}
+                    row.update(score_sweep_setting(db, questions, query_vectors, k, packer))
+                    rows.append(row)
+                del db
+    return {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "golden_file": golden_file,
+            "questions": len(questions),
+            "pages": len(pages),
+            "embeddings": embedding_name,
+            "token_budget": packer.token_budget,
+            "pareto_objectives": {metric: "max" if SWEEP_METRICS[metric] else "min" for metric in objectives},
+        },
+        "settings": pareto_front(rows, objectives),
+    }
+
+
+# Câu truy vấn truy hồi trước khi tách (system prompt + lời người dùng) và sau khi tách (query_prep)
+QUERY_STRATEGIES = ("system_prompt", "prepared")
+QUERY_PREP_USER_INFO = {"name": "Người dùng", "age": 21}
+
+
+def make_query(strategy, question, matcher):
+    from src.query_prep import build_retrieval_query, render_system_prompt
+    if strategy == "system_prompt":
+        return render_system_prompt(QUERY_PREP_USER_INFO) + f"\n\nNgười dùng: {question}"
+    return build_retrieval_query(question, matcher.match(question))
+
+
+def run_query_prep(golden_file=BENCHMARK_GOLDEN_FILE, index_path=VECTOR_DB_PATH, ks=(1, 3, 5), repeat=3,
+                   stub_embeddings=False):
+    """So sánh câu truy vấn cũ (system prompt + câu hỏi) với câu truy vấn đã chuẩn bị: recall@k trên bộ câu hỏi
+    vàng, độ dài câu truy vấn và thời gian embed mỗi câu (không cache)"""
+    from src.context_packer import ContextPacker
+    from src.index_factory import load_vector_store
+    from src.keyword_matcher import load_keyword_matcher
+    from src.retrieval_cache import normalize_retrieval_query
+    with open(golden_file, "r", encoding="utf-8") as f:
+        questions = json.load(f)["questions"]
+    embeddings, embedding_name = make_embeddings(stub_embeddings)
+    matcher = load_keyword_matcher()
+    packer = ContextPacker()
+    rows = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        if embedding_name == "stub":
+            # Index thật được embed bằng mô hình khác; dựng index tạm cùng cấu hình cắt chunk với build_data.py
+            from src.global_settings import CHUNK_SIZE, CHUNK_OVERLAP
+            from src.ingest_pipeline import list_pdf_files, iter_pages
+            index_path = os.path.join(work_dir, "index")
+            build_sweep_index(list(iter_pages(list_pdf_files())), CHUNK_SIZE, CHUNK_OVERLAP, embeddings, index_path)
+        db = load_vector_store(index_path, embeddings)
+        for strategy in QUERY_STRATEGIES:
+            queries = [normalize_retrieval_query(make_query(strategy, item["question"], matcher)) for item in questions]
+            timings, vectors = [], []
+            for query in queries:
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    vector = embeddings.embed_query(query)
+                    timings.append((time.perf_counter() - start) * 1000)
+                vectors.append(vector)
+            vectors = np.asarray(vectors, dtype="float32")
+            for k in ks:
+                row = {"strategy": strategy, "k": k, "query_chars": round(float(np.mean([len(q) for q in queries])), 1),
+                       "embed_p50_ms": round(float(np.percentile(timings, 50)), 3),
+                       "embed_mean_ms": round(float(np.mean(timings)), 3)}
+                row.update(score_sweep_setting(db, questions, vectors, k, packer))
+                rows.append(row)
+        del db
+    return {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "golden_file": golden_file,
+            "questions": len(questions),
+            "embeddings": embedding_name,
+            "repeat": repeat,
+        },
+        "settings": rows,
+    }
+
+
+def query_prep_regressions(report, tolerance=0.0):
+    """Các k mà recall của câu truy vấn đã chuẩn bị thấp hơn câu truy vấn cũ quá `tolerance`"""
+    by_key = {(row["strategy"], row["k"]): row for row in report["settings"]}
+    problems = []
+    for (strategy, k), row in sorted(by_key.items()):
+        baseline = by_key.get(("system_prompt", k))
+        if strategy == "prepared" and baseline and row["recall"] < baseline["recall"] - tolerance:
+            problems.append(f"recall@{k}: {baseline['recall']} -> {row['recall']}")
+    return problems
+
+
+def print_query_prep(report):
+    print(f"{report['meta']['questions']} câu hỏi, embedding={report['meta']['embeddings']}")
+    print(f"{'câu truy vấn':<14} {'k':>3} {'recall':>7} {'ký tự':>7} {'embed p50':>10} {'embed TB':>9} {'ctx tok':>8}")
+    for row in report["settings"]:
+        print(f"{row['strategy']:<14} {row['k']:>3} {row['recall']:>7.3f} {row['query_chars']:>7.1f} "
+              f"{row['embed_p50_ms']:>10.3f} {row['embed_mean_ms']:>9.3f} {row['context_tokens']:>8.1f}")
+
+
+def print_sweep(report):
+    print(f"{report['meta']['questions']} câu hỏi, {report['meta']['pages']} trang, embedding={report['meta']['embeddings']}")
+    print(f"{'':1} {'size':>5} {'overlap':>7} {'k':>3} {'chunks':>6} {'recall':>7} {'ctx tok':>8} {'packed':>7} "
+          f"{'index MB':>9} {'build s':>8} {'p50 ms':>8}")
+    for row in sorted(report["settings"], key=lambda r: (-r["recall"], r["context_tokens"])):
+        print(f"{'*' if row['pareto'] else ' ':1} {row['chunk_size']:>5} {row['chunk_overlap']:>7} {row['k']:>3} "
+              f"{row['chunks']:>6} {row['recall']:>7.3f} {row['context_tokens']:>8.1f} {row['packed_tokens']:>7.1f} "
+              f"{row['index_mb']:>9.3f} {row['build_s']:>8.2f} {row['search_p50_ms']:>8.4f}")
+    objectives = ", ".join(f"{metric} {goal}" for metric, goal in report["meta"]["pareto_objectives"].items())
+    print(f"* = thuộc biên Pareto ({objectives})")
+
 
 if __name__ == "__main__":
-    print(evaluate_system())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Benchmark độ trễ pipeline chat")
+    parser.add_argument("--corpus", default=BENCHMARK_CORPUS_FILE, help="file JSON chứa các bộ câu nhập")
+    parser.add_argument("--index-path", default=VECTOR_DB_PATH)
+    parser.add_argument("--repeat", type=int, default=5, help="số lần lặp mỗi bộ câu nhập")
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="độ trễ giả lập của StubLLM (giây)")
+    parser.add_argument("--stub-embeddings", action="store_true", help="dùng embedding giả lập kể cả khi có file mô hình")
+    parser.add_argument("--output", help="ghi báo cáo JSON ra file (mặc định in ra stdout)")
+    parser.add_argument("--baseline", default=BENCHMARK_BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true", help="ghi báo cáo làm baseline mới")
+    parser.add_argument("--compare", action="store_true", help="so với baseline, exit code 1 nếu hồi quy")
+    parser.add_argument("--threshold", type=float, default=0.25, help="tỷ lệ chậm đi tối đa cho phép")
+    parser.add_argument("--stage-threshold", action="append", help="ngưỡng riêng từng giai đoạn, ví dụ llm=0.5")
+    parser.add_argument("--min-delta-ms", type=float, default=0.5, help="bỏ qua chênh lệch tuyệt đối nhỏ hơn giá trị này")
+    parser.add_argument("--sweep", action="store_true", help="quét tham số chunk/k thay vì đo độ trễ pipeline")
+    parser.add_argument("--golden", default=BENCHMARK_GOLDEN_FILE, help="bộ câu hỏi -> trang đáp án cho --sweep")
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=[256, 384, 512, 768, 1024])
+    parser.add_argument("--chunk-overlaps", type=int, nargs="+", default=[0, 50, 100])
+    parser.add_argument("--ks", type=int, nargs="+", default=[1, 2, 3, 5])
+    parser.add_argument("--pareto", nargs="+", choices=list(SWEEP_METRICS), default=list(PARETO_OBJECTIVES),
+                        help="các chỉ số dùng làm mục tiêu của biên Pareto")
+    parser.add_argument("--query-prep", action="store_true",
+                        help="so sánh câu truy vấn cũ (system prompt + câu hỏi) với câu truy vấn đã chuẩn bị")
+    args = parser.parse_args()
+
+    if args.query_prep:
+        report = run_query_prep(args.golden, args.index_path, args.ks, max(1, args.repeat), args.stub_embeddings)
+        print_query_prep(report)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+        problems = query_prep_regressions(report)
+        if problems:
+            print("Chất lượng truy hồi giảm: " + "; ".join(problems))
+            sys.exit(1)
+        print("Chất lượng truy hồi không giảm.")
+        sys.exit(0)
+
+    if args.sweep:
+        report = run_sweep(args.golden, args.chunk_sizes, args.chunk_overlaps, args.ks, args.stub_embeddings,
+                           args.pareto)
+        print_sweep(report)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+        sys.exit(0)
+
+    report = run_benchmark(args.corpus, args.index_path, args.repeat, args.warmup, args.llm_latency, args.stub_embeddings)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    else:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Đã lưu baseline vào {args.baseline}")
+    if args.compare:
+        if not os.path.exists(args.baseline):
+            sys.exit(f"Chưa có baseline {args.baseline}, chạy với --save-baseline trước.")
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_reports(report, baseline, args.threshold, parse_stage_thresholds(args.stage_threshold),
+                                      args.min_delta_ms)
+        if regressions:
+            print("Phát hiện hồi quy so với baseline:")
+            for line in regressions:
+                print(f"  - {line}")
+            sys.exit(1)
+        print("Không có hồi quy so với baseline.")
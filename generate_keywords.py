@@ -1,5 +1,5 @@
+import csv
 import os
-import pandas as pd
 import random
 import time
 
@@ -79,8 +79,10 @@ def generate_keywords(base_keywords, num_keywords, prefixes=None, suffixes=None,
 
 def save_to_csv(keywords, filename):
     """Lưu danh sách từ khóa vào file CSV"""
-    df = pd.DataFrame(keywords, columns=["keyword"])
-    df.to_csv(filename, index=False, encoding="utf-8")
+    with open(filename, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow(["keyword"])
+        writer.writerows([keyword] for keyword in keywords)
     print(f"Đã lưu {len(keywords)} từ khóa vào {filename}")
 
 def generate_all_keywords(num_keywords):
@@ -0,0 +1,57 @@
+# pages/admin.py
+import streamlit as st
+import sys
+import os
+import time
+
+# Thêm thư mục gốc (Project/) vào sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.authenticate import is_admin
+from src.tracing import METRICS, is_enabled
+
+st.set_page_config(page_title="Quản trị", layout="wide", initial_sidebar_state="expanded")
+st.markdown("<h1 style='text-align: center;'>Số liệu hệ thống</h1>", unsafe_allow_html=True)
+
+# Kiểm tra trạng thái đăng nhập và quyền quản trị
+if "logged_in" not in st.session_state or not st.session_state["logged_in"]:
+    st.error("Vui lòng đăng nhập trước khi truy cập trang quản trị.")
+    st.markdown("[Quay lại Trang chủ](./home.py)")
+    st.stop()
+if not is_admin(st.session_state.get("username")):
+    st.error("Trang này chỉ dành cho quản trị viên.")
+    st.stop()
+
+if not is_enabled():
+    st.warning("Tracing đang tắt (TRACING_ENABLED=0), không có số liệu mới.")
+
+refresh_seconds = st.sidebar.selectbox("Tự làm mới (giây)", [0, 2, 5, 10, 30], index=2)
+
+
+@st.fragment(run_every=refresh_seconds or None)
+def render_metrics():
+    st.subheader("Độ trễ theo giai đoạn (ms)")
+    stages = METRICS.stage_summary()
+    if stages:
+        st.dataframe(stages, width="stretch", hide_index=True)
+    else:
+        st.info("Chưa có số liệu. Hãy trò chuyện ở trang Trò chuyện để sinh số liệu.")
+
+    st.subheader("Bộ đếm")
+    counters = [{"name": row["name"], "labels": ", ".join(f"{k}={v}" for k, v in sorted(row["labels"].items())),
+                 "value": row["value"]} for row in METRICS.counter_summary()]
+    if counters:
+        st.dataframe(counters, width="stretch", hide_index=True)
+
+    st.subheader("Các lượt xử lý gần nhất")
+    for trace in reversed(list(METRICS.recent_traces)):
+        stages_text = ", ".join(f"{name} {ms} ms" for name, ms in trace["stages"]) or "-"
+        error = f" — lỗi {trace['error']}" if trace["error"] else ""
+        started = time.strftime("%H:%M:%S", time.localtime(trace["time"]))
+        st.write(f"`{started}` **{trace['name']}** {trace['total_ms']} ms{error}: {stages_text}")
+
+    st.download_button("Tải số liệu (Prometheus)", METRICS.to_prometheus(), file_name="metrics.prom",
+                       mime="text/plain")
+
+
+render_metrics()
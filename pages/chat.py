@@ -4,6 +4,7 @@ import sys
 import os
 from src.bot_logic import BotLogic
 from src.slide_bar import render_sidebar
+from src.conversation_view import get_conversation_window, render_load_older
 
 # Thêm thư mục gốc (Project/) vào sys.path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -24,10 +25,10 @@ user_info = st.session_state.get("user_info", {"name": "Người dùng Demo", "a
 # Khởi tạo session state
 if "conversations" not in st.session_state:
     st.session_state.conversations = []
-if "current_conversation" not in st.session_state:
-    st.session_state.current_conversation = []
 if "current_conversation_name" not in st.session_state:
     st.session_state.current_conversation_name = None
+if "current_conversation_id" not in st.session_state:
+    st.session_state.current_conversation_id = None
 if "show_history" not in st.session_state:
     st.session_state.show_history = False
 if "show_search" not in st.session_state:
@@ -40,19 +41,26 @@ if "current_options" not in st.session_state:
     st.session_state.current_options = []
 if "last_prompt" not in st.session_state:
     st.session_state.last_prompt = ""
+if "current_emotion" not in st.session_state:
+    st.session_state.current_emotion = None
 
-# Khởi tạo BotLogic với username và user_info
-try:
-    bot = BotLogic(username=username, user_info=user_info)
-except Exception as e:
-    st.error(f"Lỗi khi khởi tạo chatbot: {str(e)}. Vui lòng kiểm tra Vector DB và mô hình.")
-    st.stop()
+# Khởi tạo BotLogic một lần cho mỗi session; FAISS và mô hình embedding nằm trong registry dùng chung
+if "bot" not in st.session_state or st.session_state.get("bot_username") != username:
+    try:
+        st.session_state.bot = BotLogic(username=username, user_info=user_info)
+        st.session_state.bot_username = username
+    except Exception as e:
+        st.error(f"Lỗi khi khởi tạo chatbot: {str(e)}. Vui lòng kiểm tra Vector DB và mô hình.")
+        st.stop()
+bot = st.session_state.bot
 
 # Hiển thị sidebar
-render_sidebar()
+render_sidebar(username)
 
-# Hiển thị tin nhắn
-for message in st.session_state.current_conversation:
+# Hiển thị tin nhắn: chỉ cửa sổ tin nhắn gần nhất, tin nhắn cũ hơn nạp theo trang
+window = get_conversation_window()
+render_load_older(window, st, "chat")
+for message in window.messages():
     with st.chat_message(message["role"]):
         st.markdown(message["content"])
         if "question" in message and "options" in message:
@@ -68,7 +76,8 @@ if st.session_state.waiting_for_answer:
         answer = st.radio("Chọn mức độ:", st.session_state.current_options, key="answer_radio")
         if st.button("Gửi đáp án"):
             try:
-                response = bot.process_answer(st.session_state.last_prompt, st.session_state.current_question, answer)
+                response = bot.process_answer(st.session_state.last_prompt, st.session_state.current_question, answer,
+                                            st.session_state.current_emotion)
                 # Lưu câu hỏi và lựa chọn trước khi xóa trạng thái
                 bot.save_message("assistant", f"**Câu hỏi**: {st.session_state.current_question}\n\n{response}", 
                                 question=st.session_state.current_question, 
@@ -88,10 +97,11 @@ if prompt := st.chat_input("Chia sẻ cảm xúc của bạn, tôi sẽ lắng n
     try:
         bot.save_message("user", prompt, prompt)
         st.session_state.last_prompt = prompt
-        result = bot.process_input(prompt)
+        result = bot.process_input(prompt, stream=True)
         if result["question"]:
             st.session_state.current_question = result["question"]
             st.session_state.current_options = result["options"]
+            st.session_state.current_emotion = result.get("emotion")
             st.session_state.waiting_for_answer = True
             with st.chat_message("assistant"):
                 st.markdown(result["response"])
@@ -101,8 +111,13 @@ if prompt := st.chat_input("Chia sẻ cảm xúc của bạn, tôi sẽ lắng n
                             question=result["question"], options=result["options"])
         else:
             with st.chat_message("assistant"):
-                st.markdown(result["response"])
-            bot.save_message("assistant", result["response"])
+                if isinstance(result["response"], str):
+                    response = result["response"]
+                    st.markdown(response)
+                else:
+                    # Hiển thị token ngay khi tới; write_stream trả về toàn văn để lưu lịch sử
+                    response = st.write_stream(result["response"])
+            bot.save_message("assistant", response)
         st.rerun()
     except Exception as e:
         st.error(f"Lỗi khi xử lý tin nhắn: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,170 @@
+# src/answer_bank.py
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from src.global_settings import ANSWER_BANK_FILE, STUB_ANSWER_BANK_FILE, VECTOR_DB_PATH
+from src.common.utils import logger, index_version
+
+ANSWER_BANK_VERSION = 2
+# `_llm_type` của các LLM giả lập: câu trả lời của chúng không bao giờ được phục vụ như answer bank thật
+STUB_LLM_TYPES = {"stub"}
+NOT_FOUND_ANSWER = "Không tìm thấy thông tin phù hợp trong DSM-5."
+
+# Thang đo 5 lựa chọn của câu hỏi trắc nghiệm và mức độ tương ứng
+SEVERITY_OPTIONS = ["Không bao giờ", "Hiếm khi", "Đôi khi", "Thường xuyên", "Luôn luôn"]
+SEVERITY_MAPPING = {"Không bao giờ": "nhẹ", "Hiếm khi": "nhẹ", "Đôi khi": "trung bình", "Thường xuyên": "nặng", "Luôn luôn": "rất nặng"}
+SEVERITIES = list(dict.fromkeys(SEVERITY_MAPPING.values()))
+# Danh sách cảm xúc tích cực
+POSITIVE_EMOTIONS = ["vui", "hạnh phúc", "phấn khởi", "hào hứng", "yêu đời", "thư giãn"]
+
+
+def severity_query(emotion, severity):
+    """Câu truy vấn gửi qa_chain cho một ô (cảm xúc, mức độ)"""
+    if emotion in POSITIVE_EMOTIONS:
+        # Với cảm xúc tích cực, trả lời tích cực và gợi ý duy trì trạng thái
+        return f"Ý nghĩa của cảm xúc {emotion} trong sức khỏe tâm thần và gợi ý duy trì trạng thái tích cực"
+    # Với cảm xúc tiêu cực, phân tích theo DSM-5
+    return f"Tiêu chuẩn chẩn đoán rối loạn {emotion} theo DSM-5 với mức độ {severity}"
+
+
+def severity_scope(emotion, severity):
+    """Phạm vi cache câu trả lời của một ô: các câu truy vấn mức độ chỉ khác nhau một từ
+    ("nặng" / "rất nặng") nên tầng tương đồng ngữ nghĩa không được ghép chéo giữa các ô.
+    Cảm xúc tích cực có cùng câu truy vấn cho mọi mức độ nên dùng chung một phạm vi"""
+    if emotion in POSITIVE_EMOTIONS:
+        return f"severity|{emotion}"
+    return f"severity|{emotion}|{severity}"
+
+
+def llm_name(llm):
+    """Tên LLM sinh câu trả lời, được ghi vào answer bank (ví dụ "groq-chat:llama3-8b-8192" hoặc "stub")"""
+    llm_type = getattr(llm, "_llm_type", type(llm).__name__)
+    model_name = getattr(llm, "model_name", None)
+    return f"{llm_type}:{model_name}" if model_name else llm_type
+
+
+def is_stub_llm(name):
+    return name is None or name.split(":", 1)[0] in STUB_LLM_TYPES
+
+
+def format_severity_answer(emotion, severity, result):
+    if emotion in POSITIVE_EMOTIONS:
+        return f"Dựa trên mức độ {severity}, cảm xúc {emotion} của bạn cho thấy một trạng thái tích cực. {result}"
+    return f"Dựa trên mức độ {severity}, {result}"
+
+
+class AnswerBank:
+    """Bảng câu trả lời tính sẵn cho từng (cảm xúc, mức độ), tra cứu O(1)"""
+
+    def __init__(self, entries=None, index_fingerprint=None, llm=None):
+        self.entries = entries or {}
+        self.index_fingerprint = index_fingerprint
+        self.llm = llm
+
+    def get(self, emotion, severity):
+        cell = self.entries.get(emotion, {}).get(severity)
+        return cell["answer"] if cell else None
+
+    def __len__(self):
+        return sum(len(cells) for cells in self.entries.values())
+
+
+def load_answer_bank(bank_file=ANSWER_BANK_FILE, index_path=VECTOR_DB_PATH, allow_stub=False):
+    """Nạp answer bank; bỏ qua nếu sai phiên bản, được tính trên một index khác hoặc do LLM giả lập sinh ra
+    (trừ khi `allow_stub`, dùng cho test/benchmark offline)"""
+    if not os.path.exists(bank_file):
+        return AnswerBank()
+    try:
+        with open(bank_file, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Không đọc được answer bank {bank_file}: {e}")
+        return AnswerBank()
+    if data.get("version") != ANSWER_BANK_VERSION:
+        logger.warning("Answer bank khác phiên bản, sẽ sinh câu trả lời trực tiếp.")
+        return AnswerBank()
+    if data.get("index_fingerprint") != index_version(index_path):
+        logger.warning("Answer bank được tính trên index cũ, sẽ sinh câu trả lời trực tiếp.")
+        return AnswerBank()
+    if is_stub_llm(data.get("llm")) and not allow_stub:
+        logger.warning(f"Answer bank {bank_file} do LLM giả lập ({data.get('llm')}) sinh ra, sẽ sinh câu trả lời trực tiếp.")
+        return AnswerBank()
+    return AnswerBank(data["entries"], data["index_fingerprint"], data["llm"])
+
+
+def default_answer_bank_file(llm):
+    """File answer bank theo LLM: LLM giả lập ghi vào file riêng, không bao giờ ghi đè answer bank thật"""
+    return STUB_ANSWER_BANK_FILE if is_stub_llm(llm) else ANSWER_BANK_FILE
+
+
+def build_answer_bank(qa_chain, emotions, llm, bank_file=None, index_path=VECTOR_DB_PATH, max_workers=4):
+    """Tính sẵn ngữ cảnh truy hồi và câu trả lời cho mọi ô (cảm xúc, mức độ).
+
+    `llm` là tên LLM của qa_chain (`llm_name`), được ghi vào answer bank và từng ô của file `.partial.jsonl`.
+    Mỗi ô xong được ghi nối vào file `.partial.jsonl`, nên khi bị ngắt giữa chừng, lần chạy sau (cùng index,
+    cùng LLM) chỉ tính các ô còn thiếu. `max_workers` giới hạn số lời gọi LLM đồng thời.
+    """
+    from src.llm_client import llm_priority, PRIORITY_BATCH
+    bank_file = bank_file or default_answer_bank_file(llm)
+    if is_stub_llm(llm) and os.path.abspath(bank_file) == os.path.abspath(ANSWER_BANK_FILE):
+        raise ValueError(f"Không ghi câu trả lời của LLM giả lập ({llm}) vào answer bank thật ({ANSWER_BANK_FILE})")
+    fingerprint = index_version(index_path)
+    partial_file = bank_file + ".partial.jsonl"
+    entries = {}
+    if os.path.exists(partial_file):
+        with open(partial_file, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    cell = json.loads(line)
+                except ValueError:
+                    continue  # dòng cuối có thể bị ghi dở khi tiến trình bị ngắt
+                if cell.get("index_fingerprint") == fingerprint and cell.get("llm") == llm:
+                    entries.setdefault(cell["emotion"], {})[cell["severity"]] = cell["value"]
+
+    # Cảm xúc tích cực không phụ thuộc mức độ nên chỉ cần một lời gọi, dùng chung cho mọi mức độ
+    queries = {}
+    for emotion in dict.fromkeys(emotions):
+        for severity in SEVERITIES:
+            if severity not in entries.get(emotion, {}):
+                queries.setdefault(severity_query(emotion, severity), []).append((emotion, severity))
+    logger.info(f"Answer bank: {len(entries)} cảm xúc đã có, còn {len(queries)} truy vấn cần tính.")
+
+    write_lock = threading.Lock()
+
+    def compute(query):
+        # Job nền: nhường chỗ cho các lời gọi tương tác trong hàng đợi LLM
+        with llm_priority(PRIORITY_BATCH):
+            response = qa_chain.invoke({"query": query})
+        pages = sorted({doc.metadata.get("page") for doc in response.get("source_documents", [])
+                        if doc.metadata.get("page") is not None})
+        return {"answer": response.get("result", NOT_FOUND_ANSWER), "pages": pages}
+
+    with open(partial_file, "a", encoding="utf-8") as partial, ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(compute, query): cells for query, cells in queries.items()}
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                value = future.result()
+            except Exception as e:
+                logger.error(f"Answer bank: lỗi khi tính {futures[future][0]}: {e}")
+                continue
+            with write_lock:
+                for emotion, severity in futures[future]:
+                    entries.setdefault(emotion, {})[severity] = value
+                    partial.write(json.dumps({"index_fingerprint": fingerprint, "llm": llm, "emotion": emotion,
+                                              "severity": severity, "value": value}, ensure_ascii=False) + "\n")
+                partial.flush()
+            if done % 50 == 0:
+                logger.info(f"Answer bank: {done}/{len(futures)} truy vấn")
+
+    os.makedirs(os.path.dirname(bank_file) or ".", exist_ok=True)
+    with open(bank_file + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"version": ANSWER_BANK_VERSION, "index_fingerprint": fingerprint, "llm": llm, "entries": entries},
+                  f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(bank_file + ".tmp", bank_file)
+    missing = sum(1 for cells in queries.values() for emotion, severity in cells
+                  if severity not in entries.get(emotion, {}))
+    if not missing:
+        os.remove(partial_file)
+    logger.info(f"Answer bank: đã ghi {sum(len(c) for c in entries.values())} ô vào {bank_file}, thiếu {missing} ô.")
+    return AnswerBank(entries, fingerprint, llm)
@@ -0,0 +1,177 @@
+# src/answer_cache.py
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from array import array
+import numpy as np
+import faiss
+from langchain_core.documents import Document
+from src.keyword_matcher import normalize_text
+from src.global_settings import (
+    ANSWER_CACHE_FILE, ANSWER_CACHE_SIMILARITY, ANSWER_CACHE_TTL_SECONDS, ANSWER_CACHE_MAX_ENTRIES,
+)
+from src.common.utils import logger
+
+
+def normalize_query(query):
+    """Chuẩn hóa câu hỏi cho tầng khớp chính xác: NFC, chữ thường, gộp khoảng trắng"""
+    return " ".join(normalize_text(query).split()).strip(" ?!.")
+
+
+def scope_key(scope):
+    """Câu trả lời chỉ dùng chung giữa các truy vấn có cùng ngữ cảnh sinh (ví dụ cùng system prompt)"""
+    return hashlib.sha256(scope.encode("utf-8")).hexdigest()[:16] if scope else ""
+
+
+class SemanticAnswerCache:
+    """Cache câu trả lời đặt trước qa_chain.invoke.
+
+    - Tầng 1: khớp chính xác câu hỏi đã chuẩn hóa.
+    - Tầng 2: độ tương đồng cosine giữa embedding câu hỏi (FAISS, inner product) >= ngưỡng.
+    Dữ liệu lưu trong SQLite (WAL) dưới data/cache nên còn sau khi khởi động lại và dùng chung
+    được giữa nhiều tiến trình; có TTL và loại bỏ theo LRU.
+    """
+
+    def __init__(self, embedding_model, cache_file=ANSWER_CACHE_FILE, similarity_threshold=ANSWER_CACHE_SIMILARITY,
+                 ttl_seconds=ANSWER_CACHE_TTL_SECONDS, max_entries=ANSWER_CACHE_MAX_ENTRIES):
+        self.embedding_model = embedding_model
+        self.cache_file = cache_file
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._index_lock = threading.Lock()
+        self._indexes = {}
+        self._index_ids = {}
+        self._index_state = None
+        self.counters = {"exact_hits": 0, "semantic_hits": 0, "misses": 0}
+        self._counters_lock = threading.Lock()
+        os.makedirs(os.path.dirname(cache_file) or ".", exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, scope TEXT NOT NULL, query TEXT NOT NULL, "
+                "vector BLOB NOT NULL, result TEXT NOT NULL, sources TEXT NOT NULL, "
+                "created_at REAL NOT NULL, last_used REAL NOT NULL, UNIQUE(scope, query))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS answers_last_used ON answers(last_used)")
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.cache_file, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _embed(self, normalized):
+        vector = np.asarray(self.embedding_model.embed_query(normalized), dtype="float32")
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _sync_indexes(self, conn):
+        """Cập nhật chỉ mục tương đồng khi bảng đã bị tiến trình khác (hoặc luồng khác) thay đổi.
+
+        Chỉ thêm các dòng mới (id lớn hơn id đã nạp) và gỡ các id đã bị xóa (TTL/LRU/ghi đè);
+        vector của các dòng cũ không phải đọc lại.
+        """
+        state = conn.execute("SELECT COUNT(*), COALESCE(MAX(id), 0), COALESCE(SUM(id), 0) FROM answers").fetchone()
+        if state == self._index_state:
+            return
+        known_count, known_max, known_sum = self._index_state or (0, 0, 0)
+        new_rows = conn.execute("SELECT id, scope, vector FROM answers WHERE id > ?", (known_max,)).fetchall()
+        for row_id, scope, blob in new_rows:
+            vector = np.frombuffer(blob, dtype="float32")
+            index = self._indexes.get(scope)
+            if index is None:
+                index = self._indexes[scope] = faiss.IndexIDMap(faiss.IndexFlatIP(len(vector)))
+                self._index_ids[scope] = set()
+            index.add_with_ids(vector.reshape(1, -1), np.array([row_id], dtype="int64"))
+            self._index_ids[scope].add(row_id)
+        expected = (known_count + len(new_rows), max([known_max] + [row[0] for row in new_rows]),
+                    known_sum + sum(row[0] for row in new_rows))
+        if expected != tuple(state):
+            # Có dòng đã bị xóa: so danh sách id (không đọc vector) để gỡ khỏi chỉ mục
+            live = {row_id for (row_id,) in conn.execute("SELECT id FROM answers")}
+            for scope, ids in self._index_ids.items():
+                removed = ids - live
+                if removed:
+                    self._indexes[scope].remove_ids(np.array(sorted(removed), dtype="int64"))
+                    ids -= removed
+        self._index_state = tuple(state)
+
+    def _row_to_response(self, result, sources):
+        documents = [Document(page_content=doc["page_content"], metadata=doc["metadata"]) for doc in json.loads(sources)]
+        return {"result": result, "source_documents": documents, "cached": True}
+
+    def get(self, query, scope=""):
+        normalized = normalize_query(query)
+        scope = scope_key(scope)
+        conn = self._connection()
+        now = time.time()
+        oldest = now - self.ttl_seconds
+        row = conn.execute(
+            "SELECT id, result, sources FROM answers WHERE scope = ? AND query = ? AND created_at >= ?",
+            (scope, normalized, oldest),
+        ).fetchone()
+        if row:
+            self._count("exact_hits")
+        else:
+            with self._index_lock:
+                self._sync_indexes(conn)
+                index = self._indexes.get(scope)
+                if index is not None and index.ntotal:
+                    scores, ids = index.search(self._embed(normalized).reshape(1, -1), 1)
+                    if ids[0][0] != -1 and scores[0][0] >= self.similarity_threshold:
+                        row = conn.execute(
+                            "SELECT id, result, sources FROM answers WHERE id = ? AND created_at >= ?",
+                            (int(ids[0][0]), oldest),
+                        ).fetchone()
+            if row:
+                self._count("semantic_hits")
+        if not row:
+            self._count("misses")
+            return None
+        with conn:
+            conn.execute("UPDATE answers SET last_used = ? WHERE id = ?", (now, row[0]))
+        return self._row_to_response(row[1], row[2])
+
+    def put(self, query, response, scope=""):
+        normalized = normalize_query(query)
+        sources = [
+            {"page_content": doc.page_content, "metadata": doc.metadata}
+            for doc in response.get("source_documents", [])
+        ]
+        now = time.time()
+        conn = self._connection()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO answers (scope, query, vector, result, sources, created_at, last_used) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (scope_key(scope), normalized, array("f", self._embed(normalized)).tobytes(),
+                     response.get("result", ""), json.dumps(sources, ensure_ascii=False, default=str), now, now),
+                )
+                conn.execute("DELETE FROM answers WHERE created_at < ?", (now - self.ttl_seconds,))
+                conn.execute(
+                    "DELETE FROM answers WHERE id IN (SELECT id FROM answers ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Không ghi được cache câu trả lời: {e}")
+
+    def _count(self, name):
+        # get() chạy đồng thời từ nhiều session/worker thread: "+= 1" trên dict không nguyên tử
+        with self._counters_lock:
+            self.counters[name] += 1
+
+    def stats(self):
+        with self._counters_lock:
+            counters = dict(self.counters)
+        lookups = sum(counters.values())
+        hits = counters["exact_hits"] + counters["semantic_hits"]
+        return dict(counters, hit_rate=round(hits / lookups, 3) if lookups else 0.0)
@@ -1,5 +1,12 @@
+from src.global_settings import ADMIN_USERS
+
+
 def authenticate_user(username, password):
     
     valid_users = {"user1": "pass123",
                     "admin": "admin456"}
-    return valid_users.get(username) == password
\ No newline at end of file
+    return valid_users.get(username) == password
+
+
+def is_admin(username):
+    return username in ADMIN_USERS
@@ -1,14 +1,26 @@
 import streamlit as st
 from src.conversation_engine import ConversationEngine
-from src.global_settings import CHAT_HISTORY_FILE
+from src.history_store import get_history_store
+from src.conversation_view import get_conversation_window
+from src.tracing import span
 from datetime import datetime
 
+ROUTE_DIRECT_QUERY = "direct_query"
+ROUTE_SEVERITY_QUESTION = "severity_question"
+ROUTE_UNCLEAR = "unclear"
+
 class BotLogic:
-    def __init__(self, username: str = "demo_user", user_info: dict = {"name": "Người dùng", "age": 21}):
+    def __init__(self, username: str = "demo_user", user_info: dict = {"name": "Người dùng", "age": 21}, resources=None,
+                 history=None):
         # Khởi tạo ConversationEngine với username và user_info mặc định
-        self.engine = ConversationEngine(username=username, user_info=user_info)
+        self.engine = ConversationEngine(username=username, user_info=user_info, resources=resources)
+        self.history = history or get_history_store()
 
-    def process_input(self, prompt):
+    def process_input(self, prompt, stream=False):
+        """Định tuyến câu nhập; với stream=True, câu trả lời trực tiếp là generator các token"""
+        # Câu nhập mới: câu hỏi mức độ cũ (nếu có) không còn được trả lời
+        self.engine.discard_prefetch()
+        self.engine.refresh_resources()
         if not prompt.strip():
             return {
                 "question": None,
@@ -20,36 +32,13 @@ class BotLogic:
                 )
             }
         
-        prompt_lower = prompt.lower()
-        direct_query_keywords = [
-            "hỏi", "tìm hiểu", "thông tin", "giải thích", "là gì", "tại sao", "như thế nào",
-            "dsm-5", "tiêu chuẩn", "chẩn đoán", "rối loạn", "tâm lý", "triệu chứng", "điều trị",
-            "phương pháp", "nguyên nhân", "hành vi", "phân loại", "yếu tố", "cách chữa",
-            "đặc điểm", "hiệu quả", "liệu pháp", "thống kê", "nghiên cứu", "tác động",
-            "phân tích", "đánh giá", "quy trình", "hỗ trợ"
-        ]
-        emotion_keywords = [
-            "buồn", "vui", "hạnh phúc", "lo âu", "lo lắng", "stress", "áp lực", "căng thẳng", "mệt mỏi",
-            "tức giận", "sợ hãi", "hoang mang", "chán nản", "tự tin", "thất vọng", "hy vọng",
-            "sợ sệt", "bồn chồn", "phấn khởi", "u uất", "trầm cảm", "hào hứng", "mất ngủ",
-            "kích động", "thư giãn", "buồn chán", "tổn thương", "yêu đời"
-        ]
-        personal_keywords = [
-            "tôi", "mình", "tớ", "chúng tôi", "bạn tôi", "gia đình tôi", "bản thân",
-            "cảm giác của tôi", "tâm trạng tôi", "sức khỏe tôi", "cơ thể tôi", "cuộc sống tôi",
-            "ngày của tôi", "tuần của tôi", "tháng của tôi", "năm của tôi", "hôm nay tôi",
-            "đêm qua tôi", "sáng nay tôi", "hôm qua tôi", "tôi cảm thấy", "tôi nghĩ",
-            "tôi muốn", "tôi cần", "tôi đang", "tôi đã"
-        ]
-        
-        # Kiểm tra truy vấn DSM-5: trả lời ngay mà không sinh câu hỏi trắc nghiệm
-        if any(keyword in prompt_lower for keyword in direct_query_keywords):
-            return self.engine.process_direct_query(prompt)
-
-        # Kiểm tra truy vấn liên quan đến người dùng (có từ khóa cá nhân và cảm xúc)
-        if any(keyword in prompt_lower for keyword in personal_keywords):
-            if any(keyword in prompt_lower for keyword in emotion_keywords):
-                return self.engine.generate_question(prompt)
+        # Bộ phân loại trả về tên nhánh (ROUTE_*) và cảm xúc trong một lần tính
+        with span("routing"):
+            prediction = self.engine.classify(prompt)
+        if prediction.intent == ROUTE_DIRECT_QUERY:
+            return self.engine.process_direct_query(prompt, stream=stream)
+        if prediction.intent == ROUTE_SEVERITY_QUESTION:
+            return self.engine.generate_question(prompt, prediction.emotion)
 
         # Phản hồi mặc định nếu không khớp với các điều kiện trên
         return {
@@ -62,8 +51,9 @@ class BotLogic:
             )
         }
 
-    def process_answer(self, prompt, question, answer):
-        return self.engine.process_answer(prompt, question, answer)
+    def process_answer(self, prompt, question, answer, emotion=None):
+        self.engine.refresh_resources()
+        return self.engine.process_answer(prompt, question, answer, emotion)
 
     def save_message(self, role, content, prompt=None, question=None, options=None):
         current_time = datetime.now().strftime("%H:%M:%S %d-%m-%Y")
@@ -71,6 +61,14 @@ class BotLogic:
         if question and options:
             message["question"] = question
             message["options"] = options
-        if not st.session_state.current_conversation:
+        # Cuộc hội thoại được tạo khi có tin nhắn đầu tiên; mỗi tin nhắn sau đó là một lần ghi nối thêm
+        if not st.session_state.get("current_conversation_id"):
             st.session_state.current_conversation_name = prompt[:50] if prompt else "New Chat"
-        st.session_state.current_conversation.append(message)
\ No newline at end of file
+            st.session_state.current_conversation_id = self.history.create_conversation(
+                self.engine.username, st.session_state.current_conversation_name)
+        message["id"] = self.history.append_message(st.session_state.current_conversation_id, message)
+        window = get_conversation_window()
+        if window.conversation_id != st.session_state.current_conversation_id:
+            window.open(st.session_state.current_conversation_id)
+        else:
+            window.append(message)
\ No newline at end of file
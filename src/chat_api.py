@@ -0,0 +1,354 @@
+# src/chat_api.py
+"""API HTTP headless cho chatbot, chạy thành N tiến trình worker.
+
+Mọi worker mở cùng một cổng (SO_REUSEPORT, kernel chia kết nối) và nạp index FAISS + docstore dạng cột
+qua mmap, nên các trang dữ liệu index nằm một lần trong page cache và được dùng chung, không phải N bản.
+Lịch sử hội thoại (SQLite WAL) và cache câu trả lời cũng dùng chung giữa các worker.
+
+Chạy:  python -m src.chat_api --workers 4 --port 8000
+       python -m src.chat_api --workers 2 --stub-llm --stub-embeddings   (không cần Groq/mô hình embedding;
+                                          câu trả lời giả lập được cache trong data/cache/answer_cache.stub.sqlite)
+
+Endpoint (JSON), người dùng là danh tính đã xác thực (token CHAT_API_TOKENS hoặc header CHAT_API_USER_HEADER
+do proxy đặt), không phải trường "username" trong yêu cầu:
+  POST /v1/input    {"prompt", "conversation_id"?, "user_info"?}
+  POST /v1/answer   {"conversation_id", "prompt", "question", "answer"}
+  GET  /v1/history  [?conversation_id=...&before_id=...&limit=...][?q=...&page=...]
+  GET  /healthz     worker, pid, bộ nhớ (RSS/PSS/USS)
+  GET  /metrics     số liệu Prometheus của worker
+"""
+import argparse
+import hmac
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from src.global_settings import (
+    API_HOST, API_PORT, API_WORKERS, API_KEY, API_TOKENS, API_USER_HEADER, API_ENGINE_CACHE_SIZE, HISTORY_DB_FILE, ANSWER_CACHE_FILE,
+    STUB_ANSWER_CACHE_FILE,
+    CACHE_PATH, VECTOR_DB_PATH, EMBEDDING_MODEL_FILE, CONVERSATION_PAGE_SIZE,
+)
+from src.common.utils import logger
+
+MAX_BODY_BYTES = 64 * 1024
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def process_memory_mb(pid="self"):
+    """RSS, PSS (phần dùng chung chia đều cho các tiến trình) và USS (phần riêng) của một tiến trình, MB"""
+    memory = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("Rss", "Pss", "Private_Clean", "Private_Dirty", "Shared_Clean", "Shared_Dirty"):
+                    memory[key] = int(value.split()[0]) / 1024
+    except (OSError, ValueError):
+        return {}
+    return {
+        "rss_mb": round(memory.get("Rss", 0.0), 1),
+        "pss_mb": round(memory.get("Pss", 0.0), 1),
+        "uss_mb": round(memory.get("Private_Clean", 0.0) + memory.get("Private_Dirty", 0.0), 1),
+        "shared_mb": round(memory.get("Shared_Clean", 0.0) + memory.get("Shared_Dirty", 0.0), 1),
+    }
+
+
+def now_text():
+    return datetime.now().strftime("%H:%M:%S %d-%m-%Y")
+
+
+class ChatService:
+    """Logic của một worker: BotLogic theo người dùng (LRU) trên bộ tài nguyên dùng chung, và kho lịch sử"""
+
+    def __init__(self, resources, history, engine_cache_size=API_ENGINE_CACHE_SIZE):
+        self.resources = resources
+        self.history = history
+        self.engine_cache_size = engine_cache_size
+        self._bots = OrderedDict()
+        self._lock = threading.Lock()
+
+    def bot(self, username, user_info):
+        from src.bot_logic import BotLogic
+        key = (username, json.dumps(user_info, sort_keys=True, ensure_ascii=False))
+        with self._lock:
+            bot = self._bots.get(key)
+            if bot is not None:
+                self._bots.move_to_end(key)
+                return bot
+        bot = BotLogic(username=username, user_info=user_info, resources=self.resources, history=self.history)
+        with self._lock:
+            self._bots[key] = bot
+            while len(self._bots) > self.engine_cache_size:
+                self._bots.popitem(last=False)
+        return bot
+
+    def owned_conversation(self, username, conversation_id):
+        conversation = self.history.get_conversation(int(conversation_id), with_messages=False)
+        if not conversation or conversation["username"] != username:
+            raise ApiError(404, f"Không tìm thấy cuộc hội thoại {conversation_id}")
+        return conversation["id"]
+
+    def save(self, conversation_id, role, content, question=None, options=None):
+        message = {"role": role, "content": content, "time": now_text()}
+        if question and options:
+            message["question"], message["options"] = question, options
+        return self.history.append_message(conversation_id, message)
+
+    def handle_input(self, username, body):
+        prompt = require(body, "prompt")
+        bot = self.bot(username, body.get("user_info") or {"name": username})
+        if body.get("conversation_id"):
+            conversation_id = self.owned_conversation(username, body["conversation_id"])
+        else:
+            conversation_id = self.history.create_conversation(username, prompt[:50] or "New Chat")
+        result = bot.process_input(prompt)
+        # Lưu giống trang chat: câu nhập, rồi phản hồi kèm câu hỏi trắc nghiệm (nếu có)
+        message_ids = [self.save(conversation_id, "user", prompt)]
+        if result["question"]:
+            content = f"{result['response']}\n\n**Câu hỏi**: {result['question']}"
+            message_ids.append(self.save(conversation_id, "assistant", content, result["question"], result["options"]))
+        else:
+            message_ids.append(self.save(conversation_id, "assistant", result["response"]))
+        return {"conversation_id": conversation_id, "response": result["response"], "question": result["question"],
+                "options": result["options"], "emotion": result.get("emotion"), "message_ids": message_ids}
+
+    def handle_answer(self, username, body):
+        conversation_id = self.owned_conversation(username, require(body, "conversation_id"))
+        prompt, question, answer = require(body, "prompt"), require(body, "question"), require(body, "answer")
+        bot = self.bot(username, body.get("user_info") or {"name": username})
+        # "emotion" từ /v1/input (tùy chọn) tránh phân loại lại câu nhập
+        response = bot.process_answer(prompt, question, answer, body.get("emotion"))
+        message_ids = [self.save(conversation_id, "user", answer), self.save(conversation_id, "assistant", response)]
+        return {"conversation_id": conversation_id, "response": response, "message_ids": message_ids}
+
+    def handle_history(self, username, params):
+        if params.get("q"):
+            return self.history.search(username, params["q"], page=int(params.get("page", 0)))
+        if not params.get("conversation_id"):
+            return {"conversations": self.history.list_conversations(username)}
+        conversation_id = self.owned_conversation(username, params["conversation_id"])
+        before_id = int(params["before_id"]) if params.get("before_id") else None
+        limit = min(int(params.get("limit", CONVERSATION_PAGE_SIZE)), 200)
+        return {"conversation_id": conversation_id,
+                "messages": self.history.fetch_messages(conversation_id, before_id=before_id, limit=limit)}
+
+
+def require(values, field):
+    value = values.get(field)
+    if value is None or (isinstance(value, str) and not value.strip() and field != "prompt"):
+        raise ApiError(400, f"Thiếu trường '{field}'")
+    return value
+
+
+def authenticate(headers, api_tokens=API_TOKENS, user_header=API_USER_HEADER, api_key=API_KEY):
+    """Danh tính người dùng của yêu cầu: token riêng của người dùng, hoặc header của proxy tin cậy.
+
+    Header danh tính chỉ được tin khi đã cấu hình `user_header`, và khi có `api_key` thì chỉ khi proxy gửi kèm
+    đúng key đó; không có cách nào thì trả 401.
+    """
+    authorization = headers.get("Authorization") or ""
+    token = authorization[len("Bearer "):] if authorization.startswith("Bearer ") else None
+    if token:
+        for known, username in api_tokens.items():
+            if hmac.compare_digest(token.encode(), known.encode()):
+                return username
+    if user_header:
+        if api_key and not (token and hmac.compare_digest(token.encode(), api_key.encode())):
+            raise ApiError(401, "Sai hoặc thiếu API key của proxy")
+        username = (headers.get(user_header) or "").strip()
+        if username:
+            return username
+    raise ApiError(401, "Yêu cầu chưa được xác thực")
+
+
+def make_handler(service, worker_id, api_tokens=API_TOKENS, user_header=API_USER_HEADER, api_key=API_KEY):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def send_json(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def send_text(self, text):
+            body = text.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def authenticate(self):
+            return authenticate(self.headers, api_tokens, user_header, api_key)
+
+        def read_json(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            if length > MAX_BODY_BYTES:
+                raise ApiError(413, "Nội dung yêu cầu quá lớn")
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                raise ApiError(400, "Nội dung không phải JSON hợp lệ")
+            if not isinstance(body, dict):
+                raise ApiError(400, "Nội dung phải là một object JSON")
+            return body
+
+        def dispatch(self, handler):
+            try:
+                username = self.authenticate()
+                self.send_json(200, handler(username))
+            except ApiError as e:
+                self.send_json(e.status, {"error": str(e)})
+            except (TypeError, ValueError) as e:
+                self.send_json(400, {"error": f"Tham số không hợp lệ: {e}"})
+            except Exception as e:
+                logger.error(f"Worker {worker_id}: lỗi khi xử lý {self.path}: {e}")
+                self.send_json(500, {"error": "Lỗi máy chủ"})
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            if url.path == "/healthz":
+                self.send_json(200, {"status": "ok", "worker": worker_id, "pid": os.getpid(), **process_memory_mb()})
+            elif url.path == "/metrics":
+                from src.tracing import METRICS
+                self.send_text(METRICS.to_prometheus())
+            elif url.path == "/v1/history":
+                self.dispatch(lambda username: service.handle_history(username, params))
+            else:
+                self.send_json(404, {"error": "Không có endpoint này"})
+
+        def do_POST(self):
+            url = urlsplit(self.path)
+            routes = {"/v1/input": service.handle_input, "/v1/answer": service.handle_answer}
+            if url.path not in routes:
+                self.send_json(404, {"error": "Không có endpoint này"})
+                return
+            self.dispatch(lambda username: routes[url.path](username, self.read_json()))
+
+    return Handler
+
+
+class ReusePortHTTPServer(ThreadingHTTPServer):
+    """Mỗi worker tự bind cùng địa chỉ; kernel phân phối kết nối mới giữa các worker"""
+
+    daemon_threads = True
+
+    def server_bind(self):
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+
+def resolve_answer_cache_file(answer_cache_file=None, stub_llm=False, stub_embeddings=False):
+    """File cache câu trả lời: mặc định là cache thật, hoặc cache riêng khi có thành phần giả lập.
+
+    Câu trả lời được cache theo phạm vi dùng chung giữa mọi người dùng, nên không cho phép
+    LLM/embedding giả lập ghi vào cache thật mà các trang Streamlit đang đọc.
+    """
+    stub = stub_llm or stub_embeddings
+    if answer_cache_file is None:
+        return STUB_ANSWER_CACHE_FILE if stub else ANSWER_CACHE_FILE
+    if stub and os.path.abspath(answer_cache_file) == os.path.abspath(ANSWER_CACHE_FILE):
+        raise ValueError(f"Không dùng cache câu trả lời thật ({ANSWER_CACHE_FILE}) với LLM/embedding giả lập")
+    return answer_cache_file
+
+
+def load_resources(stub_llm=False, llm_latency=0.0, stub_embeddings=False, answer_cache_file=None):
+    from src.engine_registry import get_shared_resources
+    overrides = {"answer_cache_file": resolve_answer_cache_file(answer_cache_file, stub_llm, stub_embeddings)}
+    if stub_llm:
+        from src.models import using_llm_stub
+        overrides["llm"] = using_llm_stub(latency_seconds=llm_latency)
+    if stub_embeddings:
+        from src.embeddings import StubEmbeddings
+        overrides["embedding_model"] = StubEmbeddings()
+    return get_shared_resources(VECTOR_DB_PATH, EMBEDDING_MODEL_FILE, **overrides)
+
+
+def run_worker(worker_id, host, port, options):
+    """Tiến trình worker: nạp tài nguyên (index mmap) rồi phục vụ trên cổng dùng chung"""
+    from src import tracing
+    from src.history_store import get_history_store
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Mỗi worker ghi file số liệu riêng; /metrics của từng worker phục vụ qua chính cổng API
+    tracing.start_exporter(path=os.path.join(CACHE_PATH, f"metrics.worker-{worker_id}.prom"), port=None)
+    resources = load_resources(options["stub_llm"], options["llm_latency"], options["stub_embeddings"],
+                               options["answer_cache_file"])
+    service = ChatService(resources, get_history_store(options["history_db"]))
+    server = ReusePortHTTPServer((host, port), make_handler(service, worker_id))
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown, daemon=True).start())
+    logger.info(f"Worker {worker_id} (pid {os.getpid()}) sẵn sàng tại http://{host}:{port}, "
+                f"bộ nhớ {process_memory_mb()}")
+    server.serve_forever()
+    server.server_close()
+
+
+def serve(workers=API_WORKERS, host=API_HOST, port=API_PORT, **options):
+    """Tiến trình cha: khởi động `workers` worker, khởi động lại worker bị chết, dừng tất cả khi nhận SIGINT/SIGTERM"""
+    options = {"stub_llm": False, "llm_latency": 0.0, "stub_embeddings": False, "history_db": HISTORY_DB_FILE,
+               "answer_cache_file": None, **options}
+    # Kiểm tra trước khi khởi động worker: lỗi cấu hình cache dừng ngay thay vì worker chết rồi khởi động lại mãi
+    options["answer_cache_file"] = resolve_answer_cache_file(options["answer_cache_file"], options["stub_llm"],
+                                                             options["stub_embeddings"])
+    if not API_TOKENS and not API_USER_HEADER:
+        logger.warning("Chưa cấu hình CHAT_API_TOKENS hoặc CHAT_API_USER_HEADER: mọi yêu cầu /v1 sẽ bị từ chối (401)")
+    # spawn: mỗi worker là một trình thông dịch sạch, không thừa hưởng luồng/kết nối SQLite của tiến trình cha
+    context = multiprocessing.get_context("spawn")
+    stopping = threading.Event()
+
+    def start(worker_id):
+        process = context.Process(target=run_worker, args=(worker_id, host, port, options), name=f"chat-api-{worker_id}")
+        process.start()
+        return process
+
+    def stop(*_):
+        stopping.set()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    processes = {worker_id: start(worker_id) for worker_id in range(workers)}
+    logger.info(f"API chat: {workers} worker tại http://{host}:{port}")
+    while not stopping.is_set():
+        for worker_id, process in list(processes.items()):
+            if not process.is_alive():
+                logger.warning(f"Worker {worker_id} (pid {process.pid}) đã dừng với mã {process.exitcode}, khởi động lại")
+                processes[worker_id] = start(worker_id)
+        stopping.wait(1.0)
+    for process in processes.values():
+        process.terminate()
+    for process in processes.values():
+        process.join(timeout=10)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="API HTTP headless cho chatbot (nhiều worker, index mmap dùng chung)")
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT)
+    parser.add_argument("--workers", type=int, default=API_WORKERS)
+    parser.add_argument("--stub-llm", action="store_true", help="dùng StubLLM thay cho Groq")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="độ trễ giả lập của StubLLM (giây)")
+    parser.add_argument("--stub-embeddings", action="store_true", help="dùng embedding giả lập thay cho GPT4All")
+    parser.add_argument("--history-db", default=HISTORY_DB_FILE)
+    parser.add_argument("--answer-cache", help="file SQLite của cache câu trả lời (mặc định: cache thật, "
+                                               "hoặc file riêng khi dùng --stub-llm/--stub-embeddings)")
+    args = parser.parse_args()
+    serve(args.workers, args.host, args.port, stub_llm=args.stub_llm, llm_latency=args.llm_latency,
+          stub_embeddings=args.stub_embeddings, history_db=args.history_db, answer_cache_file=args.answer_cache)
@@ -1,8 +1,10 @@
 # src/common/utils.py
+import hashlib
 import logging
 import streamlit as st
 import json
 import os
+import tempfile
 from src.global_settings import CHAT_HISTORY_FILE
 
 # Cấu hình logger
@@ -14,8 +16,58 @@ if not logger.handlers:
     handler.setFormatter(formatter)
     logger.addHandler(handler)
 
-# Hàm hiển thị tin nhắn
-def display_message(chat_store, container, key):
-    for msg in chat_store:
+# Hàm hiển thị tin nhắn: chỉ vẽ cửa sổ tin nhắn gần nhất, tin nhắn cũ hơn được nạp theo trang khi bấm nút
+def display_message(window, container, key):
+    # Nhập trong hàm: conversation_view -> history_store -> src.common.utils
+    from src.conversation_view import render_load_older
+    render_load_older(window, container, key)
+    for msg in window.messages():
         with container.chat_message(name=msg["role"]):
-            st.markdown(f"**{msg['time']}**: {msg['content']}")
\ No newline at end of file
+            st.markdown(f"**{msg['time']}**: {msg['content']}")
+
+def flat_index_version(index_path):
+    """Dấu vân tay của index flat: hash manifest (nếu có) hoặc hash file index.faiss"""
+    for file_name in ("manifest.json", "index.faiss"):
+        file_path = os.path.join(index_path, file_name)
+        if os.path.exists(file_path):
+            digest = hashlib.sha256()
+            with open(file_path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+            return digest.hexdigest()[:16]
+    return None
+
+
+def index_version(index_path):
+    """Phiên bản index đang phục vụ: index flat, cộng loại + tham số của index ANN (index_config.json, ghi cạnh
+    index_ann.faiss) nếu có, để đổi VECTOR_INDEX_TYPE/VECTOR_INDEX_PARAMS rồi dựng lại cũng đổi phiên bản"""
+    flat = flat_index_version(index_path)
+    try:
+        with open(os.path.join(index_path, "index_config.json"), "r", encoding="utf-8") as f:
+            config = json.load(f)
+    except (OSError, ValueError):
+        return flat
+    if flat is None or config.get("type", "flat") == "flat":
+        return flat
+    # index_fingerprint: index flat mà index ANN được dựng từ đó (khác `flat` khi ANN đã cũ)
+    ann = json.dumps([config["type"], config.get("params", {}), config.get("index_fingerprint")], sort_keys=True)
+    return hashlib.sha256(f"{flat}|{ann}".encode("utf-8")).hexdigest()[:16]
+
+
+def replace_file(path, data):
+    """Ghi `data` (bytes) vào `path` qua một file tạm riêng trong cùng thư mục rồi os.replace.
+
+    Tên file tạm là duy nhất, nên nhiều tiến trình (worker API, session Streamlit) cùng dựng lại một cache
+    không ghi đè file tạm của nhau; người đọc luôn thấy một file trọn vẹn.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    f = tempfile.NamedTemporaryFile(dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp", delete=False)
+    try:
+        with f:
+            f.write(data)
+        os.replace(f.name, path)
+    except BaseException:
+        if os.path.exists(f.name):
+            os.remove(f.name)
+        raise
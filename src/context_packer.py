@@ -0,0 +1,194 @@
+# src/context_packer.py
+import os
+import re
+import time
+from functools import lru_cache
+from typing import Any
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from src.global_settings import (
+    CONTEXT_TOKEN_BUDGET, CONTEXT_DEDUP_SIMILARITY, CONTEXT_MIN_BLOCK_TOKENS, LLM_MODEL_FILE, RETRIEVAL_K,
+)
+from src.retrieval_cache import normalize_retrieval_query
+from src.common.utils import logger
+from src.tracing import span, count
+
+# Phần gối đầu ngắn hơn ngưỡng này coi như trùng hợp ngẫu nhiên, không ghép
+MIN_OVERLAP_CHARS = 20
+MAX_OVERLAP_CHARS = 400
+SEPARATOR = "\n\n"
+
+
+class TokenCounter:
+    """Đếm token bằng tokenizer của chính LLM (Llama 3, đọc từ file GGUF LLM_MODEL_FILE qua llama-cpp-python,
+    chỉ nạp từ vựng) nếu có, ngược lại ước lượng theo số byte UTF-8 (~4 byte/token)"""
+
+    def __init__(self, model_file=LLM_MODEL_FILE):
+        self.tokenizer = None
+        if not os.path.exists(model_file):
+            logger.info(f"Không có {model_file}, ước lượng số token theo độ dài UTF-8.")
+            return
+        try:
+            from llama_cpp import Llama
+            self.tokenizer = Llama(model_path=model_file, vocab_only=True, verbose=False)
+        except Exception as e:
+            logger.info(f"Không nạp được tokenizer từ {model_file} ({e!r}), ước lượng số token theo độ dài UTF-8.")
+
+    def encode(self, text):
+        return self.tokenizer.tokenize(text.encode("utf-8"), add_bos=False, special=False)
+
+    def count(self, text):
+        if self.tokenizer is not None:
+            return len(self.encode(text))
+        return (len(text.encode("utf-8")) + 3) // 4
+
+    def truncate(self, text, max_tokens):
+        """Cắt văn bản cho vừa `max_tokens`, ưu tiên cắt ở cuối câu hoặc cuối dòng"""
+        if max_tokens <= 0:
+            return ""
+        if self.count(text) <= max_tokens:
+            return text
+        if self.tokenizer is not None:
+            cut = self.tokenizer.detokenize(self.encode(text)[:max_tokens]).decode("utf-8", errors="ignore")
+        else:
+            cut = text.encode("utf-8")[:max_tokens * 4].decode("utf-8", errors="ignore")
+        boundary = max(cut.rfind(". "), cut.rfind("\n"))
+        return cut[:boundary + 1] if boundary > len(cut) // 2 else cut
+
+
+@lru_cache(maxsize=None)
+def get_token_counter(model_file=LLM_MODEL_FILE):
+    return TokenCounter(model_file)
+
+
+def overlap_length(left, right):
+    """Độ dài phần cuối của `left` trùng với phần đầu của `right` (0 nếu không đủ dài)"""
+    for size in range(min(len(left), len(right), MAX_OVERLAP_CHARS), MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def shingles(text, size=3):
+    words = re.findall(r"\w+", text.lower())
+    return {tuple(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+class ContextPacker:
+    """Ghép ngữ cảnh truy hồi trước khi gửi LLM.
+
+    Gộp các chunk gối đầu nhau hoặc nằm trong nhau của cùng một trang, bỏ các đoạn gần trùng,
+    rồi xếp các đoạn có điểm tốt nhất vào prompt cho tới khi chạm ngân sách token. Đoạn phải cắt bớt
+    mà phần còn lại ngắn hơn `min_block_tokens` thì bị bỏ thay vì để một mẩu đuôi vô nghĩa trong prompt.
+    """
+
+    def __init__(self, token_budget=CONTEXT_TOKEN_BUDGET, dedup_similarity=CONTEXT_DEDUP_SIMILARITY,
+                 min_block_tokens=CONTEXT_MIN_BLOCK_TOKENS, counter=None):
+        self.token_budget = token_budget
+        self.dedup_similarity = dedup_similarity
+        self.min_block_tokens = min_block_tokens
+        self.counter = counter or get_token_counter()
+
+    def merge_page_chunks(self, ranked):
+        """ranked: [(Document, rank)] theo thứ tự tốt dần -> các khối đã gộp theo (nguồn, trang)"""
+        blocks = []
+        for doc, rank in ranked:
+            key = (doc.metadata.get("source"), doc.metadata.get("page"))
+            text = doc.page_content
+            for block in blocks:
+                if block["key"] != key:
+                    continue
+                if text in block["text"]:
+                    merged = block["text"]
+                elif block["text"] in text:
+                    merged = text
+                elif overlap_length(block["text"], text):
+                    merged = block["text"] + text[overlap_length(block["text"], text):]
+                elif overlap_length(text, block["text"]):
+                    merged = text + block["text"][overlap_length(text, block["text"]):]
+                else:
+                    continue  # cùng trang nhưng không liền nhau: giữ thành khối riêng
+                block["text"], block["chunks"] = merged, block["chunks"] + 1
+                break
+            else:
+                blocks.append({"key": key, "text": text, "rank": rank, "chunks": 1, "metadata": dict(doc.metadata)})
+        return blocks
+
+    def drop_near_duplicates(self, blocks):
+        kept = []
+        for block in sorted(blocks, key=lambda b: b["rank"]):
+            block_shingles = shingles(block["text"])
+            if any(jaccard(block_shingles, other["shingles"]) >= self.dedup_similarity for other in kept):
+                continue
+            block["shingles"] = block_shingles
+            kept.append(block)
+        return kept
+
+    def pack(self, documents):
+        """documents: danh sách Document theo thứ tự điểm giảm dần. Trả về (documents đã ghép, thống kê)"""
+        raw_tokens = self.counter.count(SEPARATOR.join(doc.page_content for doc in documents))
+        blocks = self.drop_near_duplicates(self.merge_page_chunks([(doc, rank) for rank, doc in enumerate(documents)]))
+
+        packed, used = [], 0
+        separator_tokens = self.counter.count(SEPARATOR)
+        for block in blocks:
+            remaining = self.token_budget - used - (separator_tokens if packed else 0)
+            text = self.counter.truncate(block["text"], remaining)
+            if not text.strip() or (text != block["text"] and self.counter.count(text) < self.min_block_tokens):
+                continue  # đoạn sau (ngắn hơn) có thể vẫn vừa trọn vẹn phần ngân sách còn lại
+            metadata = dict(block["metadata"], merged_chunks=block["chunks"])
+            packed.append(Document(page_content=text, metadata=metadata))
+            used += self.counter.count(text) + (separator_tokens if len(packed) > 1 else 0)
+        # Đếm lại trên đúng chuỗi sẽ vào prompt để số liệu so sánh được với raw_tokens
+        used = self.counter.count(SEPARATOR.join(doc.page_content for doc in packed))
+        stats = {"raw_tokens": raw_tokens, "packed_tokens": used, "saved_tokens": raw_tokens - used,
+                 "chunks_in": len(documents), "blocks_out": len(packed)}
+        return packed, stats
+
+
+class PackedRetriever(BaseRetriever):
+    """Retriever FAISS trả về ngữ cảnh đã qua ContextPacker, dùng được trực tiếp trong RetrievalQA.
+
+    Với `cache` (RetrievalCache), top-k của các câu truy vấn lặp lại được lấy từ cache
+    thay vì embed và tìm kiếm lại; chỉ id và điểm được giữ, nội dung đọc lại từ docstore.
+    """
+
+    vectorstore: Any
+    packer: Any
+    cache: Any = None
+    k: int = RETRIEVAL_K
+
+    def search(self, query):
+        """Top-k dạng [(khóa docstore, điểm)] cho câu truy vấn.
+
+        Dạng chuẩn hóa chỉ dùng làm khóa cache; mô hình embedding nhận nguyên văn câu truy vấn.
+        """
+        key = normalize_retrieval_query(query)
+        if self.cache is not None:
+            hits = self.cache.get((key, self.k))
+            if hits is not None:
+                return hits
+        start = time.perf_counter()
+        embedding = self.vectorstore.embedding_function.embed_query(query)
+        with span("vector_search"):
+            scores, rows = self.vectorstore.index.search(np.asarray([embedding], dtype=np.float32), self.k)
+        hits = [(self.vectorstore.index_to_docstore_id[int(row)], float(score))
+                for row, score in zip(rows[0], scores[0]) if row != -1]
+        if self.cache is not None:
+            self.cache.put((key, self.k), hits, (time.perf_counter() - start) * 1000)
+        return hits
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        with span("retrieval"):
+            documents = [self.vectorstore.docstore.search(doc_key) for doc_key, _ in self.search(query)]
+            packed, stats = self.packer.pack(documents)
+        count("context_tokens_total", stats["packed_tokens"], kind="packed")
+        count("context_tokens_total", stats["saved_tokens"], kind="saved")
+        logger.info(f"Ngữ cảnh: {stats['chunks_in']} chunk -> {stats['blocks_out']} đoạn, "
+                    f"{stats['raw_tokens']} -> {stats['packed_tokens']} token (tiết kiệm {stats['saved_tokens']})")
+        return packed
@@ -1,102 +1,166 @@
 import os
+import time
 import streamlit as st
-import json
-import pandas as pd
-from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import GPT4AllEmbeddings
-from langchain.chains import RetrievalQA
-from langchain.prompts import PromptTemplate
-from src.models import using_llm_groq
-from src.prompts import CUSTORM_AGENT_SYSTEM_TEMPLATE
-from src.global_settings import VECTOR_DB_PATH, EMBEDDING_MODEL_FILE, CHAT_HISTORY_FILE
+from src.answer_bank import (
+    SEVERITY_OPTIONS, SEVERITY_MAPPING, SEVERITIES, POSITIVE_EMOTIONS, NOT_FOUND_ANSWER, severity_query, severity_scope,
+    format_severity_answer,
+)
+from src.query_prep import build_retrieval_query, render_system_prompt
+from src.prefetch import SeverityPrefetch
+from src.global_settings import VECTOR_DB_PATH, EMBEDDING_MODEL_FILE, LLM_BACKEND, PREFETCH_SEVERITY_ANSWERS
+from src.history_store import get_history_store
+from src.conversation_view import get_conversation_window
+from src.tracing import span, observe_stage
 from datetime import datetime
 from src.common.utils import logger, display_message
 
 class ConversationEngine:
-    def __init__(self, username: str = "default_user", user_info: dict = {}):
+    """Lớp theo từng người dùng, đặt trên bộ tài nguyên dùng chung của tiến trình"""
+
+    def __init__(self, username: str = "default_user", user_info: dict = {}, resources=None,
+                 prefetch: bool = PREFETCH_SEVERITY_ANSWERS):
         self.username = username
         self.user_info = user_info
-        api_key = os.getenv("GROQ_API_KEY")
-        if not api_key:
-            raise ValueError("GROQ_API_KEY không được tìm thấy. Kiểm tra tệp .env.")
-        self.llm = using_llm_groq(api_key=api_key)
-        self.db = self.load_vector_db()
-        self.qa_chain = self.create_qa_chain()
-        # Đọc từ khóa từ file CSV
-        self.direct_query_keywords = self.load_keywords("data/keywords/direct_query_keywords.csv")
-        self.emotion_keywords = self.load_keywords("data/keywords/emotion_keywords.csv")
-        self.personal_keywords = self.load_keywords("data/keywords/personal_keywords.csv")
-        # Danh sách cảm xúc tích cực
-        self.positive_emotions = ["vui", "hạnh phúc", "phấn khởi", "hào hứng", "yêu đời", "thư giãn"]
-
-    def load_keywords(self, file_path):
-        """Đọc từ khóa từ file CSV"""
-        try:
-            df = pd.read_csv(file_path)
-            keywords = df["keyword"].dropna().tolist()
-            return keywords
-        except Exception as e:
-            logger.error(f"Lỗi khi đọc file {file_path}: {str(e)}")
-            return []
+        if resources is None:
+            api_key = os.getenv("GROQ_API_KEY")
+            if not api_key and LLM_BACKEND == "groq":
+                raise ValueError("GROQ_API_KEY không được tìm thấy. Kiểm tra tệp .env.")
+            # Nhập registry ở đây: langchain, FAISS, GPT4All và Groq chỉ được nạp khi thật sự dựng engine
+            from src.engine_registry import get_shared_resources
+            with span("engine_init"):
+                resources = get_shared_resources(VECTOR_DB_PATH, EMBEDDING_MODEL_FILE, api_key=api_key)
+        self.bind_resources(resources)
+        # Dựng một lần cho người dùng này (và dùng chung giữa các engine cùng user_info)
+        self.system_prompt = render_system_prompt(user_info)
+        self.positive_emotions = POSITIVE_EMOTIONS
+        # Câu trả lời mức độ chạy trước cho câu hỏi đang chờ của phiên này
+        self.prefetch = SeverityPrefetch() if prefetch else None
 
-    def load_vector_db(self):
-        try:
-            embedding_model = GPT4AllEmbeddings(model_file=EMBEDDING_MODEL_FILE)
-            return FAISS.load_local(VECTOR_DB_PATH, embedding_model, allow_dangerous_deserialization=True)
-        except Exception as e:
-            raise RuntimeError(f"Lỗi khi tải Vector DB: {str(e)}")
-
-    def create_qa_chain(self):
-        prompt = PromptTemplate(
-            template=r"""
-Bạn là một trợ lý AI chuyên về sức khỏe tâm thần, được thiết kế để hỗ trợ người dùng bằng tiếng Việt. Dựa hoàn toàn trên thông tin từ DSM-5 trong cơ sở dữ liệu, hãy cung cấp câu trả lời chi tiết, đầy đủ và chính xác cho câu hỏi của người dùng. 
-
-- Nếu câu hỏi không liên quan đến cảm xúc cá nhân (như không chứa từ khóa từ emotion_keywords hoặc personal_keywords), hãy trả lời trực tiếp dựa trên định nghĩa, tiêu chuẩn chẩn đoán, triệu chứng, và điều trị từ DSM-5 mà không đưa ra câu hỏi trắc nghiệm.
-- Nếu câu hỏi liên quan đến cảm xúc cá nhân:
-  - Với cảm xúc tiêu cực (như buồn, lo âu, căng thẳng), phân tích mức độ (nhẹ, trung bình, nặng) và đưa ra gợi ý dựa trên tiêu chuẩn chẩn đoán DSM-5.
-  - Với cảm xúc tích cực (như vui, hạnh phúc, phấn khởi), giải thích ý nghĩa của cảm xúc đó trong bối cảnh sức khỏe tâm thần, cung cấp thông tin tích cực từ DSM-5 (nếu có) hoặc từ kiến thức tâm lý học chung, và đưa ra gợi ý để duy trì trạng thái tích cực. Không mặc định trả lời về rối loạn khi cảm xúc là tích cực.
-
-Trả lời rõ ràng, chi tiết và hoàn toàn bằng tiếng Việt.
-
-{context}
-
-Câu hỏi: {question}
-""",
-            input_variables=["context", "question"]
-        )
-        return RetrievalQA.from_chain_type(
-            llm=self.llm,
-            chain_type="stuff",
-            retriever=self.db.as_retriever(search_kwargs={"k": 3}, max_token_limit=512),
-            return_source_documents=True,
-            chain_type_kwargs={'prompt': prompt}
-        )
-
-    def chat(self, user_input):
-        prompt = CUSTORM_AGENT_SYSTEM_TEMPLATE.format(user_info=self.user_info) + f"\n\nNgười dùng: {user_input}"
-        response = self.qa_chain.invoke({"query": prompt})
+    def bind_resources(self, resources):
+        self.resources = resources
+        self.llm = resources.llm
+        self.db = resources.db
+        self.qa_chain = resources.qa_chain
+        self.retriever = resources.qa_chain.retriever if resources.qa_chain is not None else None
+        self.qa_prompt = resources.qa_prompt
+        self.answer_cache = resources.answer_cache
+        self.keyword_matcher = resources.keyword_matcher
+        self.intent_classifier = resources.intent_classifier
+        self.answer_bank = resources.answer_bank
+
+    def refresh_resources(self):
+        """Chuyển sang bộ tài nguyên nạp lại khi index trên đĩa đổi phiên bản (build_data.py chạy lại)"""
+        index_changed = getattr(self.resources, "index_changed", None)
+        if index_changed is None or not index_changed():
+            return
+        from src.engine_registry import get_shared_resources
+        self.bind_resources(get_shared_resources(self.resources.index_path, self.resources.model_file,
+                                                 **getattr(self.resources, "registry_overrides", {})))
+
+    def ask(self, query, cache_query=None, scope="", retrieval_query=None, system=""):
+        """Truy hồi + sinh qua cache câu trả lời; trả về dict có "result" và "source_documents".
+
+        `cache_query` là phần câu hỏi dùng làm khóa cache (mặc định là `query`),
+        `scope` là phần ngữ cảnh cố định đi kèm (ví dụ system prompt theo người dùng),
+        `retrieval_query`/`system` như trong `generate`.
+        """
+        cache_query = cache_query or query
+        with span("answer"):
+            with span("answer_cache"):
+                cached = self.answer_cache.get(cache_query, scope)
+            if cached is not None:
+                return cached
+            response = self.generate(query, retrieval_query, system)
+            self.answer_cache.put(cache_query, response, scope)
+            return response
+
+    def build_prompt(self, question, documents, system=""):
+        context = "\n\n".join(doc.page_content for doc in documents)
+        return self.qa_prompt.format(system=system, context=context, question=question)
+
+    def generate(self, question, retrieval_query=None, system=""):
+        """Truy hồi theo `retrieval_query` (mặc định là câu hỏi), chỉ đưa `system` vào prompt ở bước sinh.
+
+        Tương đương chuỗi RetrievalQA "stuff" (cùng retriever, cùng prompt) nhưng tách câu truy vấn khỏi chỉ dẫn.
+        """
+        documents = self.retriever.invoke(retrieval_query or question)
+        result = self.llm.invoke(self.build_prompt(question, documents, system))
+        return {"result": getattr(result, "content", result), "source_documents": documents}
+
+    def prepare_query(self, user_input, matches=None):
+        """Câu truy vấn truy hồi ngắn từ lời người dùng và từ khóa khớp"""
+        if matches is None:
+            matches = self.keyword_matcher.match(user_input)
+        return build_retrieval_query(user_input, matches)
+
+    def chat(self, user_input, matches=None):
+        retrieval_query = self.prepare_query(user_input, matches)
+        response = self.ask(user_input, scope=self.system_prompt, retrieval_query=retrieval_query,
+                            system=self.system_prompt)
         return response.get("result", "Không tìm thấy thông tin phù hợp trong DSM-5.")
 
-    def process_direct_query(self, prompt):
-        response = self.chat(prompt)
+    def chat_stream(self, user_input, matches=None):
+        """Sinh câu trả lời theo từng token: truy hồi ngữ cảnh trước, rồi stream từ LLM.
+
+        Thời gian tới token đầu tiên (TTFT) được ghi log cho mỗi yêu cầu; toàn văn
+        được lưu vào cache câu trả lời khi stream kết thúc.
+        """
+        start = time.perf_counter()
+        # Span không bao qua các lần yield: generator có thể được tiếp tục ở context khác
+        with span("answer_cache"):
+            cached = self.answer_cache.get(user_input, self.system_prompt)
+        if cached is not None:
+            logger.info(f"TTFT {(time.perf_counter() - start) * 1000:.0f} ms (cache câu trả lời)")
+            observe_stage("ttft", time.perf_counter() - start)
+            yield cached["result"]
+            return
+
+        documents = self.retriever.invoke(self.prepare_query(user_input, matches))
+        retrieved_at = time.perf_counter()
+        parts = []
+        for chunk in self.llm.stream(self.build_prompt(user_input, documents, self.system_prompt)):
+            text = getattr(chunk, "content", chunk)
+            if not text:
+                continue
+            if not parts:
+                now = time.perf_counter()
+                logger.info(f"TTFT {(now - start) * 1000:.0f} ms (truy hồi {(retrieved_at - start) * 1000:.0f} ms, "
+                            f"LLM {(now - retrieved_at) * 1000:.0f} ms)")
+                observe_stage("ttft", now - start)
+            parts.append(text)
+            yield text
+        result = "".join(parts) or NOT_FOUND_ANSWER
+        if not parts:
+            yield result
+        logger.info(f"Hoàn tất stream sau {(time.perf_counter() - start) * 1000:.0f} ms")
+        self.answer_cache.put(user_input, {"result": result, "source_documents": documents}, self.system_prompt)
+
+    def process_direct_query(self, prompt, stream=False, matches=None):
+        response = self.chat_stream(prompt, matches) if stream else self.chat(prompt, matches)
         return {
             "question": None,
             "options": [],
             "response": response
         }
 
-    def generate_question(self, prompt):
-        prompt_lower = prompt.lower()
-        emotion = next((keyword for keyword in self.emotion_keywords if keyword in prompt_lower), None)
-        
+    def classify(self, prompt):
+        """Ý định (nhánh xử lý) và cảm xúc của câu nhập, từ bộ phân loại dùng chung"""
+        return self.intent_classifier.predict(prompt)
+
+    def generate_question(self, prompt, emotion=None):
+        if emotion is None:
+            emotion = self.classify(prompt).emotion
+
         if emotion:
             question = f"Trong tuần qua, bạn có cảm thấy {emotion} đến mức ảnh hưởng đến giấc ngủ, công việc hoặc các hoạt động hàng ngày không?"
-            options = ["Không bao giờ", "Hiếm khi", "Đôi khi", "Thường xuyên", "Luôn luôn"]
+            options = list(SEVERITY_OPTIONS)
             response = f"Mình hiểu bạn đang cảm thấy {emotion}. Hãy chọn mức độ phù hợp nhất với bạn:"
+            self.start_prefetch(emotion)
             return {
                 "question": question,
                 "options": options,
-                "response": response
+                "response": response,
+                "emotion": emotion,
             }
         else:
             return {
@@ -105,39 +169,63 @@ Câu hỏi: {question}
                 "response": "Mình không nhận diện được cảm xúc trong câu của bạn. Hãy chia sẻ thêm nhé!"
             }
 
-    def process_answer(self, prompt, question, answer):
-        prompt_lower = prompt.lower()
-        emotion = next((keyword for keyword in self.emotion_keywords if keyword in prompt_lower), "buồn")
-        severity_mapping = {"Không bao giờ": "nhẹ", "Hiếm khi": "nhẹ", "Đôi khi": "trung bình", "Thường xuyên": "nặng", "Luôn luôn": "rất nặng"}
-        severity = severity_mapping.get(answer, "trung bình")
-
-        # Kiểm tra xem cảm xúc có phải là tích cực không
-        is_positive_emotion = emotion in self.positive_emotions
-
-        if is_positive_emotion:
-            # Với cảm xúc tích cực, trả lời tích cực và gợi ý duy trì trạng thái
-            query = f"Ý nghĩa của cảm xúc {emotion} trong sức khỏe tâm thần và gợi ý duy trì trạng thái tích cực"
-            response = self.qa_chain.invoke({"query": query})
-            result = response.get("result", "Không tìm thấy thông tin phù hợp trong DSM-5.")
-            return f"Dựa trên mức độ {severity}, cảm xúc {emotion} của bạn cho thấy một trạng thái tích cực. {result}"
+    def start_prefetch(self, emotion):
+        """Trong lúc người dùng chọn đáp án, chạy trước các mức độ chưa có trong answer bank trên pool nền"""
+        if self.prefetch is None:
+            return
+        missing = [severity for severity in SEVERITIES if self.answer_bank.get(emotion, severity) is None]
+        if missing:
+            # Cảm xúc tích cực có cùng câu truy vấn cho mọi mức độ: một job dùng chung
+            self.prefetch.start(emotion, missing, self.prefetch_severity_answer,
+                                key=lambda severity: severity_query(emotion, severity))
         else:
-            # Với cảm xúc tiêu cực, phân tích theo DSM-5
-            query = f"Tiêu chuẩn chẩn đoán rối loạn {emotion} theo DSM-5 với mức độ {severity}"
-            response = self.qa_chain.invoke({"query": query})
-            result = response.get("result", "Không tìm thấy thông tin phù hợp trong DSM-5.")
-            return f"Dựa trên mức độ {severity}, {result}"
+            self.prefetch.discard()
+
+    def discard_prefetch(self):
+        """Người dùng đã chuyển sang câu nhập khác: hủy/bỏ các job của câu hỏi cũ"""
+        if self.prefetch is not None:
+            self.prefetch.discard()
+
+    def prefetch_severity_answer(self, emotion, severity):
+        """Job nền: (câu trả lời, có gọi LLM hay không); ưu tiên thấp hơn lời gọi của người dùng đang chờ"""
+        from src.llm_client import llm_priority, PRIORITY_BATCH
+        start = time.perf_counter()
+        query, scope = severity_query(emotion, severity), severity_scope(emotion, severity)
+        # Cùng phạm vi với process_answer: các mức độ chạy song song không được trúng câu trả lời của nhau
+        cached = self.answer_cache.get(query, scope)
+        if cached is not None:
+            return cached.get("result", NOT_FOUND_ANSWER), False
+        with llm_priority(PRIORITY_BATCH):
+            response = self.generate(query)
+        self.answer_cache.put(query, response, scope)
+        observe_stage("prefetch", time.perf_counter() - start)
+        return response.get("result", NOT_FOUND_ANSWER), True
+
+    def process_answer(self, prompt, question, answer, emotion=None):
+        # Cảm xúc đã nhận diện khi sinh câu hỏi được truyền lại; chỉ phân loại lại khi thiếu
+        emotion = emotion or self.classify(prompt).emotion or "buồn"
+        severity = SEVERITY_MAPPING.get(answer, "trung bình")
+
+        # Tra answer bank tính sẵn trước, rồi kết quả đã chạy trước; chỉ gọi truy hồi + LLM khi cả hai đều thiếu
+        result = self.answer_bank.get(emotion, severity)
+        if result is not None:
+            self.discard_prefetch()
+        elif self.prefetch is not None:
+            result = self.prefetch.take(emotion, severity)
+        if result is None:
+            response = self.ask(severity_query(emotion, severity), scope=severity_scope(emotion, severity))
+            result = response.get("result", NOT_FOUND_ANSWER)
+        return format_severity_answer(emotion, severity, result)
 
 def chat_interface(username: str, user_info: dict, container):
-    chat_store = []
-    if os.path.exists(CHAT_HISTORY_FILE) and os.path.getsize(CHAT_HISTORY_FILE) > 0:
-        try:
-            with open(CHAT_HISTORY_FILE, "r") as f:
-                chat_store = json.load(f)
-        except json.JSONDecodeError as e:
-            logger.error(f"Lỗi khi đọc CHAT_HISTORY_FILE: {e}")
-            chat_store = []
+    # Chỉ đọc cuộc hội thoại gần nhất của người dùng này từ kho lịch sử
+    history_store = get_history_store()
+    conversation_id = history_store.latest_conversation_id(username)
+    window = get_conversation_window(f"chat_window_{username}")
+    if window.conversation_id != conversation_id:
+        window.open(conversation_id)
 
-    if not chat_store:
+    if not len(window):
         with container:
             with st.chat_message(name="assistant"):
                 st.markdown("Chào bạn, mình là Chatbot. Mình sẽ giúp bạn chăm sóc sức khỏe tinh thần. Hãy cho mình biết tình trạng của bạn hoặc bạn có thể trò chuyện với mình nhé!")
@@ -151,18 +239,24 @@ def chat_interface(username: str, user_info: dict, container):
     if "answered" not in st.session_state:
         st.session_state.answered = False
 
-    agent = ConversationEngine(username, user_info)
-    display_message(chat_store, container, username)
+    # Engine được dựng lại ở mỗi lần rerun nên kết quả chạy trước sẽ bị mất: tắt prefetch
+    agent = ConversationEngine(username, user_info, prefetch=False)
+    display_message(window, container, username)
 
     user_input = st.chat_input("Nhập tin nhắn của bạn tại đây...",)
     if user_input:
         with container:
             with st.chat_message(name="user"):
                 st.markdown(user_input)
-            response_data = agent.generate_question(user_input) if any(keyword in user_input.lower() for keyword in agent.personal_keywords) and any(emotion in user_input.lower() for emotion in agent.emotion_keywords) else agent.process_direct_query(user_input)
+            with span("routing"):
+                prediction = agent.classify(user_input)
+            response_data = agent.generate_question(user_input, prediction.emotion) if prediction.intent == "severity_question" else agent.process_direct_query(user_input, stream=True)
             
             with st.chat_message(name="assistant"):
-                st.markdown(response_data.get("response", "Không tìm thấy thông tin phù hợp."))
+                if isinstance(response_data["response"], str):
+                    st.markdown(response_data.get("response", "Không tìm thấy thông tin phù hợp."))
+                else:
+                    response_data["response"] = st.write_stream(response_data["response"])
                 if response_data.get("question"):
                     st.session_state.waiting_for_answer = True
                     st.session_state.current_question = response_data["question"]
@@ -180,16 +274,19 @@ def chat_interface(username: str, user_info: dict, container):
                         st.session_state.waiting_for_answer = False
                         with st.chat_message(name="user"):
                             st.markdown(answer)
-                        new_response = agent.process_answer(user_input, st.session_state.current_question, answer)
+                        new_response = agent.process_answer(user_input, st.session_state.current_question, answer, prediction.emotion)
                         with st.chat_message(name="assistant"):
                             st.markdown(new_response)
                         st.session_state.current_question = None
                         st.session_state.current_options = []
 
-        chat_store.append({"role": "user", "content": user_input, "time": datetime.now().strftime("%H:%M:%S %d-%m-%Y")})
-        chat_store.append({"role": "assistant", "content": response_data.get("response", ""), "time": datetime.now().strftime("%H:%M:%S %d-%m-%Y")})
         try:
-            with open(CHAT_HISTORY_FILE, "w") as f:
-                json.dump(chat_store, f, indent=4)
+            if conversation_id is None:
+                conversation_id = history_store.create_conversation(username, user_input[:50])
+                window.open(conversation_id)
+            for message in ({"role": "user", "content": user_input}, {"role": "assistant", "content": response_data.get("response", "")}):
+                message["time"] = datetime.now().strftime("%H:%M:%S %d-%m-%Y")
+                message["id"] = history_store.append_message(conversation_id, message)
+                window.append(message)
         except Exception as e:
-            logger.error(f"Lỗi khi lưu CHAT_HISTORY_FILE: {e}")
\ No newline at end of file
+            logger.error(f"Lỗi khi lưu lịch sử hội thoại: {e}")
\ No newline at end of file
@@ -0,0 +1,98 @@
+# src/conversation_view.py
+from collections import OrderedDict
+import streamlit as st
+from src.global_settings import CONVERSATION_WINDOW_SIZE, CONVERSATION_PAGE_SIZE, CONVERSATION_CACHE_SIZE
+from src.history_store import get_history_store
+
+
+class ConversationWindow:
+    """Cửa sổ hiển thị của một cuộc hội thoại: chỉ giữ id của các tin nhắn đang hiển thị và một cache nhỏ.
+
+    Mặc định chỉ nạp N tin nhắn cuối; tin nhắn cũ hơn được đọc từ kho lịch sử theo trang khi người dùng yêu cầu,
+    nên thời gian mỗi lần rerun không phụ thuộc vào độ dài cuộc hội thoại.
+    """
+
+    def __init__(self, window_size=CONVERSATION_WINDOW_SIZE, page_size=CONVERSATION_PAGE_SIZE,
+                 cache_size=CONVERSATION_CACHE_SIZE):
+        self.window_size = window_size
+        self.page_size = page_size
+        self.cache_size = max(cache_size, window_size)
+        self.conversation_id = None
+        self.message_ids = []
+        self.has_older = False
+        # Người dùng đã nạp thêm tin nhắn cũ: cửa sổ giữ nguyên chỗ đang đọc, không trượt khi có tin nhắn mới
+        self.paged_back = False
+        self._cache = OrderedDict()
+
+    def _remember(self, message):
+        self._cache[message["id"]] = message
+        self._cache.move_to_end(message["id"])
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _fetch_page(self, before_id, limit):
+        # Lấy thừa một tin nhắn để biết còn trang cũ hơn hay không
+        page = get_history_store().fetch_messages(self.conversation_id, before_id=before_id, limit=limit + 1)
+        has_older = len(page) > limit
+        return page[1:] if has_older else page, has_older
+
+    def open(self, conversation_id):
+        self.conversation_id = conversation_id
+        self._cache.clear()
+        self.message_ids = []
+        self.has_older = False
+        self.paged_back = False
+        if conversation_id is None:
+            return
+        page, self.has_older = self._fetch_page(None, self.window_size)
+        for message in page:
+            self._remember(message)
+        self.message_ids = [message["id"] for message in page]
+
+    def append(self, message):
+        """Thêm tin nhắn vừa ghi vào kho lịch sử (đã có id); cửa sổ trượt để giữ tối đa N tin nhắn,
+        trừ khi người dùng đã nạp thêm tin nhắn cũ (các trang đó không bị cắt mất)"""
+        self._remember(message)
+        self.message_ids.append(message["id"])
+        if not self.paged_back and len(self.message_ids) > self.window_size:
+            self.message_ids = self.message_ids[-self.window_size:]
+            self.has_older = True
+
+    def load_older(self):
+        if not self.has_older or self.conversation_id is None:
+            return
+        before_id = self.message_ids[0] if self.message_ids else None
+        page, self.has_older = self._fetch_page(before_id, self.page_size)
+        for message in page:
+            self._remember(message)
+        self.message_ids = [message["id"] for message in page] + self.message_ids
+        self.paged_back = True
+
+    def messages(self):
+        """Các tin nhắn trong cửa sổ; tin nhắn đã rời cache được đọc lại từ kho lịch sử"""
+        missing = [message_id for message_id in self.message_ids if message_id not in self._cache]
+        fetched = get_history_store().get_messages(missing) if missing else {}
+        messages = []
+        for message_id in self.message_ids:
+            message = self._cache.get(message_id) or fetched.get(message_id)
+            if message is not None:
+                messages.append(message)
+        return messages
+
+    def __len__(self):
+        return len(self.message_ids)
+
+
+def get_conversation_window(key="conversation_window"):
+    """Cửa sổ hội thoại của session hiện tại"""
+    if key not in st.session_state:
+        st.session_state[key] = ConversationWindow()
+    return st.session_state[key]
+
+
+def render_load_older(window, container, key):
+    """Nút nạp thêm tin nhắn cũ; trả về True nếu đã nạp để trang được vẽ lại"""
+    if window.has_older and container.button("⬆ Xem tin nhắn cũ hơn", key=f"load_older_{key}"):
+        window.load_older()
+        return True
+    return False
@@ -0,0 +1,164 @@
+# src/docstore.py
+"""Docstore dạng cột, đọc qua mmap, thay cho index.pkl (InMemoryDocstore bị pickle).
+
+Các file trong thư mục index, hàng thứ i ứng với vector thứ i của index FAISS:
+  docstore.json          phiên bản, số hàng, bảng tên nguồn (source)
+  docstore_text.bin      nội dung mọi chunk nối liền (UTF-8)
+  docstore_offsets.npy   int64[n + 1], chunk i nằm trong text[offsets[i]:offsets[i + 1]]
+  docstore_source.npy    int32[n], chỉ số trong bảng tên nguồn
+  docstore_page.npy      int32[n], số trang
+  docstore_ids.npy       S64[n], id của chunk (dùng khi cập nhật index tăng dần)
+
+Khi khởi động chỉ đọc docstore.json; nội dung chunk được giải mã khi tra cứu.
+
+Chuyển đổi thư mục cũ: python -m src.docstore data/index_storage/db_faiss
+"""
+import argparse
+import json
+import os
+import pickle
+from collections.abc import Mapping
+import numpy as np
+from langchain_core.documents import Document
+from src.common.utils import logger
+
+DOCSTORE_VERSION = 1
+DOCSTORE_HEADER = "docstore.json"
+TEXT_FILE = "docstore_text.bin"
+COLUMN_FILES = {"offsets": "docstore_offsets.npy", "source": "docstore_source.npy",
+                "page": "docstore_page.npy", "ids": "docstore_ids.npy"}
+PICKLE_DOCSTORE_FILE = "index.pkl"
+
+
+class RowKeys(Mapping):
+    """index_to_docstore_id không cần dựng dict: khóa docstore của vector thứ i chính là i"""
+
+    def __init__(self, count):
+        self.count = count
+
+    def __getitem__(self, row):
+        if not 0 <= row < self.count:
+            raise KeyError(row)
+        return int(row)
+
+    def __iter__(self):
+        return iter(range(self.count))
+
+    def __len__(self):
+        return self.count
+
+
+class ColumnarDocstore:
+    """Docstore chỉ đọc, tương thích với FAISS của LangChain (chỉ cần phương thức `search`)"""
+
+    def __init__(self, index_path):
+        header_file = os.path.join(index_path, DOCSTORE_HEADER)
+        with open(header_file, "r", encoding="utf-8") as f:
+            header = json.load(f)
+        if header.get("version") != DOCSTORE_VERSION:
+            raise RuntimeError(f"Docstore {header_file} khác phiên bản, cần build lại index.")
+        self.count = header["count"]
+        self.sources = header["sources"]
+        columns = {name: np.load(os.path.join(index_path, file_name), mmap_mode="r")
+                   for name, file_name in COLUMN_FILES.items()}
+        self.offsets, self.source, self.page, self.ids = (
+            columns["offsets"], columns["source"], columns["page"], columns["ids"])
+        text_file = os.path.join(index_path, TEXT_FILE)
+        # np.memmap không nhận file rỗng
+        self.text = np.memmap(text_file, dtype=np.uint8, mode="r") if os.path.getsize(text_file) else np.zeros(0, np.uint8)
+
+    def __len__(self):
+        return self.count
+
+    def text_at(self, row):
+        return self.text[self.offsets[row]:self.offsets[row + 1]].tobytes().decode("utf-8")
+
+    def id_at(self, row):
+        return self.ids[row].decode("ascii")
+
+    def document(self, row):
+        metadata = {"source": self.sources[self.source[row]], "page": int(self.page[row])}
+        return Document(id=self.id_at(row), page_content=self.text_at(row), metadata=metadata)
+
+    def search(self, search):
+        try:
+            row = int(search)
+        except (TypeError, ValueError):
+            return f"ID {search} not found."
+        if not 0 <= row < self.count:
+            return f"ID {search} not found."
+        return self.document(row)
+
+    def rows(self):
+        """Toàn bộ hàng (id, nội dung, metadata), dùng khi ghi lại docstore lúc cập nhật index"""
+        return [(self.id_at(row), self.text_at(row), {"source": self.sources[self.source[row]],
+                                                      "page": int(self.page[row])}) for row in range(self.count)]
+
+
+def write_docstore(index_path, rows):
+    """Ghi docstore từ các hàng (id, nội dung, metadata) theo đúng thứ tự vector trong index FAISS"""
+    os.makedirs(index_path, exist_ok=True)
+    sources, source_codes = {}, []
+    offsets = [0]
+    pages, ids = [], []
+    with open(os.path.join(index_path, TEXT_FILE + ".tmp"), "wb") as f:
+        for chunk_id, text, metadata in rows:
+            encoded = text.encode("utf-8")
+            f.write(encoded)
+            offsets.append(offsets[-1] + len(encoded))
+            source_codes.append(sources.setdefault(str(metadata.get("source", "")), len(sources)))
+            pages.append(int(metadata.get("page", -1)))
+            ids.append(str(chunk_id).encode("ascii"))
+    columns = {
+        "offsets": np.asarray(offsets, dtype=np.int64),
+        "source": np.asarray(source_codes, dtype=np.int32),
+        "page": np.asarray(pages, dtype=np.int32),
+        "ids": np.asarray(ids, dtype="S64"),
+    }
+    for name, values in columns.items():
+        file_name = os.path.join(index_path, COLUMN_FILES[name])
+        # np.save tự thêm đuôi .npy nếu thiếu nên ghi qua file handle
+        with open(file_name + ".tmp", "wb") as f:
+            np.save(f, values)
+    replaced = [TEXT_FILE] + list(COLUMN_FILES.values())
+    for file_name in replaced:
+        os.replace(os.path.join(index_path, file_name + ".tmp"), os.path.join(index_path, file_name))
+    # Header ghi sau cùng: khi header đã trỏ tới số hàng mới thì các cột cũng đã là bản mới
+    header_file = os.path.join(index_path, DOCSTORE_HEADER)
+    with open(header_file + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"version": DOCSTORE_VERSION, "count": len(ids), "sources": list(sources)}, f, ensure_ascii=False)
+    os.replace(header_file + ".tmp", header_file)
+    return len(ids)
+
+
+def has_docstore(index_path):
+    return os.path.exists(os.path.join(index_path, DOCSTORE_HEADER))
+
+
+def convert_pickle_docstore(index_path, remove_pickle=False):
+    """Chuyển index.pkl (InMemoryDocstore + id map của FAISS.save_local) sang docstore dạng cột.
+
+    Đây là lần duy nhất cần unpickle; chỉ chạy trên thư mục index do chính dự án tạo ra.
+    """
+    pickle_file = os.path.join(index_path, PICKLE_DOCSTORE_FILE)
+    with open(pickle_file, "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    rows = []
+    for position in range(len(index_to_docstore_id)):
+        doc_id = index_to_docstore_id[position]
+        doc = docstore.search(doc_id)
+        rows.append((doc_id, doc.page_content, doc.metadata))
+    count = write_docstore(index_path, rows)
+    if remove_pickle:
+        os.remove(pickle_file)
+    logger.info(f"Đã chuyển {count} chunk từ {pickle_file} sang docstore dạng cột.")
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chuyển index.pkl sang docstore dạng cột (mmap)")
+    parser.add_argument("index_paths", nargs="+", help="các thư mục db_faiss cần chuyển")
+    parser.add_argument("--remove-pickle", action="store_true", help="xóa index.pkl sau khi chuyển")
+    args = parser.parse_args()
+    for index_path in args.index_paths:
+        print(f"{index_path}: {convert_pickle_docstore(index_path, args.remove_pickle)} chunk")
@@ -0,0 +1,192 @@
+# src/embeddings.py
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from src.global_settings import (
+    EMBEDDING_MODEL_FILE, EMBEDDING_CACHE_FILE, EMBEDDING_BATCH_SIZE,
+    EMBEDDING_CACHE_MAX_ENTRIES, QUERY_EMBEDDING_LRU_SIZE,
+)
+from src.common.utils import logger
+from src.tracing import traced
+
+SQLITE_IN_LIMIT = 500
+
+
+class CachedEmbeddings(Embeddings):
+    """Bọc GPT4AllEmbeddings với cache trên đĩa (SQLite), encode theo lô và LRU cho câu truy vấn.
+
+    Khóa cache là sha256(tên file mô hình + văn bản), vector lưu dạng float32.
+    Khi số bản ghi vượt `max_entries`, các bản ghi lâu không dùng nhất sẽ bị xóa.
+    """
+
+    def __init__(self, model_file: str = EMBEDDING_MODEL_FILE, cache_file: str = EMBEDDING_CACHE_FILE,
+                 batch_size: int = EMBEDDING_BATCH_SIZE, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES,
+                 query_cache_size: int = QUERY_EMBEDDING_LRU_SIZE, model=None):
+        self.model_file = model_file
+        self.cache_file = cache_file
+        self.batch_size = batch_size
+        self.max_entries = max_entries
+        self.query_cache_size = query_cache_size
+        self._model = model
+        self._model_lock = threading.Lock()
+        self._local = threading.local()
+        self._query_cache = OrderedDict()
+        self._query_lock = threading.Lock()
+        self._writes_since_evict = 0
+        self.counters = {"disk_hits": 0, "disk_misses": 0, "query_lru_hits": 0, "encoded": 0}
+        if cache_file:
+            os.makedirs(os.path.dirname(cache_file) or ".", exist_ok=True)
+            with self._connection() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings ("
+                    "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+
+    @property
+    def model(self):
+        # Chỉ nạp mô hình GPT4All khi thật sự có văn bản chưa nằm trong cache
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    from langchain_community.embeddings import GPT4AllEmbeddings
+                    self._model = GPT4AllEmbeddings(model_file=self.model_file)
+        return self._model
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.cache_file, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _key(self, text):
+        return hashlib.sha256(f"{os.path.basename(self.model_file)}\x00{text}".encode("utf-8")).hexdigest()
+
+    def _encode(self, texts):
+        """Encode theo lô `batch_size` văn bản một lần gọi mô hình"""
+        vectors = []
+        client = getattr(self.model, "client", None)
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start:start + self.batch_size]
+            if client is not None and hasattr(client, "embed"):
+                # Embed4All nhận cả danh sách văn bản, tránh gọi mô hình từng câu một
+                vectors.extend([float(x) for x in vector] for vector in client.embed(batch))
+            else:
+                vectors.extend(self.model.embed_documents(batch))
+        self.counters["encoded"] += len(texts)
+        return vectors
+
+    def _lookup(self, keys):
+        found = {}
+        if not self.cache_file or not keys:
+            return found
+        conn = self._connection()
+        for start in range(0, len(keys), SQLITE_IN_LIMIT):
+            part = keys[start:start + SQLITE_IN_LIMIT]
+            placeholders = ",".join("?" * len(part))
+            for key, blob in conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", part):
+                found[key] = array("f", blob).tolist()
+        if found:
+            now = time.time()
+            with conn:
+                conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, key) for key in found])
+        return found
+
+    def _store(self, items):
+        if not self.cache_file or not items:
+            return
+        now = time.time()
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, array("f", vector).tobytes(), now) for key, vector in items],
+            )
+        self._writes_since_evict += len(items)
+        if self._writes_since_evict >= max(1, self.max_entries // 20):
+            self._evict()
+
+    def _evict(self):
+        conn = self._connection()
+        total = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        overflow = total - self.max_entries
+        if overflow > 0:
+            with conn:
+                conn.execute(
+                    "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (overflow,),
+                )
+            logger.info(f"Cache embedding: xóa {overflow} bản ghi cũ nhất")
+        self._writes_since_evict = 0
+
+    def embed_documents(self, texts):
+        keys = [self._key(text) for text in texts]
+        found = self._lookup(list(set(keys)))
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        self.counters["disk_hits"] += len(texts) - sum(1 for key in keys if key in missing)
+        self.counters["disk_misses"] += len(missing)
+        if missing:
+            vectors = self._encode(list(missing.values()))
+            encoded = dict(zip(missing.keys(), vectors))
+            self._store(list(encoded.items()))
+            found.update(encoded)
+        return [found[key] for key in keys]
+
+    @traced("embedding")
+    def embed_query(self, text):
+        key = self._key(text)
+        with self._query_lock:
+            vector = self._query_cache.get(key)
+            if vector is not None:
+                self._query_cache.move_to_end(key)
+                self.counters["query_lru_hits"] += 1
+                return vector
+        vector = self.embed_documents([text])[0]
+        with self._query_lock:
+            self._query_cache[key] = vector
+            if len(self._query_cache) > self.query_cache_size:
+                self._query_cache.popitem(last=False)
+        return vector
+
+    def stats(self):
+        lookups = self.counters["disk_hits"] + self.counters["disk_misses"]
+        return dict(self.counters, hit_rate=round(self.counters["disk_hits"] / lookups, 3) if lookups else 0.0)
+
+
+class StubEmbeddings(Embeddings):
+    """Embedding giả lập tất định khi không có file mô hình (benchmark, test).
+
+    Băm từ và 3-gram ký tự vào `dim` chiều rồi chuẩn hóa L2, nên các câu gần giống nhau
+    vẫn cho vector gần nhau.
+    """
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def _embed(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        text = " ".join(text.lower().split())
+        grams = text.split() + [text[i:i + 3] for i in range(max(1, len(text) - 2))]
+        for gram in grams:
+            digest = int(hashlib.md5(gram.encode("utf-8")).hexdigest()[:8], 16)
+            vector[digest % self.dim] += 1.0 if digest & 1 << 31 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
@@ -0,0 +1,205 @@
+# src/engine_registry.py
+import os
+import threading
+import time
+from langchain.chains import RetrievalQA
+from langchain.prompts import PromptTemplate
+from src.models import create_llm
+from src.embeddings import CachedEmbeddings
+from src.index_factory import load_vector_store
+from src.context_packer import ContextPacker, PackedRetriever
+from src.retrieval_cache import RetrievalCache
+from src.answer_cache import SemanticAnswerCache
+from src.answer_bank import load_answer_bank
+from src.prompts import QA_PROMPT_TEMPLATE
+from src.keyword_matcher import load_keyword_matcher
+from src.intent_classifier import load_intent_classifier
+from src.global_settings import VECTOR_DB_PATH, EMBEDDING_MODEL_FILE, ANSWER_CACHE_FILE
+from src.common.utils import logger
+from src.tracing import METRICS, span, start_exporter
+
+# Registry dùng chung cho toàn bộ tiến trình: mọi session và mọi lần rerun của Streamlit
+# đều dùng lại cùng một bộ tài nguyên nặng (mô hình embedding, FAISS, RetrievalQA, từ khóa).
+_REGISTRY = {}
+_REGISTRY_LOCK = threading.Lock()
+
+
+def current_rss_mb():
+    """Bộ nhớ thường trú (RSS) hiện tại của tiến trình, tính bằng MB"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        import resource
+        # ru_maxrss là giá trị đỉnh (KB trên Linux), dùng tạm khi không có /proc
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def create_qa_prompt():
+    # {system} (chỉ dẫn theo người dùng) chỉ được điền ở bước sinh của chat; chuỗi RetrievalQA để trống
+    return PromptTemplate(template=QA_PROMPT_TEMPLATE, input_variables=["context", "question"],
+                          partial_variables={"system": ""})
+
+
+def create_qa_chain(llm, db, retrieval_cache=None):
+    prompt = create_qa_prompt()
+    return RetrievalQA.from_chain_type(
+        llm=llm,
+        chain_type="stuff",
+        # Ngữ cảnh được gộp, khử trùng lặp và cắt theo ngân sách token trước khi vào prompt
+        retriever=PackedRetriever(vectorstore=db, packer=ContextPacker(), cache=retrieval_cache),
+        return_source_documents=True,
+        chain_type_kwargs={'prompt': prompt}
+    )
+
+
+class SharedResources:
+    """Tài nguyên không phụ thuộc người dùng, được tải đúng một lần cho mỗi khóa registry (index, mô hình, override).
+
+    `llm`/`embedding_model` thay cho Groq/GPT4All khi chạy với mô hình giả lập (API headless, benchmark);
+    khi đó nên trỏ `answer_cache_file` sang file riêng để câu trả lời giả lập không lẫn vào cache thật.
+    Khi index trên đĩa đổi phiên bản (`index_changed`), get_shared_resources nạp lại bộ tài nguyên mới.
+    """
+
+    def __init__(self, index_path: str, model_file: str, api_key: str, llm=None, embedding_model=None,
+                 answer_cache_file: str = ANSWER_CACHE_FILE):
+        self.index_path = index_path
+        self.model_file = model_file
+        rss_before = current_rss_mb()
+        start = time.perf_counter()
+
+        with span("engine_load"):
+            self.llm = llm or create_llm(api_key=api_key)
+            self.embedding_model = embedding_model or CachedEmbeddings(model_file=model_file)
+            self.db = self.load_vector_db()
+            self.retrieval_cache = RetrievalCache(index_path)
+            self.index_fingerprint = self.retrieval_cache.version
+            self.qa_prompt = create_qa_prompt()
+            self.qa_chain = self.create_qa_chain()
+            self.answer_cache = SemanticAnswerCache(self.embedding_model, cache_file=answer_cache_file)
+            self.answer_bank = load_answer_bank(index_path=index_path)
+            # Một automaton duy nhất cho cả ba nhóm từ khóa, dùng chung cho BotLogic và ConversationEngine
+            self.keyword_matcher = load_keyword_matcher()
+            # Định tuyến + nhận diện cảm xúc: mô hình tuyến tính NumPy, nạp từ .npz (huấn luyện lần đầu nếu thiếu)
+            self.intent_classifier = load_intent_classifier()
+
+        self.answer_cache_file = answer_cache_file
+        # Override do người gọi truyền vào get_shared_resources (phần khóa registry), dùng lại khi nạp lại
+        self.registry_overrides = {}
+        self.load_seconds = time.perf_counter() - start
+        self.rss_mb = current_rss_mb()
+        self.rss_delta_mb = self.rss_mb - rss_before
+        logger.info(
+            f"Đã tải tài nguyên dùng chung cho {index_path} ({model_file}) trong "
+            f"{self.load_seconds:.2f}s, bộ nhớ +{self.rss_delta_mb:.1f} MB (RSS {self.rss_mb:.1f} MB)"
+        )
+
+    def index_changed(self):
+        """Index trên đĩa đã khác phiên bản lúc nạp (build_data.py chạy lại); chỉ tốn vài lệnh stat"""
+        return self.retrieval_cache.current_version() != self.index_fingerprint
+
+    def reload_overrides(self):
+        """LLM và mô hình embedding không phụ thuộc index nên được dùng lại khi nạp lại"""
+        return {"llm": self.llm, "embedding_model": self.embedding_model, "answer_cache_file": self.answer_cache_file}
+
+    def load_vector_db(self):
+        try:
+            return load_vector_store(self.index_path, self.embedding_model)
+        except Exception as e:
+            raise RuntimeError(f"Lỗi khi tải Vector DB: {str(e)}")
+
+    def create_qa_chain(self):
+        return create_qa_chain(self.llm, self.db, self.retrieval_cache)
+
+    def stats(self):
+        return {
+            "index_path": self.index_path,
+            "model_file": self.model_file,
+            "load_seconds": round(self.load_seconds, 3),
+            "rss_delta_mb": round(self.rss_delta_mb, 1),
+            "rss_mb": round(self.rss_mb, 1),
+            "embedding_cache": self.embedding_model.stats() if hasattr(self.embedding_model, "stats") else {},
+            "answer_cache": self.answer_cache.stats(),
+            "retrieval_cache": self.retrieval_cache.stats(),
+        }
+
+
+def registry_key(index_path, model_file, llm=None, embedding_model=None, answer_cache_file=ANSWER_CACHE_FILE):
+    """Khóa registry: index, mô hình embedding và danh tính của các override.
+
+    LLM/mô hình embedding truyền vào được phân biệt theo đối tượng, file cache câu trả lời theo đường dẫn,
+    nên hai lần gọi với override khác nhau nhận hai bộ tài nguyên khác nhau thay vì bộ nạp trước.
+    """
+    return (os.path.abspath(index_path), os.path.abspath(model_file),
+            id(llm) if llm is not None else None, id(embedding_model) if embedding_model is not None else None,
+            os.path.abspath(answer_cache_file))
+
+
+def get_shared_resources(index_path: str = VECTOR_DB_PATH, model_file: str = EMBEDDING_MODEL_FILE, api_key: str = None,
+                         **overrides):
+    """Lấy (hoặc tải lần đầu) bộ tài nguyên dùng chung cho (index_path, model_file, overrides).
+
+    `overrides` (llm, embedding_model, answer_cache_file) là một phần của khóa (xem registry_key). Nếu index trên đĩa
+    đã đổi phiên bản, bộ tài nguyên được nạp lại (giữ LLM, mô hình embedding và cache câu trả lời của bộ cũ);
+    nếu nạp lại lỗi (ví dụ index đang được ghi dở), bộ cũ vẫn được dùng và lần gọi sau sẽ thử lại.
+    """
+    key = registry_key(index_path, model_file, **overrides)
+    resources = _REGISTRY.get(key)
+    if resources is not None and not resources.index_changed():
+        return resources
+    with _REGISTRY_LOCK:
+        # Kiểm tra lại sau khi giữ khóa để hai session không cùng tải (hoặc nạp lại) một lúc
+        resources = _REGISTRY.get(key)
+        if resources is None:
+            resources = SharedResources(index_path, model_file, api_key or os.getenv("GROQ_API_KEY"), **overrides)
+            resources.registry_overrides = overrides
+            _REGISTRY[key] = resources
+        elif resources.index_changed():
+            logger.info(f"Index {index_path} đã đổi phiên bản, nạp lại tài nguyên dùng chung.")
+            try:
+                resources = SharedResources(index_path, model_file, api_key or os.getenv("GROQ_API_KEY"),
+                                            **{**resources.reload_overrides(), **overrides})
+            except Exception as e:
+                logger.error(f"Không nạp lại được index {index_path}, tiếp tục dùng bản cũ: {e}")
+                return resources
+            resources.registry_overrides = overrides
+            _REGISTRY[key] = resources
+    start_exporter()
+    return resources
+
+
+def registry_stats():
+    """Thời gian tải và bộ nhớ của từng bộ tài nguyên đã nạp trong tiến trình"""
+    return [resources.stats() for resources in list(_REGISTRY.values())]
+
+
+# Bộ đếm sẵn có của các cache -> counter Prometheus (đọc khi xuất, không tốn gì trên đường xử lý)
+CACHE_COUNTERS = {
+    "embedding_cache": {"disk_hits": ("embedding_disk", "hit"), "disk_misses": ("embedding_disk", "miss"),
+                        "query_lru_hits": ("embedding_query_lru", "hit")},
+    "answer_cache": {"exact_hits": ("answer", "exact_hit"), "semantic_hits": ("answer", "semantic_hit"),
+                     "misses": ("answer", "miss")},
+    "retrieval_cache": {"hits": ("retrieval", "hit"), "misses": ("retrieval", "miss")},
+}
+
+
+def cache_metrics():
+    samples = []
+    for stats in registry_stats():
+        for group, mapping in CACHE_COUNTERS.items():
+            for counter, (cache, result) in mapping.items():
+                samples.append(("cache_requests_total", {"index": os.path.basename(stats["index_path"]), "cache": cache,
+                                                         "result": result}, stats[group].get(counter, 0)))
+        samples.append(("resources_load_seconds", {"index": os.path.basename(stats["index_path"])}, stats["load_seconds"]))
+        samples.append(("resources_rss_mb", {"index": os.path.basename(stats["index_path"])}, stats["rss_mb"]))
+    return samples
+
+
+METRICS.register_collector(cache_metrics)
+
+
+def clear_registry():
+    """Giải phóng toàn bộ tài nguyên (dùng khi index được build lại)"""
+    with _REGISTRY_LOCK:
+        _REGISTRY.clear()
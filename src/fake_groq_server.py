@@ -0,0 +1,130 @@
+# src/fake_groq_server.py
+"""Server HTTP giả lập API chat completions của Groq (tương thích OpenAI) để test client cục bộ.
+
+Chạy: python -m src.fake_groq_server --port 8765 --rpm 60
+rồi đặt GROQ_API_BASE=http://127.0.0.1:8765 trước khi khởi động ứng dụng.
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeGroqState:
+    def __init__(self, requests_per_minute=60, latency_seconds=0.05, fail_first=0, stream_error_after=None):
+        self.requests_per_minute = requests_per_minute
+        self.latency_seconds = latency_seconds
+        self.fail_first = fail_first
+        # Số chunk stream gửi được trước khi server gửi sự kiện lỗi (None = không lỗi)
+        self.stream_error_after = stream_error_after
+        self.window_start = time.monotonic()
+        self.used = 0
+        self.total = 0
+        # Nội dung tin nhắn cuối của mỗi request theo thứ tự server nhận (để test kiểm tra thứ tự ưu tiên)
+        self.prompts = []
+        self.lock = threading.Lock()
+
+    def take(self):
+        """Trả về (được phép?, số request còn lại, giây tới khi reset)"""
+        with self.lock:
+            self.total += 1
+            now = time.monotonic()
+            if now - self.window_start >= 60:
+                self.window_start, self.used = now, 0
+            reset = 60 - (now - self.window_start)
+            if self.total <= self.fail_first or self.used >= self.requests_per_minute:
+                return False, max(0, self.requests_per_minute - self.used), reset
+            self.used += 1
+            return True, self.requests_per_minute - self.used, reset
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _rate_headers(self, remaining, reset):
+            self.send_header("x-ratelimit-limit-requests", str(state.requests_per_minute))
+            self.send_header("x-ratelimit-remaining-requests", str(remaining))
+            self.send_header("x-ratelimit-reset-requests", f"{reset:.2f}s")
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            question = body.get("messages", [{}])[-1].get("content", "")
+            with state.lock:
+                state.prompts.append(question)
+            allowed, remaining, reset = state.take()
+            if not allowed:
+                payload = json.dumps({"error": {"message": "Rate limit reached", "type": "tokens"}}).encode()
+                self.send_response(429)
+                self._rate_headers(remaining, reset)
+                self.send_header("retry-after", "1")
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+                return
+
+            time.sleep(state.latency_seconds)
+            answer = f"Trả lời giả lập ({len(question)} ký tự đầu vào)."
+            model = body.get("model", "fake")
+            if body.get("stream"):
+                self.send_response(200)
+                self._rate_headers(remaining, reset)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                for index, word in enumerate(answer.split(" ")):
+                    if index == state.stream_error_after:
+                        error = {"error": {"message": "Stream interrupted", "type": "internal_server_error"}}
+                        self.wfile.write(f"data: {json.dumps(error)}\n\n".encode())
+                        self.close_connection = True
+                        return
+                    chunk = {"id": "fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                             "model": model, "choices": [{"index": 0, "delta": {"role": "assistant", "content": (" " if index else "") + word},
+                                                          "finish_reason": None}]}
+                    self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+                    self.wfile.flush()
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.close_connection = True
+                return
+
+            payload = json.dumps({
+                "id": "fake", "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": len(question) // 4, "completion_tokens": len(answer) // 4,
+                          "total_tokens": (len(question) + len(answer)) // 4},
+            }, ensure_ascii=False).encode()
+            self.send_response(200)
+            self._rate_headers(remaining, reset)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    return Handler
+
+
+def serve(port=8765, requests_per_minute=60, latency_seconds=0.05, fail_first=0, stream_error_after=None):
+    """Khởi động server trong luồng nền, trả về (server, state)"""
+    state = FakeGroqState(requests_per_minute, latency_seconds, fail_first, stream_error_after)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(state))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Server Groq giả lập")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--rpm", type=int, default=60, help="số request mỗi phút trước khi trả 429")
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+    server, _ = serve(args.port, args.rpm, args.latency)
+    print(f"Fake Groq đang chạy tại http://127.0.0.1:{args.port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -12,4 +12,126 @@ CHAT_HISTORY_FILE = os.path.join(CACHE_PATH, "chat_history.json")
 MODELS_PATH = "models"
 # Cập nhật tên file mô hình chính xác
 EMBEDDING_MODEL_FILE = os.path.join(MODELS_PATH, "all-MiniLM-L6-v2-f16.gguf")
-LLM_MODEL_FILE = os.path.join(MODELS_PATH, "Meta-Llama-3-8B-Instruct-Q4_K_M.gguf")
\ No newline at end of file
+LLM_MODEL_FILE = os.path.join(MODELS_PATH, "Meta-Llama-3-8B-Instruct-Q4_K_M.gguf")
+KEYWORDS_PATH = os.path.join(DATA_PATH, "keywords")
+# Bỏ dấu tiếng Việt khi so khớp từ khóa (ví dụ "buon" khớp "buồn", nhưng "buôn" cũng khớp "buồn")
+KEYWORD_FOLD_DIACRITICS = False
+# Bộ phân loại ý định + cảm xúc (hash n-gram ký tự, mô hình tuyến tính NumPy) huấn luyện từ data/keywords/*.csv
+# và mẫu tin nhắn đã gán nhãn; file mô hình được huấn luyện lại khi dữ liệu nguồn thay đổi
+INTENT_LABELLED_FILE = os.path.join(KEYWORDS_PATH, "labelled_messages.csv")
+INTENT_MODEL_FILE = os.path.join(CACHE_PATH, "intent_model.npz")
+INTENT_HASH_BITS = 14
+INTENT_NGRAM_RANGE = (2, 4)
+INTENT_EMOTION_MIN_PROB = 0.5
+# Số tiến trình con dùng để parse PDF khi ingest
+INGEST_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+
+# Cache embedding trên đĩa (SQLite) và LRU cho câu truy vấn
+EMBEDDING_CACHE_FILE = os.path.join(CACHE_PATH, "embeddings.sqlite")
+EMBEDDING_BATCH_SIZE = 32
+EMBEDDING_CACHE_MAX_ENTRIES = 200_000
+QUERY_EMBEDDING_LRU_SIZE = 1024
+
+# Cache câu trả lời (khớp chính xác + tương đồng ngữ nghĩa) đặt trước qa_chain
+ANSWER_CACHE_FILE = os.path.join(CACHE_PATH, "answer_cache.sqlite")
+# Cache riêng khi chạy với LLM/embedding giả lập, để câu trả lời "[stub…]" không bao giờ vào cache thật
+STUB_ANSWER_CACHE_FILE = os.path.join(CACHE_PATH, "answer_cache.stub.sqlite")
+ANSWER_CACHE_SIMILARITY = 0.95
+ANSWER_CACHE_TTL_SECONDS = 7 * 24 * 3600
+ANSWER_CACHE_MAX_ENTRIES = 5000
+
+# Câu trả lời tính sẵn cho luồng câu hỏi mức độ (gắn với phiên bản index hiện tại)
+ANSWER_BANK_FILE = os.path.join(INDEX_STORAGE_PATH, "answer_bank.json")
+# build_data.py --answer-bank --stub-llm ghi vào file riêng; answer bank do LLM giả lập sinh ra bị từ chối khi nạp
+STUB_ANSWER_BANK_FILE = os.path.join(INDEX_STORAGE_PATH, "answer_bank.stub.json")
+# Khi câu hỏi mức độ được hiển thị, chạy trước truy hồi + LLM cho các mức độ chưa có trong answer bank
+# trên pool luồng giới hạn dùng chung của tiến trình; thời gian tối đa chờ job đang chạy khi người dùng chọn
+PREFETCH_SEVERITY_ANSWERS = os.getenv("PREFETCH_SEVERITY_ANSWERS", "1") != "0"
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", "2"))
+PREFETCH_WAIT_TIMEOUT = 60.0
+
+# Client LLM (Groq): URL gốc có thể trỏ tới server giả lập cục bộ khi test
+GROQ_BASE_URL = os.getenv("GROQ_API_BASE")
+LLM_REQUEST_TIMEOUT = 30.0
+LLM_QUEUE_TIMEOUT = 60.0
+LLM_MAX_RETRIES = 3
+LLM_MAX_CONCURRENCY = 8
+LLM_MAX_CONNECTIONS = 16
+LLM_REQUESTS_PER_MINUTE = 30
+
+# Backend LLM: "groq" (API), "local" (GGUF chạy trên CPU qua llama-cpp-python, khi mất mạng hoặc Groq giới hạn)
+# hoặc "stub" (giả lập)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "groq")
+LOCAL_LLM_THREADS = int(os.getenv("LOCAL_LLM_THREADS", "0")) or (os.cpu_count() or 4)
+LOCAL_LLM_CONTEXT_LENGTH = 4096
+LOCAL_LLM_MAX_NEW_TOKENS = 512
+# Số token đánh giá mỗi bước khi nạp prompt, và số yêu cầu tối đa gom vào một lượt lập lịch
+LOCAL_LLM_EVAL_BATCH_SIZE = 512
+LOCAL_LLM_MAX_BATCH = 8
+
+# Lịch sử hội thoại theo người dùng (SQLite, chế độ WAL)
+HISTORY_DB_FILE = os.path.join(USER_STORAGE_PATH, "history.sqlite")
+HISTORY_SEARCH_PAGE_SIZE = 10
+# Cửa sổ hiển thị hội thoại: số tin nhắn cuối được vẽ, cỡ trang khi nạp thêm, cỡ cache tin nhắn trong session
+CONVERSATION_WINDOW_SIZE = 30
+CONVERSATION_PAGE_SIZE = 30
+CONVERSATION_CACHE_SIZE = 200
+
+# Loại index ANN: "flat" (chính xác), "ivf_flat", "ivf_pq" hoặc "hnsw" và tham số huấn luyện/tìm kiếm
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "flat")
+VECTOR_INDEX_PARAMS = {"nlist": 256, "nprobe": 16, "pq_m": 16, "pq_nbits": 8, "M": 32, "efConstruction": 80, "efSearch": 64}
+# Đọc index qua mmap thay vì sao chép toàn bộ vào RAM
+VECTOR_INDEX_MMAP = True
+
+# Cắt chunk khi ingest (đổi giá trị sẽ làm build_data.py dựng lại toàn bộ index);
+# dùng `python evaluate.py --sweep` để so sánh các cấu hình trước khi đổi
+CHUNK_SIZE = 512
+CHUNK_OVERLAP = 50
+
+# Truy hồi và ghép ngữ cảnh: số chunk lấy từ FAISS, ngân sách token cho phần ngữ cảnh trong prompt,
+# ngưỡng Jaccard (3-gram từ) để coi hai đoạn là gần trùng, số token tối thiểu của đoạn bị cắt bớt để còn được giữ
+RETRIEVAL_K = 3
+CONTEXT_TOKEN_BUDGET = 512
+CONTEXT_DEDUP_SIMILARITY = 0.8
+CONTEXT_MIN_BLOCK_TOKENS = 32
+# Số câu truy vấn (đã chuẩn hóa) giữ kết quả truy hồi top-k trong bộ nhớ
+RETRIEVAL_CACHE_SIZE = 2048
+# Câu truy vấn truy hồi chỉ lấy từ câu nhập (cắt ở độ dài này) và từ khóa khớp; system prompt theo người dùng
+# được dựng sẵn một lần và chỉ đưa vào bước sinh
+RETRIEVAL_QUERY_MAX_CHARS = 500
+SYSTEM_PROMPT_CACHE_SIZE = 1024
+
+# Benchmark pipeline chat (evaluate.py): bộ câu nhập cố định và baseline để so sánh hồi quy
+BENCHMARK_PATH = os.path.join(DATA_PATH, "benchmark")
+BENCHMARK_CORPUS_FILE = os.path.join(BENCHMARK_PATH, "prompts.json")
+BENCHMARK_BASELINE_FILE = os.path.join(BENCHMARK_PATH, "baseline.json")
+# Bộ câu hỏi -> trang đáp án (DSM-5) để chấm recall khi quét tham số chunk (evaluate.py --sweep)
+BENCHMARK_GOLDEN_FILE = os.path.join(BENCHMARK_PATH, "golden.json")
+
+# Tracing và số liệu: span theo giai đoạn, histogram/counter trong tiến trình, xuất định dạng Prometheus
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "1") != "0"
+# Số mẫu gần nhất giữ lại để tính percentile và số lượt xử lý gần nhất hiển thị trên trang admin
+TRACE_SAMPLE_SIZE = 2048
+TRACE_RECENT_SIZE = 50
+METRICS_EXPORT_FILE = os.path.join(CACHE_PATH, "metrics.prom")
+METRICS_EXPORT_INTERVAL = 15
+# Đặt METRICS_PORT để phục vụ http://127.0.0.1:<port>/metrics cho Prometheus
+METRICS_PORT = os.getenv("METRICS_PORT")
+# Người dùng được xem trang quản trị (pages/admin.py)
+ADMIN_USERS = {"admin"}
+# Ngân sách thời gian import khi khởi động các trang (benchmark_startup.py)
+STARTUP_BUDGET_FILE = os.path.join(BENCHMARK_PATH, "startup_budget.json")
+
+# API HTTP headless (python -m src.chat_api): các worker dùng chung index FAISS/docstore qua mmap
+API_HOST = os.getenv("API_HOST", "127.0.0.1")
+API_PORT = int(os.getenv("API_PORT", "8000"))
+API_WORKERS = int(os.getenv("API_WORKERS", "2"))
+# Danh tính người dùng của API không lấy từ nội dung yêu cầu mà từ xác thực, theo một trong hai cách:
+# - CHAT_API_TOKENS="<token>=<username>,...": mỗi token (header "Authorization: Bearer <token>") gắn với một người dùng
+# - CHAT_API_USER_HEADER (vd. "X-Authenticated-User"): header do reverse proxy tin cậy đặt sau khi đã xác thực;
+#   khi có CHAT_API_KEY, proxy phải gửi kèm "Authorization: Bearer <CHAT_API_KEY>"
+API_TOKENS = dict(item.strip().split("=", 1) for item in os.getenv("CHAT_API_TOKENS", "").split(",") if "=" in item)
+API_USER_HEADER = os.getenv("CHAT_API_USER_HEADER") or None
+API_KEY = os.getenv("CHAT_API_KEY")
+# Số BotLogic (theo người dùng) giữ trong mỗi worker
+API_ENGINE_CACHE_SIZE = 256
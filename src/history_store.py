@@ -0,0 +1,346 @@
+# src/history_store.py
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import unicodedata
+import threading
+import time
+from src.global_settings import HISTORY_DB_FILE, CHAT_HISTORY_FILE, HISTORY_SEARCH_PAGE_SIZE
+from src.keyword_matcher import fold_char
+from src.common.utils import logger
+from src.tracing import traced
+
+SNIPPET_RADIUS = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL,
+    name TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS conversations_user ON conversations(username, updated_at);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    conversation_id INTEGER NOT NULL REFERENCES conversations(id),
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    time TEXT,
+    question TEXT,
+    options TEXT
+);
+CREATE INDEX IF NOT EXISTS messages_conversation ON messages(conversation_id, id);
+-- Các cuộc hội thoại đã nhập từ file JSON cũ (dấu vân tay nội dung), để chạy lại import không nhân bản
+CREATE TABLE IF NOT EXISTS imported_conversations (
+    username TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    conversation_id INTEGER NOT NULL REFERENCES conversations(id),
+    PRIMARY KEY (username, fingerprint)
+);
+-- Chỉ mục đảo (FTS5) trên nội dung đã bỏ dấu; rowid = messages.id
+CREATE VIRTUAL TABLE IF NOT EXISTS message_index USING fts5(
+    folded, owner, conversation_id UNINDEXED, tokenize = 'unicode61'
+);
+"""
+
+
+def fold_for_index(text):
+    """Chữ thường + bỏ dấu tiếng Việt, giữ nguyên độ dài chuỗi để ánh xạ vị trí về văn bản gốc"""
+    chars = []
+    for char in unicodedata.normalize("NFC", text or ""):
+        lower = char.lower()
+        chars.append(fold_char(lower if len(lower) == 1 else char))
+    return "".join(chars)
+
+
+def owner_token(username):
+    """Token đại diện người dùng trong chỉ mục, để lọc kết quả ngay trong truy vấn MATCH"""
+    return "u" + hashlib.sha1(username.encode("utf-8")).hexdigest()[:16]
+
+
+def query_terms(query):
+    return re.findall(r"\w+", fold_for_index(query))
+
+
+def make_snippet(content, terms, radius=SNIPPET_RADIUS):
+    """Đoạn trích quanh vị trí khớp đầu tiên, tô đậm các từ khớp"""
+    content = unicodedata.normalize("NFC", content or "")
+    folded = fold_for_index(content)
+    spans = []
+    for index, term in enumerate(terms):
+        # Từ cuối được khớp theo tiền tố (như truy vấn FTS), các từ khác phải khớp nguyên từ
+        pattern = r"\b" + re.escape(term) + (r"\w*" if index == len(terms) - 1 else r"\b")
+        for match in re.finditer(pattern, folded):
+            spans.append((match.start(), match.end()))
+    if not spans:
+        return content[:2 * radius] + ("…" if len(content) > 2 * radius else "")
+    spans.sort()
+    start = max(0, spans[0][0] - radius)
+    end = min(len(content), spans[0][1] + radius)
+    pieces, cursor = [], start
+    for span_start, span_end in spans:
+        if span_start < cursor or span_end > end:
+            continue
+        pieces.append(content[cursor:span_start])
+        pieces.append(f"**{content[span_start:span_end]}**")
+        cursor = span_end
+    pieces.append(content[cursor:end])
+    return ("…" if start > 0 else "") + "".join(pieces) + ("…" if end < len(content) else "")
+
+
+def conversation_fingerprint(conv):
+    return hashlib.sha256(json.dumps(conv, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def row_to_message(row):
+    message_id, role, content, sent_time, question, options = row
+    message = {"id": message_id, "role": role, "content": content, "time": sent_time, "message": content}
+    if question and options:
+        message["question"] = question
+        message["options"] = json.loads(options)
+    return message
+
+
+class HistoryStore:
+    """Lịch sử hội thoại theo từng người dùng, từng cuộc hội thoại, lưu dạng bản ghi chỉ-nối-thêm.
+
+    SQLite ở chế độ WAL: mỗi tin nhắn là một INSERT (O(1)), đọc chỉ lấy đúng một cuộc hội thoại,
+    và nhiều tiến trình/luồng có thể ghi đồng thời mà không ghi đè lên nhau.
+    """
+
+    def __init__(self, db_file=HISTORY_DB_FILE):
+        self.db_file = db_file
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(db_file) or ".", exist_ok=True)
+        conn = self._connection()
+        conn.executescript(SCHEMA)
+        self._backfill_index(conn)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            conn.create_function("fold_for_index", 1, fold_for_index, deterministic=True)
+            conn.create_function("owner_token", 1, owner_token, deterministic=True)
+            self._local.conn = conn
+        return conn
+
+    def _backfill_index(self, conn):
+        """Đưa vào chỉ mục các tin nhắn chưa được đánh chỉ mục (dữ liệu ghi trước khi có FTS)"""
+        with conn:
+            cursor = conn.execute(
+                "INSERT INTO message_index (rowid, folded, owner, conversation_id) "
+                "SELECT m.id, fold_for_index(m.content), owner_token(c.username), m.conversation_id "
+                "FROM messages m JOIN conversations c ON c.id = m.conversation_id "
+                "WHERE m.id > (SELECT COALESCE(MAX(rowid), 0) FROM message_index)"
+            )
+        if cursor.rowcount > 0:
+            logger.info(f"Đã đánh chỉ mục {cursor.rowcount} tin nhắn cũ cho tìm kiếm lịch sử")
+
+    @traced("persistence")
+    def create_conversation(self, username, name):
+        conn = self._connection()
+        with conn:
+            return self._insert_conversation(conn, username, name)
+
+    @traced("persistence")
+    def append_message(self, conversation_id, message):
+        """Nối một tin nhắn vào cuối cuộc hội thoại, trả về id của tin nhắn"""
+        conn = self._connection()
+        with conn:
+            return self._insert_message(conn, conversation_id, message)
+
+    @staticmethod
+    def _insert_conversation(conn, username, name):
+        now = time.time()
+        cursor = conn.execute(
+            "INSERT INTO conversations (username, name, created_at, updated_at) VALUES (?, ?, ?, ?)",
+            (username, name or "New Chat", now, now),
+        )
+        return cursor.lastrowid
+
+    @staticmethod
+    def _insert_message(conn, conversation_id, message):
+        """Ghi tin nhắn + chỉ mục đảo trong transaction hiện tại của `conn` (người gọi commit)"""
+        options = message.get("options")
+        # Dữ liệu cũ có tin nhắn dạng số (ví dụ lựa chọn 1, 3): lưu và đánh chỉ mục dưới dạng chuỗi
+        content = message.get("content")
+        content = "" if content is None else str(content)
+        cursor = conn.execute(
+            "INSERT INTO messages (conversation_id, role, content, time, question, options) VALUES (?, ?, ?, ?, ?, ?)",
+            (conversation_id, message["role"], content, message.get("time"),
+             message.get("question"), json.dumps(options, ensure_ascii=False) if options else None),
+        )
+        message_id = cursor.lastrowid
+        conn.execute(
+            "INSERT INTO message_index (rowid, folded, owner, conversation_id) "
+            "SELECT ?, ?, owner_token(username), id FROM conversations WHERE id = ?",
+            (message_id, fold_for_index(content), conversation_id),
+        )
+        conn.execute("UPDATE conversations SET updated_at = ? WHERE id = ?", (time.time(), conversation_id))
+        return message_id
+
+    def list_conversations(self, username, limit=100):
+        rows = self._connection().execute(
+            "SELECT id, name, updated_at FROM conversations WHERE username = ? ORDER BY updated_at DESC LIMIT ?",
+            (username, limit),
+        ).fetchall()
+        return [{"id": conv_id, "name": name, "updated_at": updated_at} for conv_id, name, updated_at in rows]
+
+    def get_conversation(self, conversation_id, with_messages=True):
+        conn = self._connection()
+        row = conn.execute("SELECT id, username, name FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+        if row is None:
+            return None
+        conversation = {"id": row[0], "username": row[1], "name": row[2]}
+        if with_messages:
+            messages = conn.execute(
+                "SELECT id, role, content, time, question, options FROM messages WHERE conversation_id = ? ORDER BY id",
+                (conversation_id,),
+            ).fetchall()
+            conversation["messages"] = [row_to_message(m) for m in messages]
+        return conversation
+
+    def fetch_messages(self, conversation_id, before_id=None, limit=50):
+        """Trang `limit` tin nhắn mới nhất có id < before_id (theo thứ tự thời gian), đọc qua chỉ mục (conversation_id, id)"""
+        rows = self._connection().execute(
+            "SELECT id, role, content, time, question, options FROM messages "
+            "WHERE conversation_id = ? AND id < ? ORDER BY id DESC LIMIT ?",
+            (conversation_id, before_id if before_id is not None else 2 ** 63 - 1, limit),
+        ).fetchall()
+        return [row_to_message(row) for row in reversed(rows)]
+
+    def get_messages(self, message_ids):
+        """Đọc các tin nhắn theo id, trả về dict id -> tin nhắn"""
+        if not message_ids:
+            return {}
+        placeholders = ",".join("?" * len(message_ids))
+        rows = self._connection().execute(
+            f"SELECT id, role, content, time, question, options FROM messages WHERE id IN ({placeholders})",
+            list(message_ids),
+        ).fetchall()
+        return {row[0]: row_to_message(row) for row in rows}
+
+    def latest_conversation_id(self, username):
+        row = self._connection().execute(
+            "SELECT id FROM conversations WHERE username = ? ORDER BY updated_at DESC LIMIT 1", (username,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def search(self, username, query, page=0, page_size=HISTORY_SEARCH_PAGE_SIZE):
+        """Tìm các cuộc hội thoại của người dùng theo nội dung tin nhắn, xếp hạng BM25, có phân trang.
+
+        Trả về {"results": [{"id", "name", "message_id", "snippet", "score"}], "total", "page", "page_size"}.
+        Từ cuối của truy vấn được khớp theo tiền tố để kết quả cập nhật ngay khi đang gõ.
+        """
+        terms = query_terms(query)
+        empty = {"results": [], "total": 0, "page": page, "page_size": page_size}
+        if not terms:
+            return empty
+        match = f'owner : "{owner_token(username)}" AND ' + " AND ".join(
+            f'folded : "{term}"' + ("*" if index == len(terms) - 1 else "") for index, term in enumerate(terms)
+        )
+        conn = self._connection()
+        hits = (
+            "WITH hits AS MATERIALIZED (SELECT rowid AS message_id, conversation_id, bm25(message_index) AS score "
+            "FROM message_index WHERE message_index MATCH ?) "
+        )
+        total = conn.execute(hits + "SELECT COUNT(DISTINCT conversation_id) FROM hits", (match,)).fetchone()[0]
+        if not total:
+            return empty
+        rows = conn.execute(
+            hits + "SELECT best.conversation_id, best.message_id, best.score, c.name, m.content FROM "
+            "(SELECT conversation_id, message_id, MIN(score) AS score FROM hits GROUP BY conversation_id) best "
+            "JOIN conversations c ON c.id = best.conversation_id JOIN messages m ON m.id = best.message_id "
+            "ORDER BY best.score LIMIT ? OFFSET ?",
+            (match, page_size, page * page_size),
+        ).fetchall()
+        results = [
+            {"id": conv_id, "name": name, "message_id": message_id, "score": round(-score, 4),
+             "snippet": make_snippet(content, terms)}
+            for conv_id, message_id, score, name, content in rows
+        ]
+        return {"results": results, "total": total, "page": page, "page_size": page_size}
+
+    @staticmethod
+    def _find_imported(conn, username, fingerprint, name, first_message):
+        """Id cuộc hội thoại đã nhập trước đó từ cùng nội dung, hoặc None"""
+        row = conn.execute("SELECT conversation_id FROM imported_conversations WHERE username = ? AND fingerprint = ?",
+                           (username, fingerprint)).fetchone()
+        if row is not None:
+            return row[0]
+        if not first_message:
+            return None
+        content = first_message[0].get("content")
+        row = conn.execute(
+            "SELECT c.id FROM conversations c JOIN messages m ON m.id = "
+            "(SELECT MIN(id) FROM messages WHERE conversation_id = c.id) "
+            "WHERE c.username = ? AND c.name = ? AND m.time IS ? AND m.content = ? LIMIT 1",
+            (username, name or "New Chat", first_message[0].get("time"), "" if content is None else str(content)),
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute("INSERT INTO imported_conversations (username, fingerprint, conversation_id) VALUES (?, ?, ?)",
+                     (username, fingerprint, row[0]))
+        return row[0]
+
+    def import_json(self, json_file, username):
+        """Nhập file chat_history.json cũ (danh sách {"name", "messages"}) cho một người dùng.
+
+        Toàn bộ file được ghi trong một transaction: lỗi giữa chừng không để lại cuộc hội thoại nhập dở.
+        Chạy lại an toàn: cuộc hội thoại đã nhập (cùng nội dung) được bỏ qua, kể cả khi được nhập trước
+        khi có bảng imported_conversations (khớp tên + thời gian và nội dung tin nhắn đầu).
+        """
+        with open(json_file, "r", encoding="utf-8") as f:
+            history = json.load(f)
+        imported = 0
+        conn = self._connection()
+        with conn:
+            for conv in history:
+                if not isinstance(conv, dict) or "messages" not in conv:
+                    continue  # định dạng cũ của chat_interface (danh sách tin nhắn phẳng) không có tên hội thoại
+                messages = [dict(message, content=message.get("content", message.get("message", "")))
+                            for message in conv["messages"]]
+                fingerprint = conversation_fingerprint(conv)
+                if self._find_imported(conn, username, fingerprint, conv.get("name"), messages[:1]) is not None:
+                    continue
+                conversation_id = self._insert_conversation(conn, username, conv.get("name"))
+                for message in messages:
+                    self._insert_message(conn, conversation_id, message)
+                conn.execute("INSERT INTO imported_conversations (username, fingerprint, conversation_id) VALUES (?, ?, ?)",
+                             (username, fingerprint, conversation_id))
+                imported += 1
+        logger.info(f"Đã nhập {imported} cuộc hội thoại từ {json_file} cho {username}")
+        return imported
+
+
+_STORES = {}
+_STORES_LOCK = threading.Lock()
+
+
+def get_history_store(db_file=HISTORY_DB_FILE):
+    """Một HistoryStore cho mỗi file trong tiến trình"""
+    store = _STORES.get(db_file)
+    if store is None:
+        with _STORES_LOCK:
+            store = _STORES.get(db_file)
+            if store is None:
+                store = _STORES[db_file] = HistoryStore(db_file)
+    return store
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Nhập lịch sử hội thoại từ file JSON cũ")
+    parser.add_argument("username", help="người dùng sở hữu lịch sử được nhập")
+    parser.add_argument("--json-file", default=CHAT_HISTORY_FILE)
+    parser.add_argument("--db-file", default=HISTORY_DB_FILE)
+    args = parser.parse_args()
+    count = HistoryStore(args.db_file).import_json(args.json_file, args.username)
+    print(f"Đã nhập {count} cuộc hội thoại.")
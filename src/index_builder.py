@@ -1,16 +1,159 @@
-from langchain_community.document_loaders import PyPDFLoader, DirectoryLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import GPT4AllEmbeddings
-from src.global_settings import INGESTION_STORAGE_PATH, VECTOR_DB_PATH, EMBEDDING_MODEL_FILE
-
-def build_index():
-    loader = DirectoryLoader(INGESTION_STORAGE_PATH, glob="*.pdf", loader_cls=PyPDFLoader)
-    documents = loader.load()
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=512, chunk_overlap=50)
-    chunks = text_splitter.split_documents(documents)
-    # Sử dụng GPT4AllEmbeddings với file .gguf
-    embedding_model = GPT4AllEmbeddings(model_file=EMBEDDING_MODEL_FILE)
-    db = FAISS.from_documents(chunks, embedding_model)
-    db.save_local(VECTOR_DB_PATH)
-    return db
\ No newline at end of file
+import hashlib
+import json
+import os
+import faiss
+import numpy as np
+from src.embeddings import CachedEmbeddings
+from src.docstore import ColumnarDocstore, PICKLE_DOCSTORE_FILE, write_docstore, has_docstore, convert_pickle_docstore
+from src.index_factory import FLAT_INDEX_FILE, build_ann_index, load_vector_store
+from src.ingest_pipeline import StageTimer, list_pdf_files, iter_pages, iter_chunks
+from src.global_settings import INGESTION_STORAGE_PATH, VECTOR_DB_PATH, EMBEDDING_MODEL_FILE, CHUNK_SIZE, CHUNK_OVERLAP
+from src.common.utils import logger
+
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 2
+EMBED_BATCH_SIZE = 64
+
+
+def page_chunk_ids(file_name, page_no, chunks):
+    """ID của chunk = hash nội dung (kèm tên file, trang và số lần lặp lại trong cùng trang)"""
+    ids = []
+    seen = {}
+    for chunk in chunks:
+        occurrence = seen.get(chunk.page_content, 0)
+        seen[chunk.page_content] = occurrence + 1
+        payload = f"{file_name}\x00{page_no}\x00{occurrence}\x00{chunk.page_content}"
+        ids.append(hashlib.sha256(payload.encode("utf-8")).hexdigest())
+    return ids
+
+
+def load_manifest(index_path):
+    manifest_path = os.path.join(index_path, MANIFEST_FILE)
+    if not os.path.exists(manifest_path) or not os.path.exists(os.path.join(index_path, "index.faiss")):
+        return None
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Manifest index không hợp lệ, sẽ build lại toàn bộ: {e}")
+        return None
+    expected = {"version": MANIFEST_VERSION, "chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP,
+                "embedding_model": os.path.basename(EMBEDDING_MODEL_FILE)}
+    if any(manifest.get(key) != value for key, value in expected.items()):
+        logger.info("Cấu hình chunk hoặc mô hình embedding đã đổi, sẽ build lại toàn bộ index.")
+        return None
+    return manifest
+
+
+def save_manifest(index_path, files):
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "embedding_model": os.path.basename(EMBEDDING_MODEL_FILE),
+        "files": files,
+    }
+    manifest_path = os.path.join(index_path, MANIFEST_FILE)
+    with open(manifest_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+
+def build_index(index_path=VECTOR_DB_PATH, source_path=INGESTION_STORAGE_PATH, timer=None, index_config=None):
+    """Build index tăng dần: chỉ embed chunk mới/đổi, xóa vector của chunk đã bị loại bỏ.
+
+    Trang được parse song song và cắt chunk ngay khi tới; chunk mới được embed theo lô
+    trong lúc các tiến trình con vẫn đang parse phần còn lại. Sau đó index ANN theo `index_config`
+    (mặc định VECTOR_INDEX_TYPE) được dựng lại từ index flat nếu cần.
+    """
+    timer = timer or StageTimer()
+    manifest = load_manifest(index_path)
+    if manifest is not None and not has_docstore(index_path):
+        # Thư mục index cũ còn docstore dạng pickle: chuyển sang dạng cột trước khi cập nhật tăng dần
+        convert_pickle_docstore(index_path, remove_pickle=True)
+    old_files = manifest["files"] if manifest else {}
+    # GPT4AllEmbeddings với file .gguf, qua cache trên đĩa để chunk trùng không phải embed lại
+    embedding_model = CachedEmbeddings(model_file=EMBEDDING_MODEL_FILE)
+
+    files = {}
+    to_parse = []
+    for file_name, file_path, sha256 in list_pdf_files(source_path):
+        old_entry = old_files.get(file_name)
+        if old_entry and old_entry["sha256"] == sha256:
+            files[file_name] = old_entry
+        else:
+            to_parse.append((file_name, file_path, sha256))
+            files[file_name] = {"sha256": sha256, "pages": {}}
+    names_by_path = {file_path: file_name for file_name, file_path, _ in to_parse}
+    known_ids = {file_name: set(old_files[file_name]["chunks"]) for file_name, _, _ in to_parse if file_name in old_files}
+
+    embedded, batch = [], []
+
+    def flush():
+        if batch:
+            with timer.measure("embed"):
+                vectors = embedding_model.embed_documents([chunk.page_content for chunk, _ in batch])
+            embedded.extend((chunk, chunk_id, vector) for (chunk, chunk_id), vector in zip(batch, vectors))
+            batch.clear()
+
+    for page, chunks in iter_chunks(iter_pages(to_parse, timer), timer):
+        file_name = names_by_path[page.metadata["source"]]
+        page_no = page.metadata["page"]
+        ids = page_chunk_ids(file_name, page_no, chunks)
+        files[file_name]["pages"][str(page_no)] = ids
+        for chunk, chunk_id in zip(chunks, ids):
+            if chunk_id not in known_ids.get(file_name, ()):
+                batch.append((chunk, chunk_id))
+        if len(batch) >= EMBED_BATCH_SIZE:
+            flush()
+    flush()
+
+    # Gộp ID theo thứ tự trang để manifest ổn định giữa các lần build
+    for file_name, _, _ in to_parse:
+        pages = files[file_name].pop("pages")
+        files[file_name]["chunks"] = [chunk_id for page_no in sorted(pages, key=int) for chunk_id in pages[page_no]]
+
+    kept_ids = {chunk_id for entry in files.values() for chunk_id in entry["chunks"]}
+    removed_ids = {chunk_id for entry in old_files.values() for chunk_id in entry["chunks"] if chunk_id not in kept_ids}
+    index_file = os.path.join(index_path, FLAT_INDEX_FILE)
+
+    with timer.measure("write"):
+        if manifest is None:
+            if not embedded:
+                raise RuntimeError(f"Không tìm thấy tài liệu PDF nào trong {source_path} để build index.")
+            index, rows = None, []
+        else:
+            index = faiss.read_index(index_file)
+            rows = ColumnarDocstore(index_path).rows()
+        if removed_ids:
+            # IndexFlat giữ nguyên thứ tự các vector còn lại, nên hàng docstore vẫn khớp vị trí vector
+            positions = [row for row, (chunk_id, _, _) in enumerate(rows) if chunk_id in removed_ids]
+            index.remove_ids(np.asarray(positions, dtype="int64"))
+            rows = [row for row in rows if row[0] not in removed_ids]
+        if embedded:
+            vectors = np.asarray([vector for _, _, vector in embedded], dtype="float32")
+            if index is None:
+                index = faiss.IndexFlatL2(vectors.shape[1])
+            index.add(vectors)
+            rows.extend((chunk_id, chunk.page_content, chunk.metadata) for chunk, chunk_id, _ in embedded)
+
+        if manifest is None or removed_ids or embedded:
+            os.makedirs(index_path, exist_ok=True)
+            faiss.write_index(index, index_file + ".tmp")
+            os.replace(index_file + ".tmp", index_file)
+            write_docstore(index_path, rows)
+            save_manifest(index_path, files)
+            pickle_file = os.path.join(index_path, PICKLE_DOCSTORE_FILE)
+            if os.path.exists(pickle_file):
+                os.remove(pickle_file)
+        elif files != old_files:
+            # File PDF đổi sha256 nhưng chunk không đổi (ví dụ chỉ sửa metadata): chỉ ghi lại manifest,
+            # nếu không lần build sau sẽ parse lại file đó mãi
+            save_manifest(index_path, files)
+    with timer.measure("ann"):
+        ann_config = build_ann_index(index_path, index_config)
+    db = load_vector_store(index_path, embedding_model)
+    logger.info(f"Build index: thêm {len(embedded)} chunk, xóa {len(removed_ids)} chunk, "
+                f"tổng {db.index.ntotal} vector, index {ann_config['type']}. Thời gian: {timer.report()}. "
+                f"Cache embedding: {embedding_model.stats()}")
+    return db
@@ -0,0 +1,153 @@
+# src/index_factory.py
+import json
+import math
+import os
+import faiss
+from langchain_community.vectorstores import FAISS
+from src.global_settings import VECTOR_DB_PATH, VECTOR_INDEX_TYPE, VECTOR_INDEX_PARAMS, VECTOR_INDEX_MMAP
+from src.docstore import ColumnarDocstore, RowKeys, has_docstore
+from src.common.utils import logger, flat_index_version
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+INDEX_CONFIG_FILE = "index_config.json"
+# index.faiss (flat, chính xác) luôn được giữ làm bản gốc cho cập nhật tăng dần và làm baseline recall;
+# index ANN được dựng lại từ nó và lưu cạnh bên
+FLAT_INDEX_FILE = "index.faiss"
+ANN_INDEX_FILE = "index_ann.faiss"
+# FAISS cần khoảng 39 điểm huấn luyện cho mỗi centroid
+MIN_POINTS_PER_CENTROID = 39
+
+
+def make_index_config(index_type=VECTOR_INDEX_TYPE, **params):
+    """Cấu hình index: loại + tham số (mặc định lấy từ VECTOR_INDEX_PARAMS, None = giữ mặc định)"""
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Loại index không hợp lệ: {index_type}. Chọn một trong {', '.join(INDEX_TYPES)}.")
+    merged = dict(VECTOR_INDEX_PARAMS)
+    merged.update({key: value for key, value in params.items() if value is not None})
+    return {"type": index_type, "params": merged}
+
+
+def create_index(config, dim, ntotal):
+    """Tạo index FAISS rỗng theo cấu hình, trả về (index, tham số thực dùng).
+
+    nlist và số bit PQ được thu nhỏ theo số vector để luôn đủ dữ liệu huấn luyện.
+    """
+    index_type, params = config["type"], dict(config["params"])
+    if index_type == "flat":
+        return faiss.IndexFlatL2(dim), {}
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, params["M"])
+        index.hnsw.efConstruction = params["efConstruction"]
+        return index, {"M": params["M"], "efConstruction": params["efConstruction"], "efSearch": params["efSearch"]}
+
+    nlist = max(1, min(params["nlist"], ntotal // MIN_POINTS_PER_CENTROID))
+    nprobe = min(params["nprobe"], nlist)
+    quantizer = faiss.IndexFlatL2(dim)
+    if index_type == "ivf_flat":
+        return faiss.IndexIVFFlat(quantizer, dim, nlist), {"nlist": nlist, "nprobe": nprobe}
+    # Số sub-quantizer phải chia hết số chiều
+    pq_m = max(m for m in range(1, min(params["pq_m"], dim) + 1) if dim % m == 0)
+    pq_nbits = max(1, min(params["pq_nbits"], int(math.log2(max(2, ntotal // MIN_POINTS_PER_CENTROID)))))
+    index = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, pq_nbits)
+    return index, {"nlist": nlist, "nprobe": nprobe, "pq_m": pq_m, "pq_nbits": pq_nbits}
+
+
+def apply_search_params(index, params):
+    """Đặt tham số lúc tìm kiếm (nprobe cho IVF, efSearch cho HNSW)"""
+    if "nprobe" in params:
+        faiss.extract_index_ivf(index).nprobe = params["nprobe"]
+    if "efSearch" in params:
+        index.hnsw.efSearch = params["efSearch"]
+    return index
+
+
+def train_index(config, vectors):
+    """Dựng index theo cấu hình từ ma trận vector (float32, theo đúng thứ tự của index flat)"""
+    index, params = create_index(config, vectors.shape[1], vectors.shape[0])
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    return apply_search_params(index, params), params
+
+
+def load_index_config(index_path=VECTOR_DB_PATH):
+    config_path = os.path.join(index_path, INDEX_CONFIG_FILE)
+    if not os.path.exists(config_path):
+        return None
+    try:
+        with open(config_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Không đọc được {config_path}: {e}")
+        return None
+
+
+def read_index(index_file, index_type="flat", mmap=VECTOR_INDEX_MMAP):
+    """Đọc index; với mmap, dữ liệu vector/danh sách IVF được ánh xạ từ file thay vì sao chép vào RAM"""
+    if not mmap:
+        return faiss.read_index(index_file)
+    # IVF: danh sách đảo được mmap (IO_FLAG_MMAP); flat và HNSW: mảng vector được mmap (IO_FLAG_MMAP_IFC).
+    # Hai cờ không dùng chung được với index IVF.
+    if index_type.startswith("ivf"):
+        flags = faiss.IO_FLAG_MMAP
+    else:
+        flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+    return faiss.read_index(index_file, flags | faiss.IO_FLAG_READ_ONLY)
+
+
+def build_ann_index(index_path=VECTOR_DB_PATH, config=None):
+    """Dựng index ANN từ index flat và ghi cấu hình vào index_config.json.
+
+    Bỏ qua nếu cấu hình không đổi và index flat chưa thay đổi kể từ lần dựng trước.
+    """
+    config = config or make_index_config()
+    fingerprint = flat_index_version(index_path)
+    existing = load_index_config(index_path)
+    ann_file = os.path.join(index_path, ANN_INDEX_FILE)
+    if (existing and existing.get("requested") == config and existing.get("index_fingerprint") == fingerprint
+            and (config["type"] == "flat" or os.path.exists(ann_file))):
+        return existing
+
+    flat = faiss.read_index(os.path.join(index_path, FLAT_INDEX_FILE))
+    saved = {"type": config["type"], "requested": config, "index_fingerprint": fingerprint,
+             "ntotal": flat.ntotal, "params": {}, "file": FLAT_INDEX_FILE}
+    if config["type"] == "flat":
+        if os.path.exists(ann_file):
+            os.remove(ann_file)
+    else:
+        index, saved["params"] = train_index(config, flat.reconstruct_n(0, flat.ntotal))
+        faiss.write_index(index, ann_file + ".tmp")
+        os.replace(ann_file + ".tmp", ann_file)
+        saved["file"] = ANN_INDEX_FILE
+        logger.info(f"Đã dựng index {config['type']} ({saved['params']}) cho {flat.ntotal} vector.")
+
+    config_path = os.path.join(index_path, INDEX_CONFIG_FILE)
+    with open(config_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(saved, f, ensure_ascii=False, indent=2)
+    os.replace(config_path + ".tmp", config_path)
+    return saved
+
+
+def load_vector_store(index_path, embeddings, mmap=VECTOR_INDEX_MMAP):
+    """Nạp vector store theo index_config.json (ANN nếu có và còn khớp với index flat, ngược lại flat)"""
+    config = load_index_config(index_path)
+    index_file = os.path.join(index_path, FLAT_INDEX_FILE)
+    index_type, params = "flat", {}
+    if config and config.get("type", "flat") != "flat":
+        if config.get("index_fingerprint") == flat_index_version(index_path) and os.path.exists(
+                os.path.join(index_path, ANN_INDEX_FILE)):
+            index_file = os.path.join(index_path, ANN_INDEX_FILE)
+            index_type, params = config["type"], config.get("params", {})
+        else:
+            logger.warning(f"Index {config['type']} đã cũ so với index flat, tạm dùng index flat. "
+                           f"Chạy lại build_data.py để dựng lại.")
+
+    if not has_docstore(index_path):
+        raise RuntimeError(f"Không tìm thấy docstore dạng cột trong {index_path}. "
+                           f"Chuyển index.pkl cũ bằng: python -m src.docstore {index_path}")
+    index = apply_search_params(read_index(index_file, index_type, mmap=mmap), params)
+    # Docstore cũng được mmap; chunk chỉ được giải mã khi nằm trong kết quả tìm kiếm
+    docstore = ColumnarDocstore(index_path)
+    if len(docstore) != index.ntotal:
+        raise RuntimeError(f"Docstore ({len(docstore)} chunk) không khớp index ({index.ntotal} vector) trong {index_path}.")
+    return FAISS(embeddings, index, docstore, RowKeys(len(docstore)))
@@ -1,10 +1,154 @@
-from langchain_community.document_loaders import PyPDFLoader, DirectoryLoader
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from src.global_settings import INGESTION_STORAGE_PATH
-
-def create_nodes():
-    loader = DirectoryLoader(INGESTION_STORAGE_PATH, glob="*.pdf", loader_cls=PyPDFLoader)
-    documents = loader.load()
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=512, chunk_overlap=50)
-    nodes = text_splitter.split_documents(documents)
-    return nodes
\ No newline at end of file
+from langchain_core.documents import Document
+from src.global_settings import INGESTION_STORAGE_PATH, CACHE_PATH, INGEST_WORKERS, CHUNK_SIZE, CHUNK_OVERLAP
+from src.common.utils import logger
+
+PAGE_CACHE_PATH = os.path.join(CACHE_PATH, "pages")
+PAGES_PER_TASK = 8
+
+
+class StageTimer:
+    """Cộng dồn thời gian (giây) theo từng giai đoạn: parse, split, embed, write"""
+
+    def __init__(self):
+        self.seconds = {}
+        self.started = time.perf_counter()
+
+    def add(self, stage, seconds):
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+
+    def measure(self, stage):
+        timer = self
+
+        class _Measure:
+            def __enter__(self):
+                self.start = time.perf_counter()
+
+            def __exit__(self, *exc):
+                timer.add(stage, time.perf_counter() - self.start)
+
+        return _Measure()
+
+    def report(self):
+        report = {stage: round(seconds, 3) for stage, seconds in self.seconds.items()}
+        report["total"] = round(time.perf_counter() - self.started, 3)
+        return report
+
+
+def file_sha256(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def list_pdf_files(source_path=INGESTION_STORAGE_PATH):
+    """Danh sách (tên file, đường dẫn, sha256) của các PDF cần ingest"""
+    files = []
+    for file_name in sorted(os.listdir(source_path)):
+        if file_name.lower().endswith(".pdf"):
+            file_path = os.path.join(source_path, file_name)
+            files.append((file_name, file_path, file_sha256(file_path)))
+    return files
+
+
+def count_pages(file_path):
+    from pypdf import PdfReader
+    return len(PdfReader(file_path).pages)
+
+
+def parse_page_range(file_path, start, end):
+    """Chạy trong tiến trình con: trích văn bản các trang [start, end)"""
+    from pypdf import PdfReader
+    began = time.perf_counter()
+    reader = PdfReader(file_path)
+    pages = [(page_no, reader.pages[page_no].extract_text() or "") for page_no in range(start, end)]
+    return pages, time.perf_counter() - began
+
+
+def page_document(file_path, page_no, text, total_pages):
+    return Document(page_content=text, metadata={"source": file_path, "page": page_no, "total_pages": total_pages})
+
+
+def load_cached_pages(sha256):
+    cache_file = os.path.join(PAGE_CACHE_PATH, f"{sha256}.json")
+    if not os.path.exists(cache_file):
+        return None
+    try:
+        with open(cache_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Bỏ qua cache trang hỏng {cache_file}: {e}")
+        return None
+
+
+def save_cached_pages(sha256, texts):
+    os.makedirs(PAGE_CACHE_PATH, exist_ok=True)
+    cache_file = os.path.join(PAGE_CACHE_PATH, f"{sha256}.json")
+    with open(cache_file + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(texts, f, ensure_ascii=False)
+    os.replace(cache_file + ".tmp", cache_file)
+
+
+def iter_pages(files, timer=None, max_workers=INGEST_WORKERS):
+    """Sinh từng trang (Document) ngay khi tiến trình con parse xong.
+
+    Văn bản đã trích được cache trong data/cache/pages theo sha256 của file,
+    nên PDF không đổi sẽ không phải parse lại.
+    """
+    timer = timer or StageTimer()
+    pending = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {}
+        for file_name, file_path, sha256 in files:
+            cached = load_cached_pages(sha256)
+            if cached is not None:
+                for page_no, text in enumerate(cached):
+                    yield page_document(file_path, page_no, text, len(cached))
+                continue
+            total_pages = count_pages(file_path)
+            pending[sha256] = {"texts": [None] * total_pages, "remaining": total_pages}
+            if total_pages == 0:
+                save_cached_pages(sha256, [])
+            for start in range(0, total_pages, PAGES_PER_TASK):
+                end = min(start + PAGES_PER_TASK, total_pages)
+                futures[pool.submit(parse_page_range, file_path, start, end)] = (file_path, sha256, total_pages)
+
+        for future in as_completed(futures):
+            file_path, sha256, total_pages = futures[future]
+            pages, parse_seconds = future.result()
+            timer.add("parse", parse_seconds)
+            state = pending[sha256]
+            for page_no, text in pages:
+                state["texts"][page_no] = text
+                state["remaining"] -= 1
+                yield page_document(file_path, page_no, text, total_pages)
+            if state["remaining"] == 0:
+                save_cached_pages(sha256, state["texts"])
+
+
+def make_text_splitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    return RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+
+def iter_chunks(pages, timer=None, text_splitter=None):
+    """Cắt từng trang thành chunk ngay khi trang tới; mỗi lần sinh ra (trang, các chunk của trang)"""
+    timer = timer or StageTimer()
+    text_splitter = text_splitter or make_text_splitter()
+    for page in pages:
+        with timer.measure("split"):
+            chunks = text_splitter.split_documents([page])
+        yield page, chunks
+
+
+def create_nodes(source_path=INGESTION_STORAGE_PATH, timer=None):
+    nodes = []
+    for _, chunks in iter_chunks(iter_pages(list_pdf_files(source_path), timer), timer):
+        nodes.extend(chunks)
+    return nodes
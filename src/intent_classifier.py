@@ -0,0 +1,329 @@
+# src/intent_classifier.py
+"""Bộ phân loại ý định + cảm xúc cho câu nhập: hash n-gram ký tự và một mô hình tuyến tính NumPy.
+
+Cả lô câu nhập được mã hóa một lần (mảng mã Unicode -> hash đa thức cho mọi n-gram bằng phép toán mảng),
+điểm của mỗi câu là tổng các hàng trọng số ứng với bucket của nó. Hai đầu ra softmax dùng chung đặc trưng:
+ý định (direct_query / severity_question / unclear, trùng tên nhánh của BotLogic) và cảm xúc cơ bản.
+
+Dữ liệu huấn luyện: cụm từ trong data/keywords/*.csv (ghép thành câu theo đúng luật định tuyến cũ) cùng mẫu
+tin nhắn đã gán nhãn tay (data/keywords/labelled_messages.csv). Mô hình được lưu dạng .npz (float16, vài trăm KB)
+và huấn luyện lại khi dữ liệu nguồn đổi, giống automaton từ khóa.
+
+Huấn luyện lại:  python -m src.intent_classifier
+"""
+import argparse
+import csv
+import hashlib
+import io
+import json
+import os
+import random
+import re
+import time
+import numpy as np
+from src.keyword_matcher import DEFAULT_KEYWORDS, KEYWORD_FILES, normalize_text, read_keyword_csv
+from src.global_settings import (
+    INTENT_LABELLED_FILE, INTENT_MODEL_FILE, INTENT_HASH_BITS, INTENT_NGRAM_RANGE, INTENT_EMOTION_MIN_PROB,
+)
+from src.common.utils import logger, replace_file
+
+MODEL_VERSION = 2
+INTENTS = ("direct_query", "severity_question", "unclear")
+# Cảm xúc cơ bản mặc định; các lớp của đầu cảm xúc là danh sách này cộng dạng gốc của cụm trong
+# emotion_keywords.csv (xem emotion_classes). "" = không có cảm xúc
+EMOTIONS = tuple(DEFAULT_KEYWORDS["emotion"])
+NO_EMOTION = ""
+# Từ chỉ mức độ đứng trước cảm xúc trong emotion_keywords.csv ("cực kỳ tổn thương 79" -> "tổn thương")
+INTENSITY_WORDS = ("cực kỳ", "vô cùng", "hoàn toàn", "một chút", "chút", "hơi", "rất", "thật", "quá", "khá")
+
+HASH_PRIME = np.uint64(1099511628211)
+HASH_MIX = np.uint64(0x9E3779B97F4A7C15)
+# Mẫu gán nhãn tay được lặp lại để có trọng lượng lớn hơn các câu ghép từ cụm từ khóa
+LABELLED_WEIGHT = 5.0
+# Khuôn ghép cụm từ cá nhân ({who}) và cảm xúc ({feeling}) thành câu chia sẻ
+SHARING_TEMPLATES = (
+    "{who} {feeling}", "{who} cảm thấy {feeling}", "{who} thấy {feeling}", "{who} đang {feeling}",
+    "{who} rất {feeling}", "dạo này {who} hay {feeling}", "{feeling} quá, {who} phải làm sao",
+    "hôm nay {who} cảm thấy rất {feeling}",
+)
+SHORT_TEMPLATES = ("{who} {feeling}", "{who} thấy {feeling}", "{who} đang {feeling}", "{who} bị {feeling}")
+
+
+def encode_batch(texts, hash_bits=INTENT_HASH_BITS, ngram_range=INTENT_NGRAM_RANGE):
+    """Mã hóa cả lô: trả về (hàng, bucket, giá trị, vị trí bắt đầu của từng hàng), đã sắp theo hàng.
+
+    Mỗi câu được chuẩn hóa (NFC, chữ thường, gộp khoảng trắng) và bọc bởi khoảng trắng để n-gram
+    mang thông tin đầu/cuối từ; giá trị của mỗi n-gram là 1/sqrt(số n-gram của câu).
+    """
+    padded = [" " + " ".join(normalize_text(text).split()) + " " for text in texts]
+    lengths = np.fromiter((len(text) for text in padded), dtype=np.int64, count=len(padded))
+    codes = np.frombuffer("".join(padded).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    owner = np.repeat(np.arange(len(padded)), lengths)
+    shift = np.uint64(64 - hash_bits)
+    rows, buckets = [], []
+    for n in range(ngram_range[0], ngram_range[1] + 1):
+        count = len(codes) - n + 1
+        if count <= 0:
+            continue
+        hashed = np.full(count, n, dtype=np.uint64)
+        for offset in range(n):
+            hashed = hashed * HASH_PRIME + codes[offset:offset + count]
+        # Bỏ n-gram vắt qua ranh giới hai câu
+        inside = owner[:count] == owner[n - 1:n - 1 + count]
+        rows.append(owner[:count][inside])
+        buckets.append(((hashed[inside] * HASH_MIX) >> shift).astype(np.int64))
+    rows = np.concatenate(rows)
+    buckets = np.concatenate(buckets)
+    order = np.argsort(rows, kind="stable")
+    rows, buckets = rows[order], buckets[order]
+    per_row = np.bincount(rows, minlength=len(padded))
+    values = (1.0 / np.sqrt(per_row))[rows].astype(np.float32)
+    # Mọi câu (kể cả rỗng, thành "  ") có ít nhất một bigram nên không có hàng rỗng
+    starts = np.concatenate(([0], np.cumsum(per_row)[:-1]))
+    return rows, buckets, values, starts
+
+
+def softmax(scores):
+    scores = scores - scores.max(axis=1, keepdims=True)
+    exp = np.exp(scores)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+class IntentPrediction:
+    __slots__ = ("intent", "emotion", "confidence", "emotion_confidence")
+
+    def __init__(self, intent, emotion, confidence, emotion_confidence):
+        self.intent = intent
+        self.emotion = emotion
+        self.confidence = confidence
+        self.emotion_confidence = emotion_confidence
+
+    def __repr__(self):
+        return (f"IntentPrediction(intent={self.intent!r} {self.confidence:.2f}, "
+                f"emotion={self.emotion!r} {self.emotion_confidence:.2f})")
+
+
+class IntentClassifier:
+    """Trọng số (2^hash_bits x (số ý định + số cảm xúc + 1)) và bias của hai đầu softmax"""
+
+    def __init__(self, weights, bias, intents=INTENTS, emotions=EMOTIONS, hash_bits=INTENT_HASH_BITS,
+                 ngram_range=INTENT_NGRAM_RANGE, emotion_min_prob=INTENT_EMOTION_MIN_PROB):
+        # Lưu float16 trên đĩa, tính bằng float32 trong bộ nhớ (vài MB)
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = np.asarray(bias, dtype=np.float32)
+        self.intents = tuple(intents)
+        self.emotions = tuple(emotions) + (NO_EMOTION,)
+        self.hash_bits = hash_bits
+        self.ngram_range = tuple(ngram_range)
+        self.emotion_min_prob = emotion_min_prob
+
+    def scores(self, texts):
+        """Xác suất (ý định, cảm xúc) cho cả lô, dạng hai ma trận"""
+        rows, buckets, values, starts = encode_batch(texts, self.hash_bits, self.ngram_range)
+        gathered = self.weights[buckets] * values[:, None]
+        logits = np.add.reduceat(gathered, starts, axis=0) + self.bias
+        split = len(self.intents)
+        return softmax(logits[:, :split]), softmax(logits[:, split:])
+
+    def predict_batch(self, texts):
+        if not texts:
+            return []
+        intent_probs, emotion_probs = self.scores(texts)
+        intent_ids = intent_probs.argmax(axis=1)
+        emotion_ids = emotion_probs.argmax(axis=1)
+        predictions = []
+        for row, (intent_id, emotion_id) in enumerate(zip(intent_ids, emotion_ids)):
+            emotion_prob = float(emotion_probs[row, emotion_id])
+            emotion = self.emotions[emotion_id] if emotion_prob >= self.emotion_min_prob else NO_EMOTION
+            predictions.append(IntentPrediction(self.intents[intent_id], emotion or None,
+                                                float(intent_probs[row, intent_id]), emotion_prob))
+        return predictions
+
+    def predict(self, text):
+        return self.predict_batch([text])[0]
+
+    def save(self, model_file, signature=""):
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, weights=self.weights.astype(np.float16), bias=self.bias.astype(np.float32),
+                            meta=np.array(json.dumps({
+                                "version": MODEL_VERSION, "signature": signature, "intents": self.intents,
+                                "emotions": self.emotions[:-1], "hash_bits": self.hash_bits,
+                                "ngram_range": self.ngram_range,
+                            }, ensure_ascii=False)))
+        replace_file(model_file, buffer.getvalue())
+
+    @classmethod
+    def load(cls, model_file):
+        """Trả về (bộ phân loại, chữ ký dữ liệu nguồn)"""
+        with np.load(model_file) as data:
+            meta = json.loads(str(data["meta"]))
+            if meta.get("version") != MODEL_VERSION:
+                raise ValueError(f"phiên bản mô hình {meta.get('version')} != {MODEL_VERSION}")
+            classifier = cls(data["weights"], data["bias"], meta["intents"], meta["emotions"], meta["hash_bits"],
+                             meta["ngram_range"])
+        return classifier, meta.get("signature", "")
+
+
+def emotion_base_form(phrase):
+    """Bỏ từ chỉ mức độ ở đầu và hậu tố số ở cuối của một cụm cảm xúc trong CSV"""
+    text = " ".join(re.sub(r"\s+\d+$", "", phrase.strip()).split())
+    for word in INTENSITY_WORDS:
+        if text.startswith(word + " "):
+            return text[len(word) + 1:]
+    return text
+
+
+def emotion_classes(emotion_phrases):
+    """Cảm xúc mặc định + dạng gốc của mọi cụm cảm xúc (ví dụ "cô đơn", "bối rối" chỉ có trong CSV)"""
+    classes = list(EMOTIONS)
+    for phrase in emotion_phrases:
+        base = emotion_base_form(phrase)
+        if base and base not in classes:
+            classes.append(base)
+    return tuple(classes)
+
+
+def base_emotion(text, emotions=EMOTIONS):
+    """Cảm xúc cơ bản dài nhất xuất hiện trong câu ("cực kỳ buồn chán" -> "buồn chán"), "" nếu không có"""
+    normalized = normalize_text(text)
+    found = [emotion for emotion in emotions if normalize_text(emotion) in normalized]
+    return max(found, key=len) if found else NO_EMOTION
+
+
+def read_labelled_messages(labelled_file=INTENT_LABELLED_FILE):
+    if not labelled_file or not os.path.exists(labelled_file):
+        return []
+    with open(labelled_file, "r", encoding="utf-8", newline="") as f:
+        return [(row["message"], row["intent"], row.get("emotion") or NO_EMOTION) for row in csv.DictReader(f)]
+
+
+def build_training_set(keyword_files=None, labelled_file=INTENT_LABELLED_FILE, seed=0):
+    """(danh sách (câu, ý định, cảm xúc, trọng số), các lớp cảm xúc).
+
+    Cụm từ khóa được ghép thành câu và gán nhãn theo luật định tuyến cũ: có từ khóa truy vấn -> direct_query,
+    có cả từ khóa cá nhân và cảm xúc -> severity_question, còn lại -> unclear.
+    """
+    keyword_files = keyword_files or KEYWORD_FILES
+    rng = random.Random(seed)
+    phrases = {category: read_keyword_csv(keyword_files[category]) + DEFAULT_KEYWORDS[category]
+               for category in DEFAULT_KEYWORDS}
+    direct, emotional, personal = phrases["direct_query"], phrases["emotion"], phrases["personal"]
+    emotions = emotion_classes(emotional)
+
+    samples = []
+    for phrase in direct:
+        samples.append((phrase, "direct_query", base_emotion(phrase, emotions), 1.0))
+    for phrase in emotional:
+        emotion = base_emotion(phrase, emotions)
+        samples.append((phrase, "unclear", emotion, 1.0))
+        for template in rng.sample(SHARING_TEMPLATES, 2):
+            sentence = template.format(who=rng.choice(personal), feeling=phrase)
+            samples.append((sentence, "severity_question", emotion, 1.0))
+        # Câu ngắn nhất người dùng hay gõ: đại từ + cảm xúc gốc ("tôi buồn", "mình lo âu")
+        if emotion:
+            sentence = rng.choice(SHORT_TEMPLATES).format(who=rng.choice(DEFAULT_KEYWORDS["personal"]), feeling=emotion)
+            samples.append((sentence, "severity_question", emotion, 1.0))
+    for phrase in personal:
+        samples.append((phrase, "unclear", base_emotion(phrase, emotions), 1.0))
+    # Câu vừa có cảm xúc vừa hỏi kiến thức: luật cũ ưu tiên trả lời trực tiếp
+    for _ in range(len(direct) // 2):
+        phrase = rng.choice(emotional)
+        sentence = f"{rng.choice(personal)} {phrase}, {rng.choice(direct)}"
+        samples.append((sentence, "direct_query", base_emotion(phrase, emotions), 1.0))
+    samples.extend((text, intent, emotion, LABELLED_WEIGHT) for text, intent, emotion in read_labelled_messages(labelled_file))
+    return samples, emotions
+
+
+def train_intent_classifier(samples, emotions=EMOTIONS, hash_bits=INTENT_HASH_BITS, ngram_range=INTENT_NGRAM_RANGE,
+                            epochs=120, learning_rate=0.05, l2=1e-5):
+    """Hồi quy logistic đa lớp cho hai đầu ra, gradient đầy đủ + Adam trên đặc trưng thưa"""
+    texts = [sample[0] for sample in samples]
+    intent_index = {intent: i for i, intent in enumerate(INTENTS)}
+    emotion_index = {emotion: i for i, emotion in enumerate(tuple(emotions) + (NO_EMOTION,))}
+    intent_targets = np.array([intent_index[sample[1]] for sample in samples])
+    emotion_targets = np.array([emotion_index.get(sample[2], emotion_index[NO_EMOTION]) for sample in samples])
+    sample_weights = np.array([sample[3] for sample in samples], dtype=np.float32)
+    sample_weights /= sample_weights.sum()
+
+    rows, buckets, values, starts = encode_batch(texts, hash_bits, ngram_range)
+    # Gom theo bucket một lần để cộng gradient bằng reduceat thay vì np.add.at
+    by_bucket = np.argsort(buckets, kind="stable")
+    touched, bucket_starts = np.unique(buckets[by_bucket], return_index=True)
+
+    split = len(INTENTS)
+    classes = split + len(emotions) + 1
+    weights = np.zeros((1 << hash_bits, classes), dtype=np.float32)
+    bias = np.zeros(classes, dtype=np.float32)
+    moments = [np.zeros_like(weights), np.zeros_like(weights), np.zeros_like(bias), np.zeros_like(bias)]
+    beta1, beta2, eps = 0.9, 0.999, 1e-8
+    targets = np.zeros((len(samples), classes), dtype=np.float32)
+    targets[np.arange(len(samples)), intent_targets] = 1.0
+    targets[np.arange(len(samples)), split + emotion_targets] = 1.0
+
+    for step in range(1, epochs + 1):
+        logits = np.add.reduceat(weights[buckets] * values[:, None], starts, axis=0) + bias
+        probs = np.concatenate([softmax(logits[:, :split]), softmax(logits[:, split:])], axis=1)
+        grad_rows = (probs - targets) * sample_weights[:, None]
+        entry_grads = grad_rows[rows] * values[:, None]
+        grad_weights = np.zeros_like(weights)
+        grad_weights[touched] = np.add.reduceat(entry_grads[by_bucket], bucket_starts, axis=0)
+        grad_weights[touched] += l2 * weights[touched]
+        grad_bias = grad_rows.sum(axis=0)
+        for param, grad, m, v in ((weights, grad_weights, moments[0], moments[1]),
+                                  (bias, grad_bias, moments[2], moments[3])):
+            m *= beta1
+            m += (1 - beta1) * grad
+            v *= beta2
+            v += (1 - beta2) * grad * grad
+            param -= learning_rate * (m / (1 - beta1 ** step)) / (np.sqrt(v / (1 - beta2 ** step)) + eps)
+    return IntentClassifier(weights, bias, INTENTS, emotions, hash_bits, ngram_range)
+
+
+def intent_sources_signature(keyword_files, labelled_file, hash_bits, ngram_range):
+    """Chữ ký của dữ liệu huấn luyện và cấu hình đặc trưng; mô hình trên đĩa chỉ dùng lại khi khớp"""
+    digest = hashlib.sha256()
+    digest.update(f"v{MODEL_VERSION}|bits={hash_bits}|ngram={tuple(ngram_range)}".encode("utf-8"))
+    digest.update(json.dumps(DEFAULT_KEYWORDS, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+    for file_path in [path for _, path in sorted(keyword_files.items())] + [labelled_file]:
+        if file_path and os.path.exists(file_path):
+            with open(file_path, "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+def load_intent_classifier(model_file=INTENT_MODEL_FILE, keyword_files=None, labelled_file=INTENT_LABELLED_FILE,
+                           hash_bits=INTENT_HASH_BITS, ngram_range=INTENT_NGRAM_RANGE, retrain=False):
+    """Nạp mô hình từ file .npz, hoặc huấn luyện lại (vài giây) nếu dữ liệu nguồn đã thay đổi"""
+    keyword_files = keyword_files or KEYWORD_FILES
+    signature = intent_sources_signature(keyword_files, labelled_file, hash_bits, ngram_range)
+    if model_file and os.path.exists(model_file) and not retrain:
+        try:
+            classifier, saved_signature = IntentClassifier.load(model_file)
+            if saved_signature == signature:
+                return classifier
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Bỏ qua mô hình phân loại ý định không hợp lệ: {e}")
+
+    start = time.perf_counter()
+    samples, emotions = build_training_set(keyword_files, labelled_file)
+    classifier = train_intent_classifier(samples, emotions, hash_bits, ngram_range)
+    logger.info(f"Đã huấn luyện bộ phân loại ý định trên {len(samples)} mẫu trong {time.perf_counter() - start:.1f}s")
+    if model_file:
+        try:
+            classifier.save(model_file, signature)
+        except OSError as e:
+            logger.warning(f"Không ghi được mô hình phân loại ý định: {e}")
+    return classifier
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Huấn luyện lại bộ phân loại ý định + cảm xúc")
+    parser.add_argument("--model-file", default=INTENT_MODEL_FILE)
+    args = parser.parse_args()
+    classifier = load_intent_classifier(args.model_file, retrain=True)
+    labelled = read_labelled_messages()
+    predictions = classifier.predict_batch([text for text, _, _ in labelled])
+    correct = sum(p.intent == intent and (p.emotion or NO_EMOTION) == emotion
+                  for p, (_, intent, emotion) in zip(predictions, labelled))
+    print(f"Đã lưu {args.model_file} ({os.path.getsize(args.model_file) / 1024:.0f} KB); "
+          f"đúng {correct}/{len(labelled)} mẫu gán nhãn")
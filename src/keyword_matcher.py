@@ -0,0 +1,219 @@
+# src/keyword_matcher.py
+import csv
+import hashlib
+import json
+import os
+import unicodedata
+from collections import deque
+from functools import lru_cache
+from src.global_settings import KEYWORDS_PATH, CACHE_PATH, KEYWORD_FOLD_DIACRITICS
+from src.common.utils import logger, replace_file
+
+AUTOMATON_VERSION = 1
+AUTOMATON_CACHE_FILE = os.path.join(CACHE_PATH, "keyword_automaton.json")
+
+# Từ khóa cơ bản (trước đây nằm cứng trong BotLogic.process_input), luôn được nạp cùng với file CSV
+DEFAULT_KEYWORDS = {
+    "direct_query": [
+        "hỏi", "tìm hiểu", "thông tin", "giải thích", "là gì", "tại sao", "như thế nào",
+        "dsm-5", "tiêu chuẩn", "chẩn đoán", "rối loạn", "tâm lý", "triệu chứng", "điều trị",
+        "phương pháp", "nguyên nhân", "hành vi", "phân loại", "yếu tố", "cách chữa",
+        "đặc điểm", "hiệu quả", "liệu pháp", "thống kê", "nghiên cứu", "tác động",
+        "phân tích", "đánh giá", "quy trình", "hỗ trợ"
+    ],
+    "emotion": [
+        "buồn", "vui", "hạnh phúc", "lo âu", "lo lắng", "stress", "áp lực", "căng thẳng", "mệt mỏi",
+        "tức giận", "sợ hãi", "hoang mang", "chán nản", "tự tin", "thất vọng", "hy vọng",
+        "sợ sệt", "bồn chồn", "phấn khởi", "u uất", "trầm cảm", "hào hứng", "mất ngủ",
+        "kích động", "thư giãn", "buồn chán", "tổn thương", "yêu đời"
+    ],
+    "personal": [
+        "tôi", "mình", "tớ", "chúng tôi", "bạn tôi", "gia đình tôi", "bản thân",
+        "cảm giác của tôi", "tâm trạng tôi", "sức khỏe tôi", "cơ thể tôi", "cuộc sống tôi",
+        "ngày của tôi", "tuần của tôi", "tháng của tôi", "năm của tôi", "hôm nay tôi",
+        "đêm qua tôi", "sáng nay tôi", "hôm qua tôi", "tôi cảm thấy", "tôi nghĩ",
+        "tôi muốn", "tôi cần", "tôi đang", "tôi đã"
+    ],
+}
+
+KEYWORD_FILES = {
+    "direct_query": os.path.join(KEYWORDS_PATH, "direct_query_keywords.csv"),
+    "emotion": os.path.join(KEYWORDS_PATH, "emotion_keywords.csv"),
+    "personal": os.path.join(KEYWORDS_PATH, "personal_keywords.csv"),
+}
+
+
+@lru_cache(maxsize=4096)
+def fold_char(char):
+    """Bỏ dấu một ký tự tiếng Việt, luôn trả về đúng một ký tự (giữ nguyên vị trí trong chuỗi)"""
+    if char in ("đ", "Đ"):
+        return "d"
+    base = [c for c in unicodedata.normalize("NFD", char) if not unicodedata.combining(c)]
+    return base[0] if len(base) == 1 else char
+
+
+def normalize_text(text, fold_diacritics=False):
+    """Chuẩn hóa Unicode NFC, chữ thường và (tùy chọn) bỏ dấu"""
+    text = unicodedata.normalize("NFC", text).lower()
+    if fold_diacritics:
+        text = "".join(fold_char(c) for c in text)
+    return text
+
+
+def read_keyword_csv(file_path):
+    """Đọc cột `keyword` của file CSV"""
+    try:
+        with open(file_path, "r", encoding="utf-8", newline="") as f:
+            return [row["keyword"] for row in csv.DictReader(f) if row.get("keyword")]
+    except Exception as e:
+        logger.error(f"Lỗi khi đọc file {file_path}: {str(e)}")
+        return []
+
+
+class KeywordMatches:
+    """Kết quả so khớp: các từ khóa tìm thấy theo từng nhóm, xếp theo thứ tự ưu tiên"""
+
+    def __init__(self, by_category):
+        self.by_category = by_category
+
+    def has(self, category):
+        return bool(self.by_category.get(category))
+
+    def first(self, category, default=None):
+        keywords = self.by_category.get(category)
+        return keywords[0] if keywords else default
+
+    def get(self, category):
+        return self.by_category.get(category, [])
+
+    def __repr__(self):
+        return f"KeywordMatches({self.by_category})"
+
+
+class KeywordMatcher:
+    """Automaton Aho–Corasick: tìm mọi từ khóa của mọi nhóm trong một lần duyệt câu nhập"""
+
+    def __init__(self, patterns, goto, fail, out, fold_diacritics=False):
+        # patterns[i] = (nhóm, từ khóa gốc); thứ tự trong danh sách chính là thứ tự ưu tiên
+        self.patterns = patterns
+        self.goto = goto
+        self.fail = fail
+        self.out = out
+        self.fold_diacritics = fold_diacritics
+
+    @classmethod
+    def build(cls, keywords_by_category, fold_diacritics=False):
+        patterns = []
+        seen = set()
+        for category, keywords in keywords_by_category.items():
+            for keyword in keywords:
+                normalized = normalize_text(keyword, fold_diacritics).strip()
+                if normalized and (category, normalized) not in seen:
+                    seen.add((category, normalized))
+                    patterns.append((category, keyword, normalized))
+
+        goto = [{}]
+        out = [[]]
+        for pattern_id, (_, _, normalized) in enumerate(patterns):
+            state = 0
+            for char in normalized:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][char] = next_state
+                    goto.append({})
+                    out.append([])
+                state = next_state
+            out[state].append(pattern_id)
+
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in goto[state].items():
+                queue.append(next_state)
+                fallback = fail[state]
+                while fallback and char not in goto[fallback]:
+                    fallback = fail[fallback]
+                fail[next_state] = goto[fallback].get(char, 0)
+                out[next_state] = out[next_state] + out[fail[next_state]]
+
+        return cls([(c, k) for c, k, _ in patterns], goto, fail, out, fold_diacritics)
+
+    def match(self, text):
+        """Trả về KeywordMatches cho toàn bộ các nhóm sau một lần duyệt"""
+        goto, fail, out = self.goto, self.fail, self.out
+        found = set()
+        state = 0
+        for char in normalize_text(text, self.fold_diacritics):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                found.update(out[state])
+
+        by_category = {}
+        for pattern_id in sorted(found):
+            category, keyword = self.patterns[pattern_id]
+            by_category.setdefault(category, []).append(keyword)
+        return KeywordMatches(by_category)
+
+    def keywords(self, category):
+        return [keyword for c, keyword in self.patterns if c == category]
+
+    def to_dict(self):
+        return {
+            "version": AUTOMATON_VERSION,
+            "fold_diacritics": self.fold_diacritics,
+            "patterns": self.patterns,
+            "goto": self.goto,
+            "fail": self.fail,
+            "out": self.out,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        patterns = [tuple(p) for p in data["patterns"]]
+        return cls(patterns, data["goto"], data["fail"], data["out"], data["fold_diacritics"])
+
+
+def keyword_sources_signature(keyword_files, fold_diacritics):
+    """Chữ ký của dữ liệu nguồn; automaton trong cache chỉ dùng lại khi chữ ký khớp"""
+    digest = hashlib.sha256()
+    digest.update(f"v{AUTOMATON_VERSION}|fold={fold_diacritics}".encode("utf-8"))
+    digest.update(json.dumps(DEFAULT_KEYWORDS, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+    for category, file_path in sorted(keyword_files.items()):
+        digest.update(category.encode("utf-8"))
+        if os.path.exists(file_path):
+            with open(file_path, "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+def load_keyword_matcher(keyword_files=None, cache_file=AUTOMATON_CACHE_FILE, fold_diacritics=KEYWORD_FOLD_DIACRITICS):
+    """Nạp automaton từ cache trên đĩa, hoặc build từ file CSV nếu dữ liệu nguồn đã thay đổi"""
+    keyword_files = keyword_files or KEYWORD_FILES
+    signature = keyword_sources_signature(keyword_files, fold_diacritics)
+    if cache_file and os.path.exists(cache_file):
+        try:
+            with open(cache_file, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+            if cached.get("signature") == signature:
+                return KeywordMatcher.from_dict(cached["automaton"])
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Bỏ qua cache automaton từ khóa không hợp lệ: {e}")
+
+    # Từ khóa trong CSV được ưu tiên trước, sau đó đến danh sách cơ bản
+    keywords_by_category = {}
+    for category in DEFAULT_KEYWORDS:
+        csv_keywords = read_keyword_csv(keyword_files[category]) if category in keyword_files else []
+        keywords_by_category[category] = csv_keywords + DEFAULT_KEYWORDS[category]
+    matcher = KeywordMatcher.build(keywords_by_category, fold_diacritics)
+
+    if cache_file:
+        try:
+            replace_file(cache_file, json.dumps({"signature": signature, "automaton": matcher.to_dict()},
+                                                ensure_ascii=False).encode("utf-8"))
+        except OSError as e:
+            logger.warning(f"Không ghi được cache automaton từ khóa: {e}")
+    return matcher
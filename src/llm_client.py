@@ -0,0 +1,357 @@
+# src/llm_client.py
+import asyncio
+import contextvars
+import heapq
+import itertools
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+import httpx
+import groq
+from langchain_groq import ChatGroq
+from src.global_settings import (
+    LLM_MAX_CONCURRENCY, LLM_MAX_RETRIES, LLM_REQUEST_TIMEOUT, LLM_QUEUE_TIMEOUT,
+    LLM_REQUESTS_PER_MINUTE, LLM_MAX_CONNECTIONS,
+)
+from src.common.utils import logger
+from src.tracing import METRICS, span, observe_stage, count
+
+# Mức ưu tiên: số nhỏ được phục vụ trước
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+_priority = contextvars.ContextVar("llm_priority", default=PRIORITY_INTERACTIVE)
+
+RETRYABLE_ERRORS = (groq.RateLimitError, groq.APITimeoutError, groq.APIConnectionError, groq.InternalServerError)
+# Lỗi có thể xảy ra khi đang đọc stream: sự kiện lỗi trong SSE (APIError) hoặc lỗi đọc httpx không được bọc lại
+STREAM_ERRORS = (groq.APIError, httpx.HTTPError)
+
+
+@contextmanager
+def llm_priority(priority):
+    """Đặt mức ưu tiên cho các lời gọi LLM trong khối `with` (ví dụ PRIORITY_BATCH cho job nền)"""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def parse_duration(value):
+    """Đổi chuỗi thời gian của header rate-limit ("7.66s", "2m59.56s", "120ms", "1h2m") sang giây"""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    total = 0.0
+    matched = False
+    for amount, unit in re.findall(r"([\d.]+)(ms|h|m|s)", value):
+        matched = True
+        total += float(amount) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unit]
+    return total if matched else None
+
+
+class TokenBucket:
+    """Token bucket cho số request; tự điều chỉnh theo header rate-limit mà nhà cung cấp trả về"""
+
+    def __init__(self, requests_per_minute):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = float(max(1, requests_per_minute))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self):
+        """Lấy một token nếu có và trả về 0, ngược lại trả về số giây cần chờ"""
+        with self._lock:
+            now = time.monotonic()
+            if now < self.paused_until:
+                return self.paused_until - now
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            delay = self.wait_time()
+            if delay == 0:
+                return
+            if deadline is not None and time.monotonic() + delay > deadline:
+                raise TimeoutError("Hết thời gian chờ hạn mức gọi LLM")
+            time.sleep(delay)
+
+    async def aacquire(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            delay = self.wait_time()
+            if delay == 0:
+                return
+            if deadline is not None and time.monotonic() + delay > deadline:
+                raise TimeoutError("Hết thời gian chờ hạn mức gọi LLM")
+            await asyncio.sleep(delay)
+
+    def observe_headers(self, headers):
+        remaining = headers.get("x-ratelimit-remaining-requests")
+        reset = parse_duration(headers.get("x-ratelimit-reset-requests"))
+        retry_after = parse_duration(headers.get("retry-after"))
+        with self._lock:
+            now = time.monotonic()
+            if remaining is not None:
+                try:
+                    self.tokens = min(self.tokens, float(remaining))
+                except ValueError:
+                    pass
+                if self.tokens < 1 and reset:
+                    self.paused_until = max(self.paused_until, now + reset)
+            if retry_after:
+                self.paused_until = max(self.paused_until, now + retry_after)
+
+
+class PriorityScheduler:
+    """Giới hạn số lời gọi LLM đồng thời; khi hết chỗ, yêu cầu có ưu tiên cao hơn được vào trước"""
+
+    def __init__(self, max_concurrency):
+        self.max_concurrency = max_concurrency
+        self.active = 0
+        self._waiting = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def acquire(self, priority=PRIORITY_INTERACTIVE, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            entry = (priority, next(self._seq))
+            heapq.heappush(self._waiting, entry)
+            while self.active >= self.max_concurrency or self._waiting[0] != entry:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self._waiting.remove(entry)
+                    heapq.heapify(self._waiting)
+                    self._cond.notify_all()
+                    raise TimeoutError("Hàng đợi gọi LLM quá tải")
+                self._cond.wait(remaining)
+            heapq.heappop(self._waiting)
+            self.active += 1
+            self._cond.notify_all()
+
+    async def aacquire(self, priority=PRIORITY_INTERACTIVE, timeout=None):
+        """acquire cho coroutine: chờ trong luồng phụ; nếu task bị hủy lúc đang chờ,
+        chỗ mà luồng phụ lấy được sau đó sẽ được trả lại ngay thay vì bị giữ mãi"""
+        waiter = asyncio.ensure_future(asyncio.to_thread(self.acquire, priority, timeout))
+        try:
+            await asyncio.shield(waiter)
+        except asyncio.CancelledError:
+            waiter.add_done_callback(
+                lambda done: done.cancelled() or done.exception() is not None or self.release())
+            raise
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify_all()
+
+    def queued(self):
+        with self._cond:
+            return len(self._waiting)
+
+
+class LLMClientPool:
+    """Tài nguyên dùng chung của tiến trình: connection pool HTTP, token bucket và hàng đợi ưu tiên"""
+
+    def __init__(self, requests_per_minute=LLM_REQUESTS_PER_MINUTE, max_concurrency=LLM_MAX_CONCURRENCY,
+                 max_connections=LLM_MAX_CONNECTIONS, timeout=LLM_REQUEST_TIMEOUT):
+        self.bucket = TokenBucket(requests_per_minute)
+        self.scheduler = PriorityScheduler(max_concurrency)
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self.timeout = httpx.Timeout(timeout)
+        self.http_client = httpx.Client(limits=limits, timeout=self.timeout,
+                                        event_hooks={"response": [self._observe]})
+        self.http_async_client = httpx.AsyncClient(limits=limits, timeout=self.timeout,
+                                                   event_hooks={"response": [self._aobserve]})
+        self.counters = {"requests": 0, "retries": 0, "failures": 0}
+        # Nhiều luồng (và vòng lặp asyncio) cùng tăng bộ đếm: "+= 1" trên dict không nguyên tử
+        self._counters_lock = threading.Lock()
+
+    def record(self, name):
+        with self._counters_lock:
+            self.counters[name] += 1
+
+    def counters_snapshot(self):
+        with self._counters_lock:
+            return dict(self.counters)
+
+    def _observe(self, response):
+        self.bucket.observe_headers(response.headers)
+
+    async def _aobserve(self, response):
+        self.bucket.observe_headers(response.headers)
+
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+
+def get_client_pool():
+    global _POOL
+    if _POOL is None:
+        with _POOL_LOCK:
+            if _POOL is None:
+                _POOL = LLMClientPool()
+    return _POOL
+
+
+def pool_metrics():
+    if _POOL is None:
+        return []
+    return [(f"llm_{name}_total", {}, value) for name, value in _POOL.counters_snapshot().items()]
+
+
+METRICS.register_collector(pool_metrics)
+
+
+def record_token_usage(usage):
+    """usage: token_usage của Groq (prompt_tokens/completion_tokens) hoặc usage_metadata của LangChain"""
+    if not usage:
+        return
+    count("llm_tokens_total", usage.get("prompt_tokens", usage.get("input_tokens", 0)), kind="prompt")
+    count("llm_tokens_total", usage.get("completion_tokens", usage.get("output_tokens", 0)), kind="completion")
+
+
+def retry_delay(error, attempt):
+    """Thời gian chờ trước lần thử lại: ưu tiên header retry-after, nếu không thì backoff có jitter"""
+    response = getattr(error, "response", None)
+    if response is not None:
+        retry_after = parse_duration(response.headers.get("retry-after"))
+        if retry_after:
+            return retry_after + random.uniform(0, 0.5)
+    return random.uniform(0, min(8.0, 0.5 * 2 ** attempt))
+
+
+class ScheduledChatGroq(ChatGroq):
+    """ChatGroq đi qua connection pool, token bucket, hàng đợi ưu tiên và chính sách thử lại dùng chung"""
+
+    queue_timeout: float = LLM_QUEUE_TIMEOUT
+    retries: int = LLM_MAX_RETRIES
+
+    def _run(self, call):
+        pool = get_client_pool()
+        priority = _priority.get()
+        for attempt in range(self.retries + 1):
+            pool.scheduler.acquire(priority, timeout=self.queue_timeout)
+            try:
+                pool.bucket.acquire(timeout=self.queue_timeout)
+                pool.record("requests")
+                return call()
+            except RETRYABLE_ERRORS as e:
+                count("llm_errors_total", error=type(e).__name__)
+                if attempt == self.retries:
+                    pool.record("failures")
+                    raise RuntimeError(f"Groq không phản hồi sau {attempt + 1} lần thử: {e}") from e
+                delay = retry_delay(e, attempt)
+                logger.warning(f"Lỗi Groq ({type(e).__name__}), thử lại sau {delay:.1f}s")
+                pool.record("retries")
+            finally:
+                pool.scheduler.release()
+            time.sleep(delay)
+
+    async def _arun(self, call):
+        pool = get_client_pool()
+        priority = _priority.get()
+        for attempt in range(self.retries + 1):
+            await pool.scheduler.aacquire(priority, timeout=self.queue_timeout)
+            try:
+                await pool.bucket.aacquire(timeout=self.queue_timeout)
+                pool.record("requests")
+                return await call()
+            except RETRYABLE_ERRORS as e:
+                count("llm_errors_total", error=type(e).__name__)
+                if attempt == self.retries:
+                    pool.record("failures")
+                    raise RuntimeError(f"Groq không phản hồi sau {attempt + 1} lần thử: {e}") from e
+                delay = retry_delay(e, attempt)
+                logger.warning(f"Lỗi Groq ({type(e).__name__}), thử lại sau {delay:.1f}s")
+                pool.record("retries")
+            finally:
+                pool.scheduler.release()
+            await asyncio.sleep(delay)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        with span("llm"):
+            result = self._run(lambda: super(ScheduledChatGroq, self)._generate(messages, stop, run_manager, **kwargs))
+        record_token_usage((result.llm_output or {}).get("token_usage"))
+        return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        with span("llm"):
+            result = await self._arun(
+                lambda: super(ScheduledChatGroq, self)._agenerate(messages, stop, run_manager, **kwargs))
+        record_token_usage((result.llm_output or {}).get("token_usage"))
+        return result
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        # Chỉ thử lại khi lỗi xảy ra trước token đầu tiên; giữ chỗ trong hàng đợi suốt thời gian stream
+        # Đo tay thay vì span: generator có thể được tiếp tục ở context khác giữa các lần yield
+        pool = get_client_pool()
+        priority = _priority.get()
+        start = time.perf_counter()
+        for attempt in range(self.retries + 1):
+            pool.scheduler.acquire(priority, timeout=self.queue_timeout)
+            started = False
+            try:
+                pool.bucket.acquire(timeout=self.queue_timeout)
+                pool.record("requests")
+                for chunk in super()._stream(messages, stop, run_manager, **kwargs):
+                    if not started:
+                        observe_stage("llm_first_token", time.perf_counter() - start)
+                    started = True
+                    record_token_usage(getattr(chunk.message, "usage_metadata", None))
+                    yield chunk
+                observe_stage("llm", time.perf_counter() - start)
+                return
+            except STREAM_ERRORS as e:
+                if started:
+                    # Đã gửi token cho người gọi nên không thử lại được; lỗi khác với "không phản hồi"
+                    count("llm_errors_total", error=type(e).__name__)
+                    pool.record("failures")
+                    raise RuntimeError(f"Groq ngắt luồng trả lời giữa chừng: {e}") from e
+                if not isinstance(e, RETRYABLE_ERRORS):
+                    raise
+                count("llm_errors_total", error=type(e).__name__)
+                if attempt == self.retries:
+                    pool.record("failures")
+                    raise RuntimeError(f"Groq không phản hồi sau {attempt + 1} lần thử: {e}") from e
+                delay = retry_delay(e, attempt)
+                logger.warning(f"Lỗi Groq ({type(e).__name__}), thử lại sau {delay:.1f}s")
+                pool.record("retries")
+            finally:
+                pool.scheduler.release()
+            time.sleep(delay)
+
+
+def create_chat_groq(api_key, model_name, base_url=None, timeout=LLM_REQUEST_TIMEOUT, **kwargs):
+    pool = get_client_pool()
+    if base_url:
+        kwargs["base_url"] = base_url
+    return ScheduledChatGroq(
+        api_key=api_key,
+        model=model_name,
+        timeout=timeout,
+        # Thử lại do ScheduledChatGroq đảm nhận để tôn trọng token bucket và hàng đợi
+        max_retries=0,
+        http_client=pool.http_client,
+        http_async_client=pool.http_async_client,
+        **kwargs,
+    )
@@ -0,0 +1,279 @@
+# src/local_llm.py
+"""Backend LLM chạy cục bộ trên CPU (GGUF qua llama-cpp-python), cùng giao diện LangChain với Groq.
+
+- Mô hình được nạp một lần cho mỗi tiến trình (registry theo file mô hình, số luồng, độ dài ngữ cảnh).
+- Prompt gửi đi giống hệt Groq: một lượt user duy nhất, không có lượt system (ChatGroq nhận chuỗi prompt
+  thành một HumanMessage), để hai backend trả lời trên cùng đầu vào.
+- Tiền tố cố định của prompt (phần đầu QA_PROMPT_TEMPLATE và CUSTORM_AGENT_SYSTEM_TEMPLATE) được đánh giá một lần lúc nạp và lưu trạng thái KV; mỗi yêu cầu khôi phục trạng thái đó và chỉ đánh giá
+  phần đuôi.
+- Một luồng lập lịch sở hữu mô hình: các yêu cầu đến đồng thời được gom thành lô và chạy theo thứ tự token,
+  để các yêu cầu chung tiền tố dài nhất chạy liền nhau và dùng lại KV của nhau.
+
+llama-cpp-python là phụ thuộc tùy chọn, chỉ được nhập khi chọn LLM_BACKEND=local.
+"""
+import queue
+import threading
+import time
+from typing import List
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+from src.prompts import QA_PROMPT_TEMPLATE, CUSTORM_AGENT_SYSTEM_TEMPLATE
+from src.global_settings import (
+    LLM_MODEL_FILE, LOCAL_LLM_THREADS, LOCAL_LLM_CONTEXT_LENGTH, LOCAL_LLM_MAX_NEW_TOKENS,
+    LOCAL_LLM_EVAL_BATCH_SIZE, LOCAL_LLM_MAX_BATCH,
+)
+from src.common.utils import logger
+from src.tracing import METRICS, observe_stage, count
+
+# Định dạng hội thoại của Llama 3 Instruct; lượt system chỉ có khi system_prompt khác rỗng (như chat template)
+CHAT_SYSTEM = "<|start_header_id|>system<|end_header_id|>\n\n{system}<|eot_id|>"
+CHAT_HEADER = "<|begin_of_text|>{system_turn}<|start_header_id|>user<|end_header_id|>\n\n"
+CHAT_FOOTER = "<|eot_id|><|start_header_id|>assistant<|end_header_id|>\n\n"
+CHAT_STOP = ["<|eot_id|>", "<|end_of_text|>"]
+
+
+def static_prefix(template):
+    """Phần văn bản cố định của template trước biến đầu tiên"""
+    return template.split("{", 1)[0]
+
+
+def chat_header(system_prompt=""):
+    system_prompt = system_prompt.strip()
+    return CHAT_HEADER.format(system_turn=CHAT_SYSTEM.format(system=system_prompt) if system_prompt else "")
+
+
+def chat_prefixes(system_prompt=""):
+    """Các tiền tố cố định của prompt đã bọc định dạng hội thoại, cần giữ sẵn trạng thái KV.
+
+    Phải trùng đúng phần đầu của `LocalLLM.format_prompt`. Prompt chat có {system} = CUSTORM_AGENT_SYSTEM_TEMPLATE ngay sau phần đầu QA_PROMPT_TEMPLATE, nên phần
+    cố định của nó (trước {user_info}) cũng nằm trong tiền tố; prompt mức độ ({system} rỗng) dùng tiền tố ngắn.
+    """
+    qa_prefix = chat_header(system_prompt) + static_prefix(QA_PROMPT_TEMPLATE)
+    return [qa_prefix, qa_prefix + static_prefix(CUSTORM_AGENT_SYSTEM_TEMPLATE)]
+
+
+def common_prefix_length(a, b):
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+class LocalRequest:
+    """Một yêu cầu sinh văn bản; các đoạn văn bản được đẩy vào hàng đợi riêng để người gọi đọc dần"""
+
+    def __init__(self, tokens, max_new_tokens, temperature, stop):
+        self.tokens = tokens
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.stop = stop
+        self.chunks = queue.Queue()
+        self.cancelled = False
+        self.submitted = time.perf_counter()
+
+    def __iter__(self):
+        while True:
+            item = self.chunks.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+
+class LocalRuntime:
+    """Mô hình llama.cpp, trạng thái KV của các tiền tố cố định và luồng lập lịch duy nhất được dùng mô hình"""
+
+    def __init__(self, model_file=LLM_MODEL_FILE, threads=LOCAL_LLM_THREADS, context_length=LOCAL_LLM_CONTEXT_LENGTH,
+                 eval_batch_size=LOCAL_LLM_EVAL_BATCH_SIZE, max_batch=LOCAL_LLM_MAX_BATCH):
+        try:
+            from llama_cpp import Llama
+        except ImportError as e:
+            raise RuntimeError("Backend LLM cục bộ cần gói llama-cpp-python (pip install llama-cpp-python)") from e
+        start = time.perf_counter()
+        try:
+            self.model = Llama(model_path=model_file, n_ctx=context_length, n_threads=threads,
+                               n_threads_batch=threads, n_batch=eval_batch_size, verbose=False)
+        except Exception as e:
+            raise RuntimeError(f"Lỗi khi tải mô hình LLM cục bộ {model_file}: {str(e)}")
+        self.model_file = model_file
+        self.threads = threads
+        self.max_batch = max_batch
+        self.prefix_states = []
+        self.counters = {"requests": 0, "batches": 0, "prompt_tokens": 0, "reused_tokens": 0, "completion_tokens": 0}
+        self._queue = queue.Queue()
+        self._prefix_lock = threading.Lock()
+        logger.info(f"Đã tải LLM cục bộ {model_file} ({threads} luồng) trong {time.perf_counter() - start:.2f}s")
+        threading.Thread(target=self._loop, name="local-llm", daemon=True).start()
+
+    def tokenize(self, text, bos=False):
+        return self.model.tokenize(text.encode("utf-8"), add_bos=bos, special=True)
+
+    def pin_prefix(self, text):
+        """Đánh giá một tiền tố cố định và lưu trạng thái KV của nó (chạy trên luồng lập lịch)"""
+        with self._prefix_lock:
+            if any(prefix_text == text for prefix_text, _, _ in self.prefix_states):
+                return
+        done = threading.Event()
+        self._queue.put(("pin", text, done))
+        done.wait()
+
+    def encode(self, prompt):
+        """Token hóa prompt; phần tiền tố cố định được tách riêng để token trùng khớp với trạng thái KV đã lưu"""
+        for text, tokens, _ in self.prefix_states:
+            if prompt.startswith(text):
+                return tokens + self.tokenize(prompt[len(text):])
+        return self.tokenize(prompt)
+
+    def submit(self, prompt, max_new_tokens=LOCAL_LLM_MAX_NEW_TOKENS, temperature=0.2, stop=None):
+        request = LocalRequest(self.encode(prompt), max_new_tokens, temperature, CHAT_STOP + list(stop or []))
+        self._queue.put(("generate", request, None))
+        return request
+
+    def _loop(self):
+        while True:
+            batch = [self._queue.get()]
+            # Gom các yêu cầu đã đến trong lúc lượt trước chạy, không chờ thêm
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            for kind, text, done in batch:
+                if kind == "pin":
+                    self._pin(text)
+                    done.set()
+            requests = sorted((item for kind, item, _ in batch if kind == "generate"), key=lambda r: r.tokens)
+            if requests:
+                self.counters["batches"] += 1
+                for request in requests:
+                    self._run(request)
+
+    def _pin(self, text):
+        try:
+            tokens = self.tokenize(text, bos=False)
+            self.model.reset()
+            self.model.eval(tokens)
+            state = self.model.save_state()
+        except Exception as e:
+            logger.warning(f"Không lưu được trạng thái KV của tiền tố ({len(text)} ký tự): {e}")
+            return
+        with self._prefix_lock:
+            # Thay cả danh sách để encode() ở luồng khác không thấy danh sách đang sắp xếp dở
+            self.prefix_states = sorted(self.prefix_states + [(text, tokens, state)], key=lambda item: len(item[1]),
+                                        reverse=True)
+        logger.info(f"Đã lưu trạng thái KV cho tiền tố {len(tokens)} token")
+
+    def _restore_prefix(self, tokens):
+        """Số token đầu của yêu cầu đã có sẵn trong KV, khôi phục trạng thái tiền tố nếu dài hơn"""
+        evaluated = common_prefix_length(self.model.input_ids[:self.model.n_tokens].tolist(), tokens)
+        for _, prefix, state in self.prefix_states:
+            if len(prefix) > evaluated and tokens[:len(prefix)] == prefix:
+                self.model.load_state(state)
+                return len(prefix)
+        return evaluated
+
+    def _run(self, request):
+        try:
+            if request.cancelled:
+                return
+            start = time.perf_counter()
+            observe_stage("llm_queue", start - request.submitted)
+            reused = self._restore_prefix(request.tokens)
+            self.counters["requests"] += 1
+            self.counters["prompt_tokens"] += len(request.tokens)
+            self.counters["reused_tokens"] += reused
+            completion = self.model.create_completion(request.tokens, max_tokens=request.max_new_tokens,
+                                                      temperature=request.temperature, stop=request.stop, stream=True)
+            generated = 0
+            for chunk in completion:
+                if request.cancelled:
+                    break
+                generated += 1
+                text = chunk["choices"][0]["text"]
+                if text:
+                    if generated == 1:
+                        observe_stage("llm_first_token", time.perf_counter() - request.submitted)
+                    request.chunks.put(text)
+            self.counters["completion_tokens"] += generated
+            count("llm_tokens_total", len(request.tokens) - reused, kind="prompt")
+            count("llm_tokens_total", generated, kind="completion")
+            observe_stage("llm", time.perf_counter() - start)
+        except Exception as e:
+            count("llm_errors_total", error=type(e).__name__)
+            request.chunks.put(RuntimeError(f"Lỗi LLM cục bộ: {e}"))
+        finally:
+            request.chunks.put(None)
+
+
+_RUNTIMES = {}
+_RUNTIMES_LOCK = threading.Lock()
+
+
+def get_local_runtime(model_file=LLM_MODEL_FILE, threads=LOCAL_LLM_THREADS, context_length=LOCAL_LLM_CONTEXT_LENGTH):
+    """Lấy (hoặc nạp lần đầu) mô hình cục bộ; mỗi tiến trình chỉ giữ một bản cho mỗi cấu hình"""
+    key = (model_file, threads, context_length)
+    runtime = _RUNTIMES.get(key)
+    if runtime is None:
+        with _RUNTIMES_LOCK:
+            runtime = _RUNTIMES.get(key)
+            if runtime is None:
+                runtime = _RUNTIMES[key] = LocalRuntime(model_file, threads, context_length)
+    return runtime
+
+
+def local_llm_metrics():
+    samples = []
+    for (model_file, _, _), runtime in list(_RUNTIMES.items()):
+        for name, value in runtime.counters.items():
+            samples.append((f"local_llm_{name}_total", {"model": model_file.rsplit("/", 1)[-1]}, value))
+    return samples
+
+
+METRICS.register_collector(local_llm_metrics)
+
+
+class LocalLLM(LLM):
+    """LLM LangChain gọi mô hình cục bộ qua luồng lập lịch dùng chung của tiến trình"""
+
+    model_file: str = LLM_MODEL_FILE
+    threads: int = LOCAL_LLM_THREADS
+    context_length: int = LOCAL_LLM_CONTEXT_LENGTH
+    max_new_tokens: int = LOCAL_LLM_MAX_NEW_TOKENS
+    temperature: float = 0.2
+    # Để trống cho giống Groq; chỉ dẫn theo người dùng đã nằm trong {system} của QA_PROMPT_TEMPLATE
+    system_prompt: str = ""
+
+    @property
+    def _llm_type(self) -> str:
+        return "llama_cpp_local"
+
+    @property
+    def runtime(self) -> LocalRuntime:
+        return get_local_runtime(self.model_file, self.threads, self.context_length)
+
+    def warm_up(self):
+        """Nạp mô hình và trạng thái KV của các tiền tố cố định trước yêu cầu đầu tiên"""
+        runtime = self.runtime
+        for prefix in chat_prefixes(self.system_prompt):
+            runtime.pin_prefix(prefix)
+        return self
+
+    def format_prompt(self, prompt: str) -> str:
+        return chat_header(self.system_prompt) + prompt + CHAT_FOOTER
+
+    def _call(self, prompt, stop: List[str] = None, run_manager=None, **kwargs) -> str:
+        return "".join(chunk.text for chunk in self._stream(prompt, stop, run_manager, **kwargs))
+
+    def _stream(self, prompt, stop=None, run_manager=None, **kwargs):
+        request = self.runtime.submit(self.format_prompt(prompt), kwargs.get("max_new_tokens", self.max_new_tokens),
+                                      kwargs.get("temperature", self.temperature), stop)
+        try:
+            for text in request:
+                if run_manager:
+                    run_manager.on_llm_new_token(text)
+                yield GenerationChunk(text=text)
+        finally:
+            # Người gọi bỏ ngang stream: luồng lập lịch dừng sinh token cho yêu cầu này
+            request.cancelled = True
@@ -1,16 +1,22 @@
 # src/models.py
-import os
+import hashlib
+import time
 from src.common.utils import logger
 from src.prompts import PROMT_HEADER
 from langchain_groq import ChatGroq
+from src.llm_client import create_chat_groq
+from src.global_settings import GROQ_BASE_URL, LLM_BACKEND, LLM_MODEL_FILE, LOCAL_LLM_THREADS
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
 
-def using_llm_groq(api_key: str = None, model_name: str = "llama3-8b-8192") -> ChatGroq:
+def using_llm_groq(api_key: str = None, model_name: str = "llama3-8b-8192", base_url: str = GROQ_BASE_URL) -> ChatGroq:
+    """ChatGroq dùng chung connection pool, token bucket, hàng đợi ưu tiên và chính sách thử lại"""
     try:
         if api_key:
-            os.environ['GROQ_API_KEY'] = api_key
-            groq_llm = ChatGroq(
+            groq_llm = create_chat_groq(
                 api_key=api_key,
-                model=model_name,
+                model_name=model_name,
+                base_url=base_url,
                 temperature=0.2,
                 max_tokens=512,
             )
@@ -18,4 +24,50 @@ def using_llm_groq(api_key: str = None, model_name: str = "llama3-8b-8192") -> C
         else:
             logger.warning("Please enter api key Groq")
     except Exception as e:
-        logger.error(f"Error occurred: {e}")
\ No newline at end of file
+        logger.error(f"Error occurred: {e}")
+
+
+class StubLLM(LLM):
+    """LLM giả lập chạy cục bộ, trả lời tất định theo prompt (dùng cho test, benchmark, build offline)"""
+
+    latency_seconds: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs) -> str:
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        question = prompt.rsplit("Câu hỏi:", 1)[-1].strip()
+        digest = hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:8]
+        return f"[stub:{digest}] Trả lời cho: {question[:200]}"
+
+    def _stream(self, prompt, stop=None, run_manager=None, **kwargs):
+        # Trả từng từ một để giả lập luồng token
+        for index, word in enumerate(self._call(prompt, stop, **kwargs).split(" ")):
+            yield GenerationChunk(text=word if index == 0 else " " + word)
+
+
+def using_llm_stub(latency_seconds: float = 0.0) -> StubLLM:
+    return StubLLM(latency_seconds=latency_seconds)
+
+
+def using_llm_local(model_file: str = LLM_MODEL_FILE, threads: int = LOCAL_LLM_THREADS):
+    """Mô hình GGUF chạy cục bộ trên CPU; nạp ngay (một lần mỗi tiến trình) cùng trạng thái KV của tiền tố prompt.
+
+    Không có lượt system, giống prompt gửi tới Groq.
+    """
+    from src.local_llm import LocalLLM
+    return LocalLLM(model_file=model_file, threads=threads).warm_up()
+
+
+def create_llm(backend: str = LLM_BACKEND, api_key: str = None):
+    """Chọn backend LLM theo LLM_BACKEND: groq, local hoặc stub"""
+    if backend == "groq":
+        return using_llm_groq(api_key=api_key)
+    if backend == "local":
+        return using_llm_local()
+    if backend == "stub":
+        return using_llm_stub()
+    raise ValueError(f"LLM_BACKEND không hợp lệ: {backend} (groq, local hoặc stub)")
@@ -0,0 +1,125 @@
+# src/prefetch.py
+"""Chạy trước câu trả lời mức độ trong lúc người dùng đang chọn đáp án.
+
+Thang 5 lựa chọn chỉ gộp thành 4 mức độ (SEVERITIES), nên khi câu hỏi được hiển thị, mỗi mức độ còn thiếu
+trong answer bank được giao cho pool luồng giới hạn dùng chung của tiến trình (PREFETCH_WORKERS luồng).
+Kết quả được giữ theo từng phiên (SeverityPrefetch gắn với ConversationEngine của phiên đó): khi người dùng
+chọn, câu trả lời đã sẵn (hoặc chỉ phải chờ job đang chạy), các job còn lại bị hủy hoặc bỏ kết quả; khi người
+dùng chuyển sang câu nhập khác, mọi job của câu hỏi cũ bị hủy.
+
+Số liệu (tracing): prefetch_jobs_total{outcome}, prefetch_lookups_total{outcome=hit|wait|miss},
+prefetch_llm_calls_total / prefetch_llm_calls_used_total (phần chênh lệch là chi phí LLM tăng thêm),
+cùng tỷ lệ trúng và số lời gọi thừa qua collector.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from src.global_settings import PREFETCH_WORKERS, PREFETCH_WAIT_TIMEOUT
+from src.common.utils import logger
+from src.tracing import METRICS, count
+
+_EXECUTOR = None
+_EXECUTOR_LOCK = threading.Lock()
+
+
+def get_prefetch_executor(max_workers=PREFETCH_WORKERS):
+    """Pool luồng dùng chung của tiến trình; tạo lần đầu khi có job prefetch"""
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        with _EXECUTOR_LOCK:
+            if _EXECUTOR is None:
+                _EXECUTOR = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+    return _EXECUTOR
+
+
+class SeverityPrefetch:
+    """Các job prefetch của một phiên cho câu hỏi mức độ hiện tại (một cảm xúc)"""
+
+    def __init__(self, executor=None, wait_timeout=PREFETCH_WAIT_TIMEOUT):
+        self.executor = executor
+        self.wait_timeout = wait_timeout
+        self.emotion = None
+        self.futures = {}
+        self._lock = threading.Lock()
+
+    def start(self, emotion, severities, job, key=None):
+        """Hủy các job cũ rồi giao `job(emotion, severity)` cho từng mức độ; job trả về (câu trả lời, có gọi LLM).
+
+        Các mức độ có cùng `key(severity)` (ví dụ cùng câu truy vấn, như với cảm xúc tích cực) dùng chung một job.
+        """
+        self.discard()
+        executor = self.executor or get_prefetch_executor()
+        jobs, futures = {}, {}
+        for severity in severities:
+            job_key = key(severity) if key else severity
+            future = jobs.get(job_key)
+            if future is None:
+                future = jobs[job_key] = executor.submit(job, emotion, severity)
+                future.add_done_callback(_record_job)
+            futures[severity] = future
+        with self._lock:
+            self.emotion, self.futures = emotion, futures
+        count("prefetch_jobs_total", len(jobs), outcome="submitted")
+
+    def take(self, emotion, severity):
+        """Câu trả lời đã prefetch cho (cảm xúc, mức độ) hoặc None; các job khác của câu hỏi bị hủy/bỏ"""
+        with self._lock:
+            future = self.futures.pop(severity, None) if emotion == self.emotion else None
+        self.discard(keep=future)
+        if future is None:
+            count("prefetch_lookups_total", outcome="miss")
+            return None
+        outcome = "hit" if future.done() else "wait"
+        try:
+            answer, llm_called = future.result(timeout=self.wait_timeout)
+        except Exception as e:
+            logger.warning(f"Prefetch mức độ {severity} không dùng được: {e!r}")
+            count("prefetch_lookups_total", outcome="miss")
+            return None
+        count("prefetch_lookups_total", outcome=outcome)
+        if llm_called:
+            count("prefetch_llm_calls_used_total")
+        return answer
+
+    def discard(self, keep=None):
+        """Hủy job chưa chạy; job đang chạy vẫn hoàn tất nhưng kết quả bị bỏ (trừ job `keep` vừa được lấy)"""
+        with self._lock:
+            futures, self.futures, self.emotion = self.futures, {}, None
+        futures = {future for future in futures.values() if future is not keep}
+        cancelled = sum(future.cancel() for future in futures)
+        if cancelled:
+            count("prefetch_jobs_total", cancelled, outcome="cancelled")
+        if len(futures) > cancelled:
+            count("prefetch_jobs_total", len(futures) - cancelled, outcome="discarded")
+
+
+def _record_job(future):
+    if future.cancelled():
+        return
+    if future.exception() is not None:
+        count("prefetch_jobs_total", outcome="failed")
+        return
+    _, llm_called = future.result()
+    count("prefetch_jobs_total", outcome="completed")
+    if llm_called:
+        count("prefetch_llm_calls_total")
+
+
+def prefetch_metrics():
+    """Tỷ lệ trúng (hit + wait trên tổng lượt chọn) và số lời gọi LLM prefetch không được dùng"""
+    counters = {(name, labels): value for (name, labels), value in list(METRICS.counters.items())
+                if name.startswith("prefetch_")}
+    lookups = {dict(labels).get("outcome"): value for (name, labels), value in counters.items()
+               if name == "prefetch_lookups_total"}
+    if not counters:
+        return []
+    total = sum(lookups.values())
+    served = lookups.get("hit", 0) + lookups.get("wait", 0)
+    calls = counters.get(("prefetch_llm_calls_total", ()), 0)
+    used = counters.get(("prefetch_llm_calls_used_total", ()), 0)
+    return [
+        ("prefetch_hit_ratio", {}, round(served / total, 4) if total else 0.0),
+        ("prefetch_llm_calls_wasted", {}, max(0, calls - used)),
+    ]
+
+
+METRICS.register_collector(prefetch_metrics)
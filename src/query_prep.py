@@ -0,0 +1,40 @@
+# src/query_prep.py
+"""Chuẩn bị câu truy vấn: tách phần dùng để truy hồi khỏi phần chỉ dẫn cho LLM.
+
+- Câu truy vấn truy hồi chỉ gồm lời người dùng và các từ khóa khớp (dạng gốc, có dấu) chưa xuất hiện
+  nguyên văn trong câu, nên embedding phản ánh nội dung câu hỏi thay vì khối chỉ dẫn cố định.
+- System prompt (CUSTORM_AGENT_SYSTEM_TEMPLATE + user_info) được dựng một lần cho mỗi người dùng
+  và chỉ được chèn vào prompt ở bước sinh.
+"""
+from functools import lru_cache
+from src.prompts import CUSTORM_AGENT_SYSTEM_TEMPLATE
+from src.keyword_matcher import normalize_text
+from src.global_settings import RETRIEVAL_QUERY_MAX_CHARS, SYSTEM_PROMPT_CACHE_SIZE
+
+# Nhóm từ khóa mang nội dung cho truy hồi (từ khóa cá nhân như "tôi", "mình" chỉ là nhiễu)
+RETRIEVAL_KEYWORD_CATEGORIES = ("direct_query", "emotion")
+
+
+def build_retrieval_query(user_input, matches=None, max_chars=RETRIEVAL_QUERY_MAX_CHARS):
+    """Câu truy vấn ngắn cho FAISS: lời người dùng (gộp khoảng trắng, cắt `max_chars`) + từ khóa khớp còn thiếu"""
+    text = " ".join(user_input.split())[:max_chars]
+    if matches is None:
+        return text
+    normalized = normalize_text(text)
+    extra = []
+    for category in RETRIEVAL_KEYWORD_CATEGORIES:
+        for keyword in matches.get(category):
+            # Câu nhập không dấu vẫn khớp từ khóa (KEYWORD_FOLD_DIACRITICS); thêm dạng có dấu để embedding nhận ra
+            if normalize_text(keyword) not in normalized and keyword not in extra:
+                extra.append(keyword)
+    return " ".join([text] + extra)
+
+
+@lru_cache(maxsize=SYSTEM_PROMPT_CACHE_SIZE)
+def _render_system_prompt(user_info_text):
+    return CUSTORM_AGENT_SYSTEM_TEMPLATE.format(user_info=user_info_text)
+
+
+def render_system_prompt(user_info):
+    """System prompt của một người dùng; dựng một lần cho mỗi user_info rồi dùng lại ở mọi lượt"""
+    return _render_system_prompt(str(user_info or {}))
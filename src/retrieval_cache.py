@@ -0,0 +1,88 @@
+# src/retrieval_cache.py
+import os
+import threading
+from collections import OrderedDict
+from src.keyword_matcher import normalize_text
+from src.global_settings import RETRIEVAL_CACHE_SIZE
+from src.common.utils import index_version
+
+# Các file mà index_version và nội dung truy hồi phụ thuộc vào
+VERSION_FILES = ("manifest.json", "index.faiss", "index_ann.faiss", "index_config.json", "docstore.json")
+
+
+def normalize_retrieval_query(query):
+    """Khóa cache truy hồi: NFC, chữ thường, gộp khoảng trắng (giữ nguyên dấu câu)"""
+    return " ".join(normalize_text(query).split())
+
+
+class RetrievalCache:
+    """LRU có giới hạn: câu truy vấn đã chuẩn hóa -> top-k (khóa docstore, điểm).
+
+    Bị xóa tự động khi phiên bản index trên đĩa thay đổi; việc kiểm tra chỉ tốn vài lệnh stat,
+    hash index_version chỉ được tính lại khi thời gian sửa/kích thước file thay đổi. `current_version`
+    cho engine_registry biết khi nào phải nạp lại FAISS/docstore (SharedResources.db).
+    """
+
+    def __init__(self, index_path, max_entries=RETRIEVAL_CACHE_SIZE):
+        self.index_path = index_path
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._signature = self._file_signature()
+        self.version = index_version(index_path)
+        self.counters = {"hits": 0, "misses": 0, "invalidations": 0}
+        self.saved_ms = 0.0
+
+    def _file_signature(self):
+        signature = []
+        for file_name in VERSION_FILES:
+            try:
+                stat = os.stat(os.path.join(self.index_path, file_name))
+                signature.append((file_name, stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                continue
+        return tuple(signature)
+
+    def _check_version(self):
+        signature = self._file_signature()
+        if signature == self._signature:
+            return
+        self._signature = signature
+        version = index_version(self.index_path)
+        if version != self.version:
+            self.version = version
+            self._entries.clear()
+            self.counters["invalidations"] += 1
+
+    def current_version(self):
+        """Phiên bản index hiện tại trên đĩa (cache bị xóa nếu đã khác phiên bản trước)"""
+        with self._lock:
+            self._check_version()
+            return self.version
+
+    def get(self, key):
+        """Trả về danh sách (khóa docstore, điểm) hoặc None"""
+        with self._lock:
+            self._check_version()
+            entry = self._entries.get(key)
+            if entry is None:
+                self.counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.counters["hits"] += 1
+            hits, cost_ms = entry
+            self.saved_ms += cost_ms
+            return hits
+
+    def put(self, key, hits, cost_ms):
+        """Lưu kết quả truy hồi kèm thời gian đã tốn (embed + tìm kiếm) để tính thời gian tiết kiệm khi trúng"""
+        with self._lock:
+            self._entries[key] = (list(hits), cost_ms)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.counters["hits"] + self.counters["misses"]
+        return dict(self.counters, size=len(self._entries), saved_ms=round(self.saved_ms, 1),
+                    hit_rate=round(self.counters["hits"] / lookups, 3) if lookups else 0.0)
@@ -1,24 +1,31 @@
 import streamlit as st
-from src.global_settings import CHAT_HISTORY_FILE
-import json
-import os
+from src.history_store import get_history_store
+from src.conversation_view import get_conversation_window
 
-def render_sidebar():
+def open_conversation(conversation_id):
+    conversation = get_history_store().get_conversation(conversation_id, with_messages=False)
+    if conversation:
+        # Chỉ nạp cửa sổ tin nhắn cuối, không nạp toàn bộ cuộc hội thoại vào session
+        get_conversation_window().open(conversation["id"])
+        st.session_state.current_conversation_name = conversation["name"]
+        st.session_state.current_conversation_id = conversation["id"]
+    st.session_state.waiting_for_answer = False
+
+def render_sidebar(username):
+    history_store = get_history_store()
     with st.sidebar:
         st.markdown("<h1 style='text-align: left; margin-top: 0px;'>Menu</h1>", unsafe_allow_html=True)
         if st.button("Lịch sử các cuộc hội thoại"):
             st.session_state.show_history = not st.session_state.show_history
             st.session_state.show_search = False
         if st.session_state.show_history:
-            history = load_chat_history()
+            history = history_store.list_conversations(username)
             if history:
                 st.write("### Danh sách các cuộc hội thoại")
-                for idx, conv in enumerate(history):
-                    if st.button(f"Cuộc hội thoại: {conv['name']}", key=f"conv_{idx}"):
-                        st.session_state.current_conversation = conv["messages"]
-                        st.session_state.current_conversation_name = conv["name"]
+                for conv in history:
+                    if st.button(f"Cuộc hội thoại: {conv['name']}", key=f"conv_{conv['id']}"):
+                        open_conversation(conv["id"])
                         st.session_state.show_history = False
-                        st.session_state.waiting_for_answer = False
                         st.rerun()
             else:
                 st.write("Chưa có cuộc hội thoại nào.")
@@ -32,56 +39,37 @@ def render_sidebar():
         if search_query:
             st.session_state.show_search = True
             st.session_state.show_history = False
-            history = load_chat_history()
-            found_conversations = []
-            for conv in history:
-                for msg in conv["messages"]:
-                    if search_query.lower() in msg["message"].lower():
-                        if conv not in found_conversations:
-                            found_conversations.append(conv)
-                        break
-            if found_conversations:
-                st.write("### Kết quả tìm kiếm")
-                for idx, conv in enumerate(found_conversations):
-                    if st.button(f"Cuộc hội thoại: {conv['name']}", key=f"search_conv_{idx}"):
-                        st.session_state.current_conversation = conv["messages"]
-                        st.session_state.current_conversation_name = conv["name"]
+            if st.session_state.get("search_query") != search_query:
+                st.session_state.search_query = search_query
+                st.session_state.search_page = 0
+            page = st.session_state.get("search_page", 0)
+            found = history_store.search(username, search_query, page=page)
+            if found["results"]:
+                st.write(f"### Kết quả tìm kiếm ({found['total']})")
+                for conv in found["results"]:
+                    if st.button(f"Cuộc hội thoại: {conv['name']}", key=f"search_conv_{conv['id']}"):
+                        open_conversation(conv["id"])
                         st.session_state.show_search = False
-                        st.session_state.waiting_for_answer = False
                         st.rerun()
+                    st.caption(conv["snippet"])
+                previous_col, next_col = st.columns(2)
+                if page > 0 and previous_col.button("← Trang trước", key="search_prev"):
+                    st.session_state.search_page = page - 1
+                    st.rerun()
+                if (page + 1) * found["page_size"] < found["total"] and next_col.button("Trang sau →", key="search_next"):
+                    st.session_state.search_page = page + 1
+                    st.rerun()
             else:
                 st.write("Không tìm thấy kết quả.")
         else:
             st.session_state.show_search = False
         st.markdown("<h3 style='margin-top: 20px;'>Cuộc trò chuyện mới</h3>", unsafe_allow_html=True)
         if st.button("➕ Cuộc trò chuyện mới"):
-            save_current_conversation()
-            st.session_state.current_conversation = []
+            # Tin nhắn đã được ghi vào kho lịch sử ngay khi gửi, chỉ cần bắt đầu cuộc hội thoại mới
+            get_conversation_window().open(None)
             st.session_state.current_conversation_name = None
+            st.session_state.current_conversation_id = None
             st.session_state.show_history = False
             st.session_state.show_search = False
             st.session_state.waiting_for_answer = False
             st.success("Đã tạo cuộc trò chuyện mới!")
-
-def load_chat_history():
-    if os.path.exists(CHAT_HISTORY_FILE):
-        with open(CHAT_HISTORY_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return []
-
-def save_current_conversation():
-    if st.session_state.current_conversation:
-        history = load_chat_history()
-        conv_exists = False
-        for conv in history:
-            if conv["name"] == st.session_state.current_conversation_name:
-                conv["messages"] = st.session_state.current_conversation
-                conv_exists = True
-                break
-        if not conv_exists:
-            history.append({
-                "name": st.session_state.current_conversation_name,
-                "messages": st.session_state.current_conversation
-            })
-        with open(CHAT_HISTORY_FILE, "w", encoding="utf-8") as f:
-            json.dump(history, f, ensure_ascii=False, indent=4)
\ No newline at end of file
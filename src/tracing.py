@@ -0,0 +1,299 @@
+# src/tracing.py
+"""Span đo thời gian từng giai đoạn, histogram và counter trong tiến trình, xuất dạng Prometheus.
+
+    with span("vector_search"):
+        ...
+    count("cache_requests_total", cache="retrieval", result="hit")
+
+Khi TRACING_ENABLED tắt, `span` trả về một context manager rỗng dùng chung và `count`/`observe`
+thoát ngay, nên chi phí chỉ là một lần kiểm tra cờ.
+Span lồng nhau được gom theo span gốc (ví dụ một lần trả lời) để trang admin hiển thị các lượt gần nhất.
+"""
+import bisect
+import contextvars
+import functools
+import os
+import threading
+import time
+from collections import deque
+from src.global_settings import (
+    TRACING_ENABLED, TRACE_SAMPLE_SIZE, TRACE_RECENT_SIZE, METRICS_EXPORT_FILE, METRICS_EXPORT_INTERVAL, METRICS_PORT,
+)
+from src.common.utils import logger
+
+METRIC_PREFIX = "chatbot_"
+# Biên bucket (giây) của histogram thời gian giai đoạn, từ 0.5 ms tới 30 s
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_enabled = TRACING_ENABLED
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+def set_enabled(enabled):
+    global _enabled
+    _enabled = bool(enabled)
+
+
+def is_enabled():
+    return _enabled
+
+
+class Histogram:
+    """Bucket cộng dồn cho Prometheus và một cửa sổ mẫu gần nhất để tính percentile"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS, sample_size=TRACE_SAMPLE_SIZE):
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1)
+        self.samples = deque(maxlen=sample_size)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.samples.append(value)
+        self.count += 1
+        self.sum += value
+
+    def percentiles(self, points=(50, 95, 99)):
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {}
+        return {p: ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] for p in points}
+
+
+class MetricsRegistry:
+    """Histogram và counter có nhãn, cùng các hàm collector đọc số liệu sẵn có của cache/pool khi xuất"""
+
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self.collectors = []
+        self.recent_traces = deque(maxlen=TRACE_RECENT_SIZE)
+        self._lock = threading.Lock()
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def count(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def add_trace(self, trace):
+        with self._lock:
+            self.recent_traces.append(trace)
+
+    def register_collector(self, collector):
+        """collector() trả về danh sách (tên counter, nhãn dict, giá trị) đọc tại thời điểm xuất"""
+        with self._lock:
+            if collector not in self.collectors:
+                self.collectors.append(collector)
+
+    def collected(self):
+        samples = []
+        for collector in list(self.collectors):
+            try:
+                samples.extend(collector())
+            except Exception as e:
+                logger.warning(f"Bỏ qua collector số liệu {collector}: {e}")
+        return samples
+
+    def stage_summary(self):
+        """Percentile (ms) của từng giai đoạn, dùng cho trang admin"""
+        with self._lock:
+            items = [(dict(labels), histogram.count, histogram.sum, histogram.percentiles())
+                     for (name, labels), histogram in self.histograms.items() if name == "stage_seconds"]
+        rows = []
+        for labels, total, seconds, percentiles in sorted(items, key=lambda item: item[0].get("stage", "")):
+            rows.append({"stage": labels.get("stage", ""), "count": total,
+                         "mean_ms": round(seconds / total * 1000, 2) if total else 0.0,
+                         **{f"p{p}_ms": round(value * 1000, 2) for p, value in percentiles.items()}})
+        return rows
+
+    def counter_summary(self):
+        with self._lock:
+            items = list(self.counters.items())
+        rows = [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in items]
+        rows.extend({"name": name, "labels": labels, "value": value} for name, labels, value in self.collected())
+        return sorted(rows, key=lambda row: (row["name"], sorted(row["labels"].items())))
+
+    def to_prometheus(self):
+        lines = []
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+        declared = set()
+        for (name, labels), histogram in histograms:
+            metric = METRIC_PREFIX + name
+            if metric not in declared:
+                declared.add(metric)
+                lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets + (float("inf"),), histogram.bucket_counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{metric}_bucket{format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{metric}_sum{format_labels(labels)} {histogram.sum:.6f}")
+            lines.append(f"{metric}_count{format_labels(labels)} {histogram.count}")
+        samples = [(name, labels, value) for (name, labels), value in counters]
+        samples.extend((name, tuple(sorted(labels.items())), value) for name, labels, value in self.collected())
+        for name, labels, value in sorted(samples, key=lambda sample: (sample[0], sample[1])):
+            metric = METRIC_PREFIX + name
+            if metric not in declared:
+                declared.add(metric)
+                lines.append(f"# TYPE {metric} {'counter' if name.endswith('_total') else 'gauge'}")
+            lines.append(f"{metric}{format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+
+METRICS = MetricsRegistry()
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """Đo một giai đoạn; span không có cha là span gốc và được lưu vào danh sách lượt gần nhất"""
+
+    __slots__ = ("name", "start", "token", "trace")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.trace = _current_trace.get()
+        if self.trace is None:
+            self.token = _current_trace.set([])
+        else:
+            self.token = None
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        seconds = time.perf_counter() - self.start
+        METRICS.observe("stage_seconds", seconds, stage=self.name)
+        if exc_type is not None:
+            METRICS.count("stage_errors_total", stage=self.name, error=exc_type.__name__)
+        if self.token is None:
+            self.trace.append((self.name, round(seconds * 1000, 2)))
+            return False
+        children = _current_trace.get()
+        _current_trace.reset(self.token)
+        METRICS.add_trace({"time": time.time(), "name": self.name,
+                           "total_ms": round(seconds * 1000, 2), "stages": children,
+                           "error": exc_type.__name__ if exc_type else None})
+        return False
+
+
+def span(name):
+    """Context manager đo thời gian giai đoạn `name` (rỗng khi tracing tắt)"""
+    if not _enabled:
+        return _NOOP_SPAN
+    return Span(name)
+
+
+def traced(name):
+    """Decorator bọc cả hàm trong một span"""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            with Span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def observe_stage(name, seconds):
+    """Ghi thời gian đo tay (ví dụ trong generator stream, nơi không giữ được context của span)"""
+    if _enabled:
+        METRICS.observe("stage_seconds", seconds, stage=name)
+
+
+def count(name, amount=1, **labels):
+    if _enabled:
+        METRICS.count(name, amount, **labels)
+
+
+def write_prometheus(path=METRICS_EXPORT_FILE):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        f.write(METRICS.to_prometheus())
+    os.replace(path + ".tmp", path)
+
+
+def serve_metrics(port, host="127.0.0.1"):
+    """HTTP server phục vụ /metrics (http.server chỉ được nhập khi cần)"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = METRICS.to_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), MetricsHandler)
+
+
+_exporter_started = False
+_exporter_lock = threading.Lock()
+
+
+def start_exporter(path=METRICS_EXPORT_FILE, interval=METRICS_EXPORT_INTERVAL, port=METRICS_PORT):
+    """Ghi file Prometheus định kỳ và (nếu đặt METRICS_PORT) phục vụ /metrics; chỉ chạy một lần mỗi tiến trình"""
+    global _exporter_started
+    if not _enabled:
+        return
+    with _exporter_lock:
+        if _exporter_started:
+            return
+        _exporter_started = True
+
+    def export_loop():
+        while True:
+            time.sleep(interval)
+            try:
+                write_prometheus(path)
+            except OSError as e:
+                logger.warning(f"Không ghi được file số liệu {path}: {e}")
+
+    if path and interval:
+        threading.Thread(target=export_loop, name="metrics-export", daemon=True).start()
+    if port:
+        try:
+            server = serve_metrics(int(port))
+        except OSError as e:
+            logger.warning(f"Không mở được cổng số liệu {port}: {e}")
+            return
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        logger.info(f"Số liệu Prometheus tại http://127.0.0.1:{port}/metrics")
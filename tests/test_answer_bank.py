@@ -0,0 +1,80 @@
+# tests/test_answer_bank.py
+"""Answer bank dựng bằng StubLLM: ngắt giữa chừng, chạy tiếp từ .partial.jsonl, tra cứu O(1), từ chối bank giả lập"""
+import json
+import pytest
+from langchain_community.vectorstores import FAISS
+from src.answer_bank import (
+    SEVERITIES, build_answer_bank, default_answer_bank_file, llm_name, load_answer_bank, severity_query,
+)
+from src.embeddings import StubEmbeddings
+from src.engine_registry import create_qa_chain
+from src.global_settings import ANSWER_BANK_FILE, STUB_ANSWER_BANK_FILE
+from src.models import using_llm_stub
+
+EMOTIONS = ["buồn", "lo âu", "vui"]
+
+
+class InterruptedChain:
+    """qa_chain bị ngắt (như Ctrl+C) sau `limit` lời gọi"""
+
+    def __init__(self, qa_chain, limit=None):
+        self.qa_chain = qa_chain
+        self.limit = limit
+        self.queries = []
+
+    def invoke(self, inputs):
+        if self.limit is not None and len(self.queries) >= self.limit:
+            raise KeyboardInterrupt
+        self.queries.append(inputs["query"])
+        return self.qa_chain.invoke(inputs)
+
+
+@pytest.fixture
+def stub_index(tmp_path):
+    index_path = str(tmp_path / "index")
+    texts = ["Rối loạn trầm cảm chủ yếu: khí sắc buồn kéo dài", "Rối loạn lo âu lan tỏa: lo lắng quá mức"]
+    db = FAISS.from_texts(texts, StubEmbeddings(), metadatas=[{"page": 1}, {"page": 2}])
+    db.save_local(index_path)
+    llm = using_llm_stub()
+    return index_path, create_qa_chain(llm, db), llm_name(llm)
+
+
+def test_interrupted_build_resumes_and_serves_lookups(stub_index, tmp_path):
+    index_path, qa_chain, llm = stub_index
+    bank_file = str(tmp_path / "answer_bank.stub.json")
+
+    with pytest.raises(KeyboardInterrupt):
+        build_answer_bank(InterruptedChain(qa_chain, limit=3), EMOTIONS, llm, bank_file, index_path, max_workers=1)
+    with open(bank_file + ".partial.jsonl", "r", encoding="utf-8") as f:
+        done = [json.loads(line) for line in f]
+    assert len(done) >= 3 and all(cell["llm"] == "stub" for cell in done)
+
+    resumed = InterruptedChain(qa_chain)
+    bank = build_answer_bank(resumed, EMOTIONS, llm, bank_file, index_path, max_workers=1)
+    done_queries = {severity_query(cell["emotion"], cell["severity"]) for cell in done}
+    assert resumed.queries and not done_queries & set(resumed.queries)
+    # Cảm xúc tích cực dùng chung một câu trả lời cho mọi mức độ
+    assert len(bank) == len(EMOTIONS) * len(SEVERITIES)
+    assert not (tmp_path / "answer_bank.stub.json.partial.jsonl").exists()
+
+    loaded = load_answer_bank(bank_file, index_path, allow_stub=True)
+    assert loaded.llm == "stub" and len(loaded) == len(bank)
+    for emotion in EMOTIONS:
+        for severity in SEVERITIES:
+            assert loaded.get(emotion, severity).startswith("[stub:")
+    assert loaded.get("không có", "nặng") is None
+
+
+def test_stub_bank_is_rejected_at_load(stub_index, tmp_path):
+    index_path, qa_chain, llm = stub_index
+    bank_file = str(tmp_path / "answer_bank.json")
+    build_answer_bank(qa_chain, EMOTIONS[:1], llm, bank_file, index_path)
+    assert len(load_answer_bank(bank_file, index_path)) == 0
+
+
+def test_stub_llm_never_writes_production_bank(stub_index):
+    index_path, qa_chain, llm = stub_index
+    assert default_answer_bank_file(llm) == STUB_ANSWER_BANK_FILE
+    assert default_answer_bank_file("groq-chat:llama3-8b-8192") == ANSWER_BANK_FILE
+    with pytest.raises(ValueError):
+        build_answer_bank(qa_chain, EMOTIONS, llm, ANSWER_BANK_FILE, index_path)
@@ -0,0 +1,26 @@
+import pytest
+
+from src.chat_api import ApiError, authenticate
+
+TOKENS = {"token-alice": "alice", "token-bob": "bob"}
+
+
+def test_token_identifies_user():
+    assert authenticate({"Authorization": "Bearer token-bob"}, TOKENS, None, None) == "bob"
+
+
+def test_username_in_request_is_not_an_identity():
+    with pytest.raises(ApiError) as error:
+        authenticate({"X-Authenticated-User": "alice"}, TOKENS, None, None)
+    assert error.value.status == 401
+    with pytest.raises(ApiError):
+        authenticate({"Authorization": "Bearer wrong"}, TOKENS, None, None)
+
+
+def test_proxy_header_requires_proxy_key():
+    headers = {"X-Authenticated-User": "alice"}
+    assert authenticate(headers, {}, "X-Authenticated-User", None) == "alice"
+    with pytest.raises(ApiError):
+        authenticate(headers, {}, "X-Authenticated-User", "proxy-key")
+    headers["Authorization"] = "Bearer proxy-key"
+    assert authenticate(headers, {}, "X-Authenticated-User", "proxy-key") == "alice"
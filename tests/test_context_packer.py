@@ -0,0 +1,49 @@
+# tests/test_context_packer.py
+"""ContextPacker: gộp chunk gối đầu cùng trang, bỏ đoạn gần trùng, giữ trong ngân sách token"""
+from langchain_core.documents import Document
+from src.context_packer import SEPARATOR, ContextPacker, TokenCounter
+
+# Không có file mô hình: đếm token theo byte UTF-8 (~4 byte/token), tất định
+COUNTER = TokenCounter(model_file="/không/có/mô-hình.gguf")
+
+PAGE_TEXT = ("Rối loạn trầm cảm chủ yếu có khí sắc buồn kéo dài ít nhất hai tuần. "
+             "Người bệnh mất hứng thú với hầu hết các hoạt động hằng ngày. "
+             "Có thể kèm mất ngủ, mệt mỏi và cảm giác vô dụng.")
+
+
+def doc(text, page=1, source="dsm.pdf"):
+    return Document(page_content=text, metadata={"source": source, "page": page})
+
+
+def test_merges_overlapping_and_contained_chunks_of_a_page():
+    packer = ContextPacker(token_budget=1000, counter=COUNTER)
+    documents = [doc(PAGE_TEXT[:120]), doc(PAGE_TEXT[90:]), doc(PAGE_TEXT[20:60]),
+                 doc("Rối loạn lo âu lan tỏa: lo lắng quá mức về nhiều việc.", page=2)]
+    packed, stats = packer.pack(documents)
+    assert [d.page_content for d in packed] == [PAGE_TEXT, documents[3].page_content]
+    assert packed[0].metadata["merged_chunks"] == 3 and packed[1].metadata["merged_chunks"] == 1
+    assert stats["chunks_in"] == 4 and stats["blocks_out"] == 2 and stats["saved_tokens"] > 0
+
+
+def test_drops_near_duplicates_from_other_pages():
+    packer = ContextPacker(token_budget=1000, dedup_similarity=0.8, counter=COUNTER)
+    packed, _ = packer.pack([doc(PAGE_TEXT, page=1), doc(PAGE_TEXT.replace("hai tuần", "2 tuần"), page=7),
+                             doc("Mất ngủ: khó bắt đầu hoặc duy trì giấc ngủ.", page=9)])
+    assert [d.metadata["page"] for d in packed] == [1, 9]
+
+
+def test_respects_token_budget_and_drops_short_tails():
+    long_text = "Đoạn dài về lo âu và căng thẳng kéo dài nhiều tháng. " * 8
+    short_text = "Hít thở sâu giúp bình tĩnh."
+    budget = COUNTER.count(long_text) + COUNTER.count(SEPARATOR) + COUNTER.count(short_text) + 5
+    packer = ContextPacker(token_budget=budget, min_block_tokens=32, counter=COUNTER)
+    # Khối thứ hai chỉ còn chỗ cho một mẩu đuôi < 32 token: bị bỏ, khối ngắn phía sau vẫn vừa trọn vẹn
+    packed, stats = packer.pack([doc(long_text, page=1), doc("Khác hẳn: " + long_text[::-1], page=2),
+                                 doc(short_text, page=3)])
+    assert [d.page_content for d in packed] == [long_text, short_text]
+    assert stats["packed_tokens"] == COUNTER.count(SEPARATOR.join(d.page_content for d in packed)) <= budget
+
+    # Ngân sách nhỏ: khối đầu bị cắt ở ranh giới câu nhưng vẫn đủ dài để giữ lại
+    packed, stats = ContextPacker(token_budget=60, min_block_tokens=8, counter=COUNTER).pack([doc(long_text)])
+    assert stats["packed_tokens"] <= 60 and packed[0].page_content.endswith(".")
+    assert long_text.startswith(packed[0].page_content)
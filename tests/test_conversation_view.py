@@ -0,0 +1,56 @@
+# tests/test_conversation_view.py
+"""Cửa sổ hội thoại: chỉ nạp N tin nhắn cuối, nạp thêm theo trang, không cắt trang cũ khi có tin nhắn mới"""
+import pytest
+from src import conversation_view
+from src.conversation_view import ConversationWindow
+from src.history_store import HistoryStore
+
+
+@pytest.fixture
+def conversation(tmp_path, monkeypatch):
+    store = HistoryStore(str(tmp_path / "history.sqlite"))
+    monkeypatch.setattr(conversation_view, "get_history_store", lambda: store)
+    conversation_id = store.create_conversation("an", "Hội thoại")
+
+    def append(content):
+        message = {"role": "user", "content": content, "time": "10:00"}
+        return dict(message, id=store.append_message(conversation_id, message))
+
+    ids = [append(f"tin nhắn {i}")["id"] for i in range(10)]
+    return conversation_id, ids, append
+
+
+def contents(window):
+    return [message["content"] for message in window.messages()]
+
+
+def test_window_slides_until_paged_back(conversation):
+    conversation_id, ids, append = conversation
+    window = ConversationWindow(window_size=3, page_size=4, cache_size=3)
+    window.open(conversation_id)
+    assert window.message_ids == ids[-3:] and window.has_older
+
+    # Chưa nạp trang cũ: cửa sổ trượt, giữ tối đa 3 tin nhắn
+    window.append(append("mới 1"))
+    assert contents(window) == ["tin nhắn 8", "tin nhắn 9", "mới 1"]
+
+
+def test_append_after_paging_back_keeps_older_pages(conversation):
+    conversation_id, ids, append = conversation
+    window = ConversationWindow(window_size=3, page_size=4, cache_size=3)
+    window.open(conversation_id)
+    window.load_older()
+    assert window.message_ids == ids[3:] and window.has_older and window.paged_back
+
+    new = [append(f"mới {i}") for i in range(3)]
+    for message in new:
+        window.append(message)
+    # Trang cũ vẫn còn; tin nhắn đã rời cache (cache_size=3) được đọc lại từ kho lịch sử
+    assert window.message_ids == ids[3:] + [message["id"] for message in new]
+    assert contents(window) == [f"tin nhắn {i}" for i in range(3, 10)] + ["mới 0", "mới 1", "mới 2"]
+
+    window.load_older()
+    assert window.message_ids[:3] == ids[:3] and not window.has_older
+    # Mở lại hội thoại: về cửa sổ N tin nhắn cuối
+    window.open(conversation_id)
+    assert contents(window) == ["mới 0", "mới 1", "mới 2"] and not window.paged_back
@@ -0,0 +1,48 @@
+# tests/test_docstore.py
+"""Docstore dạng cột: ghi/đọc lại đúng thứ tự vector, chuyển từ index.pkl của FAISS.save_local"""
+import os
+from langchain_community.vectorstores import FAISS
+from src.docstore import PICKLE_DOCSTORE_FILE, ColumnarDocstore, RowKeys, convert_pickle_docstore, write_docstore
+from src.embeddings import StubEmbeddings
+from src.index_factory import load_vector_store
+
+ROWS = [
+    ("a" * 64, "Rối loạn trầm cảm chủ yếu: khí sắc buồn kéo dài", {"source": "dsm.pdf", "page": 3}),
+    ("b" * 64, "", {"source": "dsm.pdf", "page": 4}),
+    ("c", "Rối loạn lo âu lan tỏa 😟", {"source": "khac.pdf", "page": 0}),
+]
+
+
+def test_round_trip(tmp_path):
+    index_path = str(tmp_path / "index")
+    assert write_docstore(index_path, ROWS) == 3
+    docstore = ColumnarDocstore(index_path)
+    assert len(docstore) == 3 and docstore.rows() == ROWS
+    document = docstore.search(2)
+    assert document.id == "c" and document.page_content == ROWS[2][1] and document.metadata == ROWS[2][2]
+    assert docstore.search("1").page_content == ""
+    assert "not found" in docstore.search(3) and "not found" in docstore.search("x")
+    assert list(RowKeys(3)) == [0, 1, 2] and RowKeys(3)[2] == 2
+
+    # Ghi lại với ít hàng hơn: các cột cũ được thay toàn bộ
+    write_docstore(index_path, ROWS[:1])
+    assert ColumnarDocstore(index_path).rows() == ROWS[:1]
+    write_docstore(index_path, [])
+    assert ColumnarDocstore(index_path).rows() == []
+
+
+def test_convert_pickle_docstore(tmp_path):
+    index_path = str(tmp_path / "index")
+    texts = [text or "trống" for _, text, _ in ROWS]
+    db = FAISS.from_texts(texts, StubEmbeddings(), metadatas=[metadata for _, _, metadata in ROWS])
+    db.save_local(index_path)
+
+    assert convert_pickle_docstore(index_path, remove_pickle=True) == 3
+    assert not os.path.exists(os.path.join(index_path, PICKLE_DOCSTORE_FILE))
+    docstore = ColumnarDocstore(index_path)
+    # Hàng i ứng với vector thứ i của index, giữ nguyên id của InMemoryDocstore
+    assert [(doc_id, text) for doc_id, text, _ in docstore.rows()] == [
+        (db.index_to_docstore_id[i], texts[i]) for i in range(3)]
+
+    loaded = load_vector_store(index_path, StubEmbeddings(), mmap=False)
+    assert [doc.page_content for doc in loaded.similarity_search(texts[2], k=1)] == [texts[2]]
@@ -0,0 +1,40 @@
+# tests/test_engine_registry.py
+"""Khóa registry gồm cả override: override khác nhau không nhận nhầm bộ tài nguyên đã nạp trước"""
+import pytest
+from src import engine_registry
+from src.models import using_llm_stub
+
+
+class FakeResources:
+    def __init__(self, index_path, model_file, api_key, **overrides):
+        self.index_path, self.model_file, self.overrides = index_path, model_file, overrides
+
+    def index_changed(self):
+        return False
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setattr(engine_registry, "SharedResources", FakeResources)
+    monkeypatch.setattr(engine_registry, "start_exporter", lambda: None)
+    engine_registry.clear_registry()
+    yield engine_registry.get_shared_resources
+    engine_registry.clear_registry()
+
+
+def test_overrides_are_part_of_the_key(registry, tmp_path):
+    index_path, model_file = str(tmp_path / "index"), str(tmp_path / "model.gguf")
+    stub = using_llm_stub()
+    default = registry(index_path, model_file)
+    with_stub = registry(index_path, model_file, llm=stub, answer_cache_file=str(tmp_path / "stub.sqlite"))
+    assert with_stub is not default and with_stub.overrides["llm"] is stub
+    assert registry(index_path, model_file) is default
+    assert registry(index_path, model_file, llm=stub, answer_cache_file=str(tmp_path / "stub.sqlite")) is with_stub
+    # Cùng file cache nhưng LLM khác: bộ tài nguyên khác
+    other = registry(index_path, model_file, llm=using_llm_stub(), answer_cache_file=str(tmp_path / "stub.sqlite"))
+    assert other is not with_stub
+
+
+def test_unknown_override_is_rejected(registry, tmp_path):
+    with pytest.raises(TypeError):
+        registry(str(tmp_path / "index"), str(tmp_path / "model.gguf"), retriever=object())
@@ -0,0 +1,91 @@
+# tests/test_history_store.py
+"""Kho lịch sử SQLite: phân trang tin nhắn, tìm kiếm FTS5 (bỏ dấu, tiền tố, đoạn trích, phân trang),
+nhập chat_history.json cũ chạy lại an toàn"""
+import json
+import pytest
+from src.history_store import HistoryStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return HistoryStore(str(tmp_path / "history.sqlite"))
+
+
+def add_messages(store, conversation_id, contents):
+    return [store.append_message(conversation_id, {"role": "user" if i % 2 == 0 else "assistant",
+                                                   "content": content, "time": f"10:00:{i:02d}"})
+            for i, content in enumerate(contents)]
+
+
+def test_fetch_messages_pages_backwards(store):
+    conversation_id = store.create_conversation("an", "Hội thoại")
+    ids = add_messages(store, conversation_id, [f"tin nhắn {i}" for i in range(7)])
+    latest = store.fetch_messages(conversation_id, limit=3)
+    assert [m["id"] for m in latest] == ids[4:]
+    older = store.fetch_messages(conversation_id, before_id=latest[0]["id"], limit=3)
+    assert [m["id"] for m in older] == ids[1:4]
+    assert [m["id"] for m in store.fetch_messages(conversation_id, before_id=older[0]["id"], limit=3)] == ids[:1]
+
+
+def test_import_json_is_idempotent(store, tmp_path):
+    json_file = tmp_path / "chat_history.json"
+    history = [
+        {"name": "Lo âu", "messages": [{"role": "user", "content": "Tôi hay lo lắng", "time": "09:00"},
+                                       {"role": "assistant", "content": 3, "time": "09:01"}]},
+        {"name": "Mất ngủ", "messages": [{"role": "user", "message": "Tôi khó ngủ", "time": "22:00"}]},
+        # Định dạng phẳng cũ không có tên hội thoại: bỏ qua
+        {"role": "user", "content": "tin nhắn lẻ"},
+    ]
+    json_file.write_text(json.dumps(history, ensure_ascii=False), encoding="utf-8")
+
+    assert store.import_json(str(json_file), "an") == 2
+    assert store.import_json(str(json_file), "an") == 0
+    conversations = store.list_conversations("an")
+    assert sorted(c["name"] for c in conversations) == ["Lo âu", "Mất ngủ"]
+    messages = {c["name"]: store.get_conversation(c["id"])["messages"] for c in conversations}
+    assert [m["content"] for m in messages["Lo âu"]] == ["Tôi hay lo lắng", "3"]
+    assert [m["content"] for m in messages["Mất ngủ"]] == ["Tôi khó ngủ"]
+
+    # Thêm một hội thoại mới vào file: chỉ hội thoại đó được nhập; người dùng khác nhập riêng
+    history.append({"name": "Vui", "messages": [{"role": "user", "content": "Hôm nay vui", "time": "08:00"}]})
+    json_file.write_text(json.dumps(history, ensure_ascii=False), encoding="utf-8")
+    assert store.import_json(str(json_file), "an") == 1
+    assert store.import_json(str(json_file), "binh") == 3
+    assert len(store.list_conversations("an")) == 3
+
+
+def test_search_folds_diacritics_and_matches_prefix(store):
+    anxiety = store.create_conversation("an", "Lo âu")
+    add_messages(store, anxiety, ["Dạo này tôi rất lo lắng về công việc", "Bạn thử hít thở sâu"])
+    sleep = store.create_conversation("an", "Mất ngủ")
+    add_messages(store, sleep, ["Tôi mất ngủ nhiều đêm liền"])
+
+    result = store.search("an", "lo lang")
+    assert result["total"] == 1 and result["results"][0]["id"] == anxiety
+    assert "**lo** **lắng**" in result["results"][0]["snippet"]
+    # Từ cuối khớp theo tiền tố khi đang gõ
+    assert [r["id"] for r in store.search("an", "mất ng")["results"]] == [sleep]
+    assert store.search("an", "trầm cảm")["total"] == 0 and store.search("an", "  ")["total"] == 0
+
+
+def test_search_is_scoped_to_user(store):
+    add_messages(store, store.create_conversation("an", "An"), ["tôi buồn"])
+    other = store.create_conversation("binh", "Bình")
+    add_messages(store, other, ["tôi cũng buồn"])
+    assert [r["id"] for r in store.search("binh", "buồn")["results"]] == [other]
+
+
+def test_search_pages_conversations_with_snippets(store):
+    ids = []
+    for i in range(5):
+        conversation_id = store.create_conversation("an", f"Hội thoại {i}")
+        add_messages(store, conversation_id, ["x " * 100 + "căng thẳng kéo dài" + " y" * 100])
+        ids.append(conversation_id)
+    # Hội thoại có hai tin nhắn khớp chỉ xuất hiện một lần trong kết quả
+    add_messages(store, ids[0], ["lại căng thẳng"])
+    pages = [store.search("an", "căng thẳng", page=page, page_size=2) for page in range(3)]
+    assert all(page["total"] == 5 for page in pages)
+    assert [len(page["results"]) for page in pages] == [2, 2, 1]
+    assert sorted(r["id"] for page in pages for r in page["results"]) == ids
+    snippet = next(r["snippet"] for page in pages for r in page["results"] if r["snippet"].startswith("…"))
+    assert "**căng** **thẳng**" in snippet and snippet.endswith("…")
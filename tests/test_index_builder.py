@@ -0,0 +1,105 @@
+# tests/test_index_builder.py
+"""Build index tăng dần theo manifest: thêm, sửa, xóa PDF và đổi metadata mà không đổi nội dung"""
+import os
+import pytest
+from pypdf import PdfReader, PdfWriter
+from src import index_builder, ingest_pipeline
+from src.docstore import ColumnarDocstore
+from src.embeddings import StubEmbeddings
+from src.global_settings import INGESTION_STORAGE_PATH
+from src.index_builder import load_manifest
+from src.ingest_pipeline import file_sha256
+
+SOURCE_PDF = os.path.join(INGESTION_STORAGE_PATH, "426204558-DSM-5-Cac-tieu-chuẩn-chẩn-đoan-pdf.pdf")
+
+
+class CountingEmbeddings(StubEmbeddings):
+    """Thay CachedEmbeddings: đếm số chunk thực sự được embed"""
+
+    embedded = 0
+
+    def __init__(self, model_file=None):
+        super().__init__()
+
+    def embed_documents(self, texts):
+        CountingEmbeddings.embedded += len(texts)
+        return super().embed_documents(texts)
+
+    def stats(self):
+        return {}
+
+
+def write_pdf(path, pages, title=None):
+    reader = PdfReader(SOURCE_PDF)
+    writer = PdfWriter()
+    for page_no in pages:
+        writer.add_page(reader.pages[page_no])
+    if title:
+        writer.add_metadata({"/Title": title})
+    with open(path, "wb") as f:
+        writer.write(f)
+
+
+@pytest.fixture
+def build(tmp_path, monkeypatch):
+    monkeypatch.setattr(index_builder, "CachedEmbeddings", CountingEmbeddings)
+    monkeypatch.setattr(ingest_pipeline, "PAGE_CACHE_PATH", str(tmp_path / "pages"))
+    source_path, index_path = tmp_path / "source", str(tmp_path / "index")
+    source_path.mkdir()
+
+    def run():
+        CountingEmbeddings.embedded = 0
+        db = index_builder.build_index(index_path, str(source_path), index_config={"type": "flat", "params": {}})
+        return db, load_manifest(index_path), CountingEmbeddings.embedded
+
+    return source_path, index_path, run
+
+
+def sources(index_path):
+    return sorted({os.path.basename(metadata["source"]) for _, _, metadata in ColumnarDocstore(index_path).rows()})
+
+
+def test_add_modify_remove(build):
+    source_path, index_path, run = build
+    write_pdf(source_path / "a.pdf", [10, 11, 12])
+    db, manifest, embedded = run()
+    a_chunks = manifest["files"]["a.pdf"]["chunks"]
+    assert embedded == len(a_chunks) == db.index.ntotal > 0
+
+    # Thêm file: chỉ file mới được embed
+    write_pdf(source_path / "b.pdf", [13])
+    db, manifest, embedded = run()
+    b_chunks = manifest["files"]["b.pdf"]["chunks"]
+    assert manifest["files"]["a.pdf"]["chunks"] == a_chunks
+    assert embedded == len(b_chunks) and db.index.ntotal == len(a_chunks) + len(b_chunks)
+
+    # Sửa file: trang 10, 11 giữ nguyên chunk, trang 12 bị thay bằng trang 14
+    write_pdf(source_path / "a.pdf", [10, 11, 14])
+    db, manifest, embedded = run()
+    new_a = manifest["files"]["a.pdf"]["chunks"]
+    kept = set(new_a) & set(a_chunks)
+    assert kept and embedded == len(new_a) - len(kept)
+    assert db.index.ntotal == len(new_a) + len(b_chunks)
+    # Hàng docstore khớp vị trí vector: chunk giữ lại, rồi b.pdf, rồi chunk mới
+    expected = [chunk_id for chunk_id in a_chunks if chunk_id in kept] + b_chunks + [
+        chunk_id for chunk_id in new_a if chunk_id not in kept]
+    assert [row[0] for row in ColumnarDocstore(index_path).rows()] == expected
+
+    # Xóa file: vector và hàng docstore của nó bị loại bỏ
+    os.remove(source_path / "b.pdf")
+    db, manifest, embedded = run()
+    assert embedded == 0 and list(manifest["files"]) == ["a.pdf"]
+    assert db.index.ntotal == len(new_a) and sources(index_path) == ["a.pdf"]
+
+
+def test_metadata_only_change_updates_manifest(build):
+    source_path, index_path, run = build
+    write_pdf(source_path / "a.pdf", [10], title="Bản 1")
+    _, manifest, _ = run()
+    old_sha = manifest["files"]["a.pdf"]["sha256"]
+
+    write_pdf(source_path / "a.pdf", [10], title="Bản 2")
+    db, manifest, embedded = run()
+    # Chunk không đổi nên không embed lại, nhưng manifest phải nhận sha256 mới, nếu không file bị parse lại mãi
+    assert embedded == 0 and db.index.ntotal == len(manifest["files"]["a.pdf"]["chunks"])
+    assert manifest["files"]["a.pdf"]["sha256"] == file_sha256(source_path / "a.pdf") != old_sha
@@ -0,0 +1,36 @@
+# tests/test_index_factory.py
+"""Phiên bản index đổi theo loại + tham số index ANN, không chỉ theo index flat"""
+from langchain_community.vectorstores import FAISS
+from src.common.utils import flat_index_version, index_version
+from src.docstore import convert_pickle_docstore
+from src.embeddings import StubEmbeddings
+from src.index_factory import build_ann_index, load_vector_store, make_index_config
+from src.retrieval_cache import RetrievalCache
+
+
+def make_flat_index(tmp_path):
+    index_path = str(tmp_path / "index")
+    texts = [f"Đoạn {i}: triệu chứng lo âu, mất ngủ và buồn bã số {i}" for i in range(64)]
+    FAISS.from_texts(texts, StubEmbeddings(), metadatas=[{"page": i} for i in range(64)]).save_local(index_path)
+    convert_pickle_docstore(index_path, remove_pickle=True)
+    return index_path
+
+
+def test_ann_type_and_params_change_the_version(tmp_path):
+    index_path = make_flat_index(tmp_path)
+    flat = index_version(index_path)
+    cache = RetrievalCache(index_path)
+    cache.put("lo âu", [("0", 0.1)], cost_ms=5.0)
+
+    build_ann_index(index_path, make_index_config("flat"))
+    assert index_version(index_path) == flat and cache.get("lo âu") == [("0", 0.1)]
+
+    build_ann_index(index_path, make_index_config("hnsw", M=16))
+    hnsw_16 = index_version(index_path)
+    assert hnsw_16 != flat and flat_index_version(index_path) == flat
+    assert cache.current_version() == hnsw_16 and cache.get("lo âu") is None
+
+    build_ann_index(index_path, make_index_config("hnsw", M=8))
+    assert index_version(index_path) not in (flat, hnsw_16)
+    # Index ANN vẫn được nhận là khớp với index flat (không rơi về flat)
+    assert load_vector_store(index_path, StubEmbeddings(), mmap=False).index.hnsw is not None
@@ -0,0 +1,46 @@
+# tests/test_intent_classifier.py
+"""Bộ phân loại ý định + cảm xúc: định tuyến câu nhập mới và mẫu gán nhãn, lưu/nạp lại .npz"""
+import pytest
+from src import intent_classifier
+from src.intent_classifier import NO_EMOTION, load_intent_classifier, read_labelled_messages
+
+# Câu không có trong dữ liệu gán nhãn: (câu, ý định, cảm xúc)
+MESSAGES = [
+    ("Triệu chứng của rối loạn lo âu là gì?", "direct_query", None),
+    ("cho tôi biết về rối loạn lưỡng cực", "direct_query", None),
+    ("Tôi cảm thấy rất buồn", "severity_question", "buồn"),
+    ("mình lo âu quá", "severity_question", "lo âu"),
+    ("hôm nay tôi thấy vui lắm", "severity_question", "vui"),
+    ("xin chào", "unclear", None),
+]
+
+
+@pytest.fixture(scope="module")
+def model_file(tmp_path_factory):
+    # Huấn luyện một lần cho cả module (vài giây), không đụng tới data/cache
+    model_file = str(tmp_path_factory.mktemp("intent") / "intent_model.npz")
+    load_intent_classifier(model_file)
+    return model_file
+
+
+def test_routes_new_messages(model_file):
+    classifier = load_intent_classifier(model_file)
+    predictions = classifier.predict_batch([text for text, _, _ in MESSAGES])
+    assert [(p.intent, p.emotion) for p in predictions] == [(intent, emotion) for _, intent, emotion in MESSAGES]
+    assert classifier.predict(MESSAGES[2][0]).intent == "severity_question"
+
+
+def test_labelled_messages(model_file):
+    labelled = read_labelled_messages()
+    predictions = load_intent_classifier(model_file).predict_batch([text for text, _, _ in labelled])
+    wrong = [(text, p.intent, p.emotion) for p, (text, intent, emotion) in zip(predictions, labelled)
+             if p.intent != intent or (p.emotion or NO_EMOTION) != emotion]
+    assert labelled and not wrong
+
+
+def test_saved_model_is_reused(model_file, monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("không được huấn luyện lại khi dữ liệu nguồn không đổi")
+
+    monkeypatch.setattr(intent_classifier, "train_intent_classifier", fail)
+    assert load_intent_classifier(model_file).predict("mình lo âu quá").emotion == "lo âu"
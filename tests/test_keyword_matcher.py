@@ -0,0 +1,30 @@
+# tests/test_keyword_matcher.py
+"""Cache automaton từ khóa: nhiều tiến trình/luồng cùng dựng lại không đè file tạm của nhau"""
+import json
+import os
+import threading
+from src.keyword_matcher import load_keyword_matcher
+
+
+def test_concurrent_rebuilds_write_a_complete_cache(tmp_path):
+    cache_file = str(tmp_path / "cache" / "keyword_automaton.json")
+    errors = []
+    start = threading.Barrier(8)
+
+    def build():
+        start.wait()
+        try:
+            load_keyword_matcher(cache_file=cache_file)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=build) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert os.listdir(tmp_path / "cache") == ["keyword_automaton.json"]
+    with open(cache_file, "r", encoding="utf-8") as f:
+        assert json.load(f)["signature"]
+    assert load_keyword_matcher(cache_file=cache_file).match("tôi buồn quá")
@@ -0,0 +1,146 @@
+# tests/test_llm_client.py
+"""ScheduledChatGroq qua server Groq giả lập (src/fake_groq_server.py): invoke, stream, ainvoke,
+thử lại khi 429 theo retry-after, giới hạn số lần thử, lỗi giữa stream, thứ tự ưu tiên và trả chỗ khi task bị hủy"""
+import asyncio
+import threading
+import time
+import pytest
+from src import fake_groq_server, llm_client
+from src.llm_client import PRIORITY_BATCH, LLMClientPool, create_chat_groq, llm_priority
+
+ANSWER_PREFIX = "Trả lời giả lập"
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = LLMClientPool(requests_per_minute=6000, max_concurrency=1)
+    monkeypatch.setattr(llm_client, "_POOL", pool)
+    yield pool
+    pool.http_client.close()
+
+
+def start_server(**options):
+    server, state = fake_groq_server.serve(port=0, **options)
+    return server, state, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+@pytest.fixture
+def groq(pool):
+    servers = []
+
+    def make(**options):
+        server, state, url = start_server(**options)
+        servers.append(server)
+        return create_chat_groq(api_key="test", model_name="fake", base_url=url), state
+
+    yield make
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "hết thời gian chờ"
+        time.sleep(0.01)
+
+
+def test_invoke(groq, pool):
+    llm, state = groq(latency_seconds=0)
+    assert llm.invoke("xin chào").content.startswith(ANSWER_PREFIX)
+    assert state.total == 1 and pool.counters["requests"] == 1 and pool.scheduler.active == 0
+
+
+def test_stream(groq, pool):
+    llm, state = groq(latency_seconds=0)
+    chunks = [chunk.content for chunk in llm.stream("xin chào")]
+    assert len(chunks) > 1 and "".join(chunks).startswith(ANSWER_PREFIX)
+    assert pool.scheduler.active == 0
+
+
+def test_ainvoke(groq, pool):
+    llm, state = groq(latency_seconds=0)
+    assert asyncio.run(llm.ainvoke("xin chào")).content.startswith(ANSWER_PREFIX)
+    assert state.total == 1 and pool.scheduler.active == 0
+
+
+def test_rate_limited_request_is_retried_after_retry_after(groq, pool):
+    llm, state = groq(latency_seconds=0, fail_first=1)
+    start = time.monotonic()
+    assert llm.invoke("xin chào").content.startswith(ANSWER_PREFIX)
+    # Server trả 429 kèm retry-after: 1 -> lần thử lại chờ ít nhất 1 giây
+    assert time.monotonic() - start >= 1.0
+    assert state.total == 2 and pool.counters["retries"] == 1 and pool.counters["failures"] == 0
+
+
+def test_retries_are_capped(groq, pool):
+    llm, state = groq(latency_seconds=0, fail_first=100)
+    llm.retries = 1
+    with pytest.raises(RuntimeError, match="sau 2 lần thử"):
+        llm.invoke("xin chào")
+    assert state.total == 2 and pool.counters["failures"] == 1 and pool.scheduler.active == 0
+
+
+def test_stream_error_after_first_token_is_not_retried(groq, pool):
+    llm, state = groq(latency_seconds=0, stream_error_after=2)
+    chunks = []
+    with pytest.raises(RuntimeError, match="giữa chừng"):
+        for chunk in llm.stream("xin chào"):
+            chunks.append(chunk.content)
+    assert chunks and state.total == 1
+    assert pool.counters["failures"] == 1 and pool.counters["retries"] == 0 and pool.scheduler.active == 0
+
+
+def test_counters_are_atomic_across_threads(pool):
+    threads = [threading.Thread(target=lambda: [pool.record("requests") for _ in range(2000)]) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert pool.counters_snapshot()["requests"] == 16000
+
+
+def test_interactive_calls_overtake_queued_batch_calls(groq, pool):
+    llm, state = groq(latency_seconds=0)
+    # Giữ chỗ duy nhất để mọi lời gọi phải xếp hàng, batch vào hàng trước
+    pool.scheduler.acquire()
+
+    def call(prompt, priority):
+        with llm_priority(priority):
+            llm.invoke(prompt)
+
+    threads = []
+    for prompt, priority in [("batch 1", PRIORITY_BATCH), ("batch 2", PRIORITY_BATCH),
+                             ("tương tác 1", llm_client.PRIORITY_INTERACTIVE),
+                             ("tương tác 2", llm_client.PRIORITY_INTERACTIVE)]:
+        thread = threading.Thread(target=call, args=(prompt, priority))
+        thread.start()
+        threads.append(thread)
+        wait_until(lambda: pool.scheduler.queued() == len(threads))
+    pool.scheduler.release()
+    for thread in threads:
+        thread.join(10)
+    assert state.prompts == ["tương tác 1", "tương tác 2", "batch 1", "batch 2"]
+
+
+def test_cancelled_ainvoke_returns_its_queue_slot(groq, pool):
+    llm, state = groq(latency_seconds=0)
+    pool.scheduler.acquire()
+
+    async def cancel_while_queued():
+        task = asyncio.create_task(llm.ainvoke("xin chào"))
+        while pool.scheduler.queued() == 0:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # Chỗ được giải phóng sau khi task đã bị hủy: luồng chờ lấy được rồi phải trả lại ngay
+        pool.scheduler.release()
+        while pool.scheduler.queued():
+            await asyncio.sleep(0.01)
+
+    asyncio.run(cancel_while_queued())
+    wait_until(lambda: pool.scheduler.queued() == 0 and pool.scheduler.active == 0)
+    assert state.total == 0
+    assert llm.invoke("xin chào").content.startswith(ANSWER_PREFIX)
@@ -0,0 +1,21 @@
+from src.engine_registry import create_qa_prompt
+from src.local_llm import LocalLLM, chat_prefixes
+from src.query_prep import render_system_prompt
+
+
+def test_prompt_has_no_system_turn():
+    # Groq nhận chuỗi prompt thành một lượt user duy nhất; backend cục bộ phải gửi đúng như vậy
+    prompt = LocalLLM().format_prompt("Xin chào")
+    assert "<|start_header_id|>system" not in prompt
+    assert prompt.startswith("<|begin_of_text|><|start_header_id|>user<|end_header_id|>\n\nXin chào<|eot_id|>")
+
+
+def test_pinned_prefixes_cover_sent_prompts():
+    llm, qa_prompt = LocalLLM(), create_qa_prompt()
+    qa_prefix, chat_prefix = chat_prefixes(llm.system_prompt)
+    # Prompt mức độ ({system} rỗng) và prompt chat ({system} theo người dùng)
+    severity = llm.format_prompt(qa_prompt.format(context="ngữ cảnh", question="câu hỏi"))
+    chat = llm.format_prompt(qa_prompt.format(system=render_system_prompt({"name": "An"}), context="ngữ cảnh",
+                                              question="câu hỏi"))
+    assert severity.startswith(qa_prefix) and not severity.startswith(chat_prefix)
+    assert chat.startswith(chat_prefix)
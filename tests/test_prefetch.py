@@ -0,0 +1,67 @@
+# tests/test_prefetch.py
+"""SeverityPrefetch: lấy kết quả đã chạy trước, hủy/bỏ các job còn lại, gộp job có cùng câu truy vấn"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from src.answer_bank import SEVERITIES, severity_query, severity_scope
+from src.prefetch import SeverityPrefetch
+
+
+@pytest.fixture
+def executor():
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        yield executor
+
+
+def job(emotion, severity):
+    return f"{emotion}/{severity}", True
+
+
+def test_take_returns_prefetched_answer(executor):
+    prefetch = SeverityPrefetch(executor)
+    prefetch.start("buồn", SEVERITIES, job)
+    assert prefetch.take("buồn", "nặng") == "buồn/nặng"
+    # Các job còn lại bị hủy/bỏ: lần lấy sau là trượt
+    assert prefetch.futures == {} and prefetch.take("buồn", "nhẹ") is None
+
+
+def test_take_misses_for_other_emotion(executor):
+    prefetch = SeverityPrefetch(executor)
+    prefetch.start("buồn", SEVERITIES, job)
+    assert prefetch.take("lo âu", "nặng") is None
+
+
+def test_discard_cancels_queued_jobs(executor):
+    running, release = threading.Event(), threading.Event()
+
+    def blocking_job(emotion, severity):
+        running.set()
+        release.wait(5)
+        return severity, True
+
+    prefetch = SeverityPrefetch(executor)
+    prefetch.start("buồn", SEVERITIES, blocking_job)
+    futures = list(prefetch.futures.values())
+    assert running.wait(5)
+    prefetch.discard()
+    release.set()
+    # Một luồng: job đầu đang chạy vẫn hoàn tất, các job còn xếp hàng bị hủy
+    assert sum(future.cancelled() for future in futures) == len(SEVERITIES) - 1
+    assert prefetch.take("buồn", SEVERITIES[0]) is None
+
+
+def test_jobs_with_the_same_query_are_shared(executor):
+    calls = []
+
+    def counted_job(emotion, severity):
+        calls.append(severity)
+        return severity_query(emotion, severity), True
+
+    prefetch = SeverityPrefetch(executor)
+    prefetch.start("vui", SEVERITIES, counted_job, key=lambda severity: severity_query("vui", severity))
+    assert len(set(prefetch.futures.values())) == 1
+    assert prefetch.take("vui", "nặng") == severity_query("vui", "nặng")
+    assert len(calls) == 1
+    # Cùng phạm vi cache cho mọi mức độ của cảm xúc tích cực, riêng từng mức độ với cảm xúc tiêu cực
+    assert len({severity_scope("vui", severity) for severity in SEVERITIES}) == 1
+    assert len({severity_scope("buồn", severity) for severity in SEVERITIES}) == len(SEVERITIES)
@@ -0,0 +1,56 @@
+# tests/test_retrieval_cache.py
+"""Cache truy hồi: khóa chuẩn hóa, embedding trên câu gốc, xóa khi index đổi phiên bản"""
+import pytest
+from langchain_community.vectorstores import FAISS
+from src.context_packer import ContextPacker, PackedRetriever
+from src.docstore import convert_pickle_docstore
+from src.embeddings import StubEmbeddings
+from src.index_factory import load_vector_store
+from src.retrieval_cache import RetrievalCache, normalize_retrieval_query
+
+TEXTS = ["Rối loạn trầm cảm chủ yếu: khí sắc buồn kéo dài", "Rối loạn lo âu lan tỏa: lo lắng quá mức",
+         "Mất ngủ: khó bắt đầu hoặc duy trì giấc ngủ"]
+
+
+class RecordingEmbeddings(StubEmbeddings):
+    def __init__(self):
+        super().__init__()
+        self.queries = []
+
+    def embed_query(self, text):
+        self.queries.append(text)
+        return super().embed_query(text)
+
+
+def save_index(index_path, texts):
+    FAISS.from_texts(texts, StubEmbeddings(), metadatas=[{"page": i} for i in range(len(texts))]).save_local(index_path)
+    convert_pickle_docstore(index_path, remove_pickle=True)
+
+
+@pytest.fixture
+def retriever(tmp_path):
+    index_path = str(tmp_path / "index")
+    save_index(index_path, TEXTS)
+    embeddings = RecordingEmbeddings()
+    cache = RetrievalCache(index_path)
+    db = load_vector_store(index_path, embeddings, mmap=False)
+    return PackedRetriever(vectorstore=db, packer=ContextPacker(), cache=cache, k=2), embeddings, cache, index_path
+
+
+def test_embeds_original_query_and_caches_by_normalized_key(retriever):
+    retriever, embeddings, cache, _ = retriever
+    hits = retriever.search("  Lo Âu   quá mức? ")
+    assert embeddings.queries == ["  Lo Âu   quá mức? "]
+    assert normalize_retrieval_query("  Lo Âu   quá mức? ") == "lo âu quá mức?"
+    # Cùng khóa chuẩn hóa: trúng cache, không embed lại
+    assert retriever.search("lo âu QUÁ mức?") == hits
+    assert len(embeddings.queries) == 1 and cache.stats()["hits"] == 1
+
+
+def test_rebuilt_index_invalidates_cache(retriever):
+    retriever, embeddings, cache, index_path = retriever
+    retriever.search("mất ngủ")
+    version = cache.version
+    save_index(index_path, TEXTS + ["Rối loạn hoảng sợ: cơn hoảng sợ tái diễn"])
+    assert cache.get((normalize_retrieval_query("mất ngủ"), 2)) is None
+    assert cache.version != version and cache.stats()["invalidations"] == 1